@@ -66,6 +66,14 @@ module "segmenter_cloud_run" {
   memory = "32Gi"
   cpu = "8"
   startup_cpu_boost = false
+  # instanceが推論中か待ち行列に入れられる数までしかリクエストを送らない
+  # それを超えるリクエストはinstance内で429にせず、Cloud Runが他のinstanceに振り分ける
+  concurrency = var.segmenter_max_concurrency + var.model_max_queue_size
+  env_vars = {
+    SEGMENTER_MAX_CONCURRENCY = tostring(var.segmenter_max_concurrency)
+    DETECTOR_MAX_CONCURRENCY = tostring(var.detector_max_concurrency)
+    MODEL_MAX_QUEUE_SIZE = tostring(var.model_max_queue_size)
+  }
   service_account_email = module.cloud_run_service_account.email
   description = "segmenter APIのCloud Runサービス"
 }
@@ -36,3 +36,21 @@ variable "branch_regex" {
   type        = string
   default     = "^main$"
 }
+
+variable "segmenter_max_concurrency" {
+  description = "segmenterのモデルごとに同時に推論するリクエスト数"
+  type        = number
+  default     = 1
+}
+
+variable "detector_max_concurrency" {
+  description = "detectorのモデルごとに同時に推論するリクエスト数(micro-batchingのbatchの大きさ以上)"
+  type        = number
+  default     = 8
+}
+
+variable "model_max_queue_size" {
+  description = "モデルごとに推論の空きを待てるリクエスト数。超えたリクエストは429になる"
+  type        = number
+  default     = 16
+}
@@ -0,0 +1,75 @@
+"""gunicornのmasterでモデルを読み込み、forkしたworkerでweightを共有する
+gunicorn.conf.pyのhookから呼び出される
+"""
+
+import gc
+import os
+import random
+
+import numpy as np
+import torch
+
+from segmenter_api.di import resolve
+from segmenter_api.domain.factory.detector_factory import (
+    DetectorFactoryInterface,
+    DetectorType,
+)
+from segmenter_api.domain.factory.segmenter_factory import (
+    SegmenterFactoryInterface,
+    SegmenterType,
+)
+from segmenter_api.infra.service.runtime.torch_runtime import TorchRuntime
+from segmenter_api.settings import get_settings
+from segmenter_api.utils.logger import get_logger
+from segmenter_api.utils.metrics import get_metrics
+from segmenter_api.utils.time import stop_watch
+
+logger = get_logger(__name__)
+
+
+@stop_watch
+def preload_models() -> None:
+    """fork前にmasterでモデルを読み込み、weightを共有メモリに移す
+    CUDAはfork後の子プロセスで使えないため、CUDAの場合は読み込まずに各workerに任せる
+    """
+    model_names = get_settings().preload_models
+    runtime = resolve(TorchRuntime)
+    if runtime.is_cuda:
+        logger.warning("CUDAではpreloadできないため、各workerでモデルを読み込みます")
+        return
+    detector_types = {detector_type.value for detector_type in DetectorType}
+    segmenter_types = {segmenter_type.value for segmenter_type in SegmenterType}
+    for model_name in model_names:
+        if model_name in detector_types:
+            resolve(DetectorFactoryInterface).create(DetectorType(model_name))
+        elif model_name in segmenter_types:
+            resolve(SegmenterFactoryInterface).create(SegmenterType(model_name))
+        else:
+            error_msg = (
+                f"preload_modelsに未知のモデル: {model_name}が指定されました。"
+                f"{sorted(detector_types | segmenter_types)}から指定してください"
+            )
+            raise ValueError(error_msg)
+    shared_bytes = runtime.share_memory()
+    # 読み込み時のobjectをGCの対象から外し、worker内のGCでpageがcopyされないようにする
+    gc.collect()
+    gc.freeze()
+    logger.info(
+        f"{model_names}を読み込みました。"
+        f"共有メモリに移したweight: {shared_bytes / 1024**2:.0f}MiB"
+    )
+
+
+def reinitialize_worker(num_workers: int) -> None:
+    """fork後のworkerで、masterから引き継いだ状態を初期化する
+    thread poolとGCSのclientは各moduleがos.register_at_forkで作り直す
+    """
+    # 全workerが同じ乱数列にならないようにする
+    seed = int.from_bytes(os.urandom(4), "little")
+    random.seed(seed)
+    np.random.seed(seed)  # noqa: NPY002
+    torch.manual_seed(seed)
+    # worker間でCPUのcoreを取り合わないよう、intra-opのthread数を分ける
+    torch.set_num_threads(max(1, (os.cpu_count() or 1) // num_workers))
+    # masterで記録したmetricsをworkerの値に含めない
+    get_metrics().reset()
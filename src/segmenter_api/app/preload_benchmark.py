@@ -0,0 +1,129 @@
+"""gunicornのworker数ごとに、全プロセスのメモリ使用量とthroughputを測る
+uv run python src/segmenter_api/app/preload_benchmark.py \
+--max-workers 4 \
+--image-path tests/data/abema_water.png \
+--text "plastic bottle"
+
+PRELOAD_MODELS='["florence2_base", "sam2"]'を指定して実行するとpreloadした場合を測る
+RSSは共有しているpageをプロセスごとに重複して数え、PSSは共有しているプロセス数で按分する
+"""
+
+import os
+import subprocess
+import sys
+import time
+from argparse import ArgumentParser, Namespace
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any
+
+import requests
+from PIL import Image
+
+from segmenter_api.utils.image import pil2base64
+
+GUNICORN_CONF = Path(__file__).parents[1] / "gunicorn.conf.py"
+
+
+def start_server(num_workers: int, port: int) -> subprocess.Popen[bytes]:
+    env = os.environ | {"GUNICORN_WORKERS": str(num_workers), "PORT": str(port)}
+    return subprocess.Popen(  # noqa: S603
+        [sys.executable, "-m", "gunicorn", "-c", str(GUNICORN_CONF)], env=env
+    )
+
+
+def wait_until_ready(url: str, timeout: float) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if requests.get(f"{url}/status", timeout=1).ok:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(1)
+    error_msg = f"{timeout}秒以内にserverが起動しませんでした"
+    raise TimeoutError(error_msg)
+
+
+def run_load(
+    url: str, payload: dict[str, Any], concurrency: int, duration: float
+) -> float:
+    """duration秒の間concurrency並列でリクエストを送り、成功したリクエスト数/秒を返す"""
+    deadline = time.monotonic() + duration
+
+    def send_until_deadline() -> int:
+        num_succeeded = 0
+        with requests.Session() as session:
+            while time.monotonic() < deadline:
+                response = session.post(f"{url}/text2segment", json=payload)
+                num_succeeded += response.ok
+        return num_succeeded
+
+    started_at = time.monotonic()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = [pool.submit(send_until_deadline) for _ in range(concurrency)]
+        num_succeeded = sum(future.result() for future in futures)
+    return num_succeeded / (time.monotonic() - started_at)
+
+
+def process_tree(pid: int) -> list[int]:
+    children = Path(f"/proc/{pid}/task/{pid}/children").read_text().split()
+    return [pid] + [
+        descendant for child in children for descendant in process_tree(int(child))
+    ]
+
+
+def memory_usage(pid: int) -> tuple[float, float]:
+    """masterとworkerのRSSとPSSの合計(MiB)。Linuxの/procから読む"""
+    rss_kib = pss_kib = 0
+    for process_id in process_tree(pid):
+        for line in Path(f"/proc/{process_id}/smaps_rollup").read_text().splitlines():
+            key, *values = line.split()
+            if key == "Rss:":
+                rss_kib += int(values[0])
+            elif key == "Pss:":
+                pss_kib += int(values[0])
+    return rss_kib / 1024, pss_kib / 1024
+
+
+def main(args: Namespace) -> None:
+    payload = {
+        "image": pil2base64(Image.open(args.image_path)),
+        "texts": [args.text],
+        "detector_type": args.detector_type,
+        "segmenter_type": args.segmenter_type,
+        "mask_format": "rle",
+    }
+    url = f"http://127.0.0.1:{args.port}"
+    print(f"preload_models: {os.getenv('PRELOAD_MODELS', '[]')}")
+    print("workers\trss_mib\tpss_mib\treq_per_sec")
+    for num_workers in range(1, args.max_workers + 1):
+        server = start_server(num_workers, args.port)
+        try:
+            wait_until_ready(url, timeout=args.startup_timeout)
+            # preloadしない場合、各workerは最初のリクエストでモデルを読み込む
+            run_load(url, payload, num_workers * 2, duration=args.warmup_seconds)
+            requests_per_second = run_load(
+                url, payload, args.concurrency, duration=args.duration
+            )
+            rss, pss = memory_usage(server.pid)
+            print(f"{num_workers}\t{rss:.0f}\t{pss:.0f}\t{requests_per_second:.2f}")
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--max-workers", type=int, default=4)
+    parser.add_argument("--image-path", type=Path, required=True)
+    parser.add_argument("--text", type=str, required=True)
+    parser.add_argument("--detector-type", type=str, default="florence2_base")
+    parser.add_argument("--segmenter-type", type=str, default="sam2")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=60)
+    parser.add_argument("--warmup-seconds", type=float, default=30)
+    parser.add_argument("--startup-timeout", type=float, default=600)
+    args = parser.parse_args()
+    main(args)
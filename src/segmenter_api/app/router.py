@@ -1,13 +1,28 @@
 from functools import partial
 
 from fastapi import APIRouter, Depends
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import Request
 
+from segmenter_api.app.upload import read_upload
 from segmenter_api.di import resolve
+from segmenter_api.domain.model.foreground_segment import ForegroundSegmentParams
+from segmenter_api.domain.model.job import JobCreateRequest, JobState
+from segmenter_api.domain.model.text2bbox import Text2BboxParams
+from segmenter_api.domain.model.text2segment import Text2SegmentParams
 from segmenter_api.usecase.ui.foreground_segment import (
+    ForegroundSegmentBatchRequest,
+    ForegroundSegmentBatchResponse,
     ForegroundSegmentRequest,
     ForegroundSegmentResponse,
     ForegroundSegmentUserInterface,
 )
+from segmenter_api.usecase.ui.job import JobUserInterface
+from segmenter_api.usecase.ui.prompt2segment import (
+    Prompt2SegmentRequest,
+    Prompt2SegmentResponse,
+    Prompt2SegmentUserInterface,
+)
 from segmenter_api.usecase.ui.text2bbox import (
     Text2BboxRequest,
     Text2BboxResponse,
@@ -44,6 +59,16 @@ def foreground_segment(
     return foreground_segment_user_interface.foreground_segment(request)
 
 
+@router.post("/foreground_segment_batch", response_model=ForegroundSegmentBatchResponse)
+def foreground_segment_batch(
+    request: ForegroundSegmentBatchRequest,
+    foreground_segment_user_interface: ForegroundSegmentUserInterface = Depends(
+        partial(resolve, ForegroundSegmentUserInterface)
+    ),
+) -> ForegroundSegmentBatchResponse:
+    return foreground_segment_user_interface.foreground_segment_batch(request)
+
+
 @router.post("/text2bbox", response_model=Text2BboxResponse)
 def text2bbox(
     request: Text2BboxRequest,
@@ -52,3 +77,104 @@ def text2bbox(
     ),
 ) -> Text2BboxResponse:
     return text2bbox_user_interface.text2bbox(request)
+
+
+@router.post("/prompt2segment", response_model=Prompt2SegmentResponse)
+def prompt2segment(
+    request: Prompt2SegmentRequest,
+    prompt2segment_user_interface: Prompt2SegmentUserInterface = Depends(
+        partial(resolve, Prompt2SegmentUserInterface)
+    ),
+) -> Prompt2SegmentResponse:
+    return prompt2segment_user_interface.prompt2segment(request)
+
+
+@router.post("/jobs", response_model=JobState)
+def create_job(
+    request: JobCreateRequest,
+    job_user_interface: JobUserInterface = Depends(partial(resolve, JobUserInterface)),
+) -> JobState:
+    """manifestの画像をbackgroundでtext2segmentするjobを作成する"""
+    return job_user_interface.create_job(request)
+
+
+@router.get("/jobs/{job_id}", response_model=JobState)
+def get_job(
+    job_id: str,
+    job_user_interface: JobUserInterface = Depends(partial(resolve, JobUserInterface)),
+) -> JobState:
+    return job_user_interface.get_job(job_id)
+
+
+# 画像をbase64ではなくbinaryで受け取るエンドポイント
+# multipart/form-dataかapplication/octet-streamで画像を送る(詳細はapp/upload.py)
+UPLOAD_OPENAPI_EXTRA = {
+    "requestBody": {
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "properties": {"image": {"type": "string", "format": "binary"}},
+                    "required": ["image"],
+                }
+            },
+            "application/octet-stream": {
+                "schema": {"type": "string", "format": "binary"}
+            },
+        },
+        "required": True,
+    }
+}
+
+
+@router.post(
+    "/text2segment/upload",
+    response_model=Text2SegmentResponse,
+    openapi_extra=UPLOAD_OPENAPI_EXTRA,
+)
+async def text2segment_upload(
+    request: Request,
+    text2segment_user_interface: Text2SegmentUserInterface = Depends(
+        partial(resolve, Text2SegmentUserInterface)
+    ),
+) -> Text2SegmentResponse:
+    params, image_bytes = await read_upload(request, Text2SegmentParams)
+    return await run_in_threadpool(
+        text2segment_user_interface.text2segment_upload, params, image_bytes
+    )
+
+
+@router.post(
+    "/foreground_segment/upload",
+    response_model=ForegroundSegmentResponse,
+    openapi_extra=UPLOAD_OPENAPI_EXTRA,
+)
+async def foreground_segment_upload(
+    request: Request,
+    foreground_segment_user_interface: ForegroundSegmentUserInterface = Depends(
+        partial(resolve, ForegroundSegmentUserInterface)
+    ),
+) -> ForegroundSegmentResponse:
+    params, image_bytes = await read_upload(request, ForegroundSegmentParams)
+    return await run_in_threadpool(
+        foreground_segment_user_interface.foreground_segment_upload,
+        params,
+        image_bytes,
+    )
+
+
+@router.post(
+    "/text2bbox/upload",
+    response_model=Text2BboxResponse,
+    openapi_extra=UPLOAD_OPENAPI_EXTRA,
+)
+async def text2bbox_upload(
+    request: Request,
+    text2bbox_user_interface: Text2BboxUserInterface = Depends(
+        partial(resolve, Text2BboxUserInterface)
+    ),
+) -> Text2BboxResponse:
+    params, image_bytes = await read_upload(request, Text2BboxParams)
+    return await run_in_threadpool(
+        text2bbox_user_interface.text2bbox_upload, params, image_bytes
+    )
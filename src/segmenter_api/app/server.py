@@ -3,7 +3,8 @@ from starlette.middleware.cors import CORSMiddleware
 from starlette.requests import Request
 from starlette.responses import JSONResponse
 
-from segmenter_api.domain.model.errors import BaseApiError
+from segmenter_api.domain.model.errors import BaseApiError, TooManyRequestsError
+from segmenter_api.utils.metrics import get_metrics
 
 
 def create_api() -> FastAPI:
@@ -29,11 +30,22 @@ def setup_router(app: FastAPI) -> None:
     async def status() -> JSONResponse:
         return JSONResponse(content={"status": "successful"}, status_code=200)
 
+    @app.get("/metrics")
+    async def metrics() -> JSONResponse:
+        return JSONResponse(content=get_metrics().snapshot(), status_code=200)
+
 
 def setup_exception_handler(app: FastAPI) -> None:
     @app.exception_handler(BaseApiError)
     async def api_error_handler(request: Request, err: BaseApiError) -> JSONResponse:
-        return JSONResponse(status_code=err.status_code, content={"message": err.msg})
+        headers = (
+            {"Retry-After": str(err.retry_after)}
+            if isinstance(err, TooManyRequestsError)
+            else None
+        )
+        return JSONResponse(
+            status_code=err.status_code, content={"message": err.msg}, headers=headers
+        )
 
     @app.exception_handler(Exception)
     async def global_exception_handler(
@@ -0,0 +1,76 @@
+"""画像をbase64ではなくbinaryで受け取るエンドポイントのリクエストの読み込み
+- multipart/form-data: imageフィールドに画像ファイル、その他のパラメータはform field
+- application/octet-stream(またはimage/*): bodyが画像、
+  その他のパラメータはquery parameter
+"""
+
+from collections.abc import Iterable
+from typing import TypeVar, get_args, get_origin
+
+from fastapi.exceptions import RequestValidationError
+from pydantic import BaseModel, ValidationError
+from starlette.datastructures import UploadFile
+from starlette.requests import Request
+
+from segmenter_api.domain.model.errors import BadRequestError, NotSupportedError
+
+P = TypeVar("P", bound=BaseModel)
+
+IMAGE_FIELD = "image"
+
+
+async def read_upload(request: Request, params_model: type[P]) -> tuple[P, bytes]:
+    """リクエストから画像のbytesとパラメータを読み込む"""
+    content_type = request.headers.get("content-type", "")
+    fields: Iterable[tuple[str, object]]
+    if content_type.startswith("multipart/form-data"):
+        form = await request.form()
+        image = form.get(IMAGE_FIELD)
+        if not isinstance(image, UploadFile):
+            error_msg = f"{IMAGE_FIELD}フィールドに画像ファイルを指定してください"
+            raise BadRequestError(error_msg)
+        image_bytes = await image.read()
+        fields = [
+            (key, value) for key, value in form.multi_items() if key != IMAGE_FIELD
+        ]
+    elif content_type.startswith(("application/octet-stream", "image/")):
+        image_bytes = await request.body()
+        fields = request.query_params.multi_items()
+    else:
+        error_msg = (
+            "Content-Typeはmultipart/form-dataかapplication/octet-streamを"
+            f"指定してください: {content_type}"
+        )
+        raise NotSupportedError(error_msg)
+    if not image_bytes:
+        error_msg = "画像が空です"
+        raise BadRequestError(error_msg)
+    try:
+        params = params_model.model_validate(collect_fields(fields, params_model))
+    except ValidationError as e:
+        raise RequestValidationError(e.errors(include_url=False)) from e
+    return params, image_bytes
+
+
+def collect_fields(
+    fields: Iterable[tuple[str, object]], params_model: type[BaseModel]
+) -> dict[str, object]:
+    """form field/query parameterをparams_modelに渡せる形にする
+    listのフィールドは同じkeyを繰り返して指定する(例: ?texts=cat&texts=dog)
+    """
+    values: dict[str, list[object]] = {}
+    for key, value in fields:
+        values.setdefault(key, []).append(value)
+    collected: dict[str, object] = {}
+    for key, items in values.items():
+        field = params_model.model_fields.get(key)
+        collected[key] = (
+            items if field is not None and is_list_type(field.annotation) else items[-1]
+        )
+    return collected
+
+
+def is_list_type(annotation: object) -> bool:
+    if get_origin(annotation) is list:
+        return True
+    return any(get_origin(arg) is list for arg in get_args(annotation))
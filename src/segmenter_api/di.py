@@ -1,4 +1,5 @@
-from typing import Self, TypeVar
+from collections.abc import Callable
+from typing import Self, TypeVar, cast
 
 from injector import Binder, Injector, Module, provider, singleton
 
@@ -8,13 +9,17 @@ from segmenter_api.domain.repository.file import FileRepositoryInterface
 from segmenter_api.infra.factory.detector_factory import DetectorFactory
 from segmenter_api.infra.factory.segmenter_factory import SegmenterFactory
 from segmenter_api.infra.repository.gcs import GCSRepository
+from segmenter_api.infra.repository.local import LocalFileRepository
+from segmenter_api.infra.service.runtime.torch_runtime import TorchRuntime
+from segmenter_api.settings import get_settings
 
 T = TypeVar("T")
 
 _di_instance = None
 
 
-def resolve(cls: type[T]) -> T:
+def resolve(cls: Callable[..., T]) -> T:
+    # type[T]で受け取るとmypyはabstractなinterfaceを渡せないため、Callableで受け取る
     return DI.get_instance().resolve(cls)
 
 
@@ -32,9 +37,10 @@ class DI:
     def _configure(self, binder: Binder) -> None:
         binder.install(FactoryModule())
         binder.install(RepositoryModule())
+        binder.install(RuntimeModule())
 
-    def resolve(self, cls: type[T]) -> T:
-        return self.injector.get(cls)
+    def resolve(self, cls: Callable[..., T]) -> T:
+        return self.injector.get(cast("type[T]", cls))
 
 
 class FactoryModule(Module):
@@ -53,4 +59,13 @@ class RepositoryModule(Module):
     @provider
     @singleton
     def provide_gcs_repository(self) -> FileRepositoryInterface:
+        if get_settings().file_repository_backend == "local":
+            return LocalFileRepository()
         return GCSRepository()
+
+
+class RuntimeModule(Module):
+    @provider
+    @singleton
+    def provide_torch_runtime(self) -> TorchRuntime:
+        return TorchRuntime()
@@ -25,3 +25,13 @@ class NotFoundError(BaseApiError):
 
 class InternalServerError(BaseApiError):
     status_code = HTTPStatus.INTERNAL_SERVER_ERROR
+
+
+class TooManyRequestsError(BaseApiError):
+    """モデルの待ち行列が一杯の場合に返す。retry_after秒後の再試行を促す"""
+
+    status_code = HTTPStatus.TOO_MANY_REQUESTS
+
+    def __init__(self, msg: str, retry_after: int) -> None:
+        super().__init__(msg)
+        self.retry_after = retry_after
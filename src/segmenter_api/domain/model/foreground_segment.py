@@ -1,14 +1,36 @@
+from typing import Self
+
 from PIL import Image
-from pydantic import BaseModel, ConfigDict, field_serializer
+from pydantic import (
+    BaseModel,
+    ConfigDict,
+    Field,
+    field_serializer,
+    field_validator,
+    model_validator,
+)
 
 from segmenter_api.domain.factory.segmenter_factory import SegmenterType
-from segmenter_api.utils.image import base642pil
+from segmenter_api.domain.model.mask import (
+    MaskFormat,
+    RLEMask,
+    check_output_uri,
+    decode_mask,
+)
+from segmenter_api.domain.service.segmenter import ForegroundResolution
+
+# batchリクエストで1度に受け付ける画像の上限
+MAX_BATCH_IMAGES = 32
 
 
 class ForegroundSegmentUsecaseInput(BaseModel):
     model_config = ConfigDict(arbitrary_types_allowed=True)
     image: Image.Image
     segmenter_type: SegmenterType
+    resolution: ForegroundResolution | None = None
+    # imageをデコード時に縮小した場合の元画像の(width, height)
+    # 指定した場合、座標とmaskは元画像のサイズを基準にする
+    original_size: tuple[int, int] | None = None
 
 
 class ForegroundSegmentUsecaseOutput(BaseModel):
@@ -16,20 +38,92 @@ class ForegroundSegmentUsecaseOutput(BaseModel):
     mask: Image.Image
 
 
-class ForegroundSegmentRequest(BaseModel):
+class ForegroundSegmentParams(BaseModel):
+    """画像以外のリクエストパラメータ
+    画像をbinaryでアップロードする場合はform fieldかquery parameterで指定する
+    """
+
     model_config = ConfigDict(arbitrary_types_allowed=True)
-    image: str
     segmenter_type: SegmenterType
+    # Noneの場合はデプロイ時の設定を使う
+    resolution: ForegroundResolution | None = None
+    mask_format: MaskFormat = MaskFormat.PNG
+    # gs://のprefixを指定すると、maskをその下に書き出してbase64の代わりにURIを返す
+    output_uri: str | None = None
 
     @field_serializer("segmenter_type")
     def serialize_segmenter_type(self, segmenter_type: SegmenterType) -> str:
         return segmenter_type.value
 
+    @field_serializer("resolution")
+    def serialize_resolution(
+        self, resolution: ForegroundResolution | None
+    ) -> str | None:
+        return resolution.value if resolution is not None else None
+
+    @field_serializer("mask_format")
+    def serialize_mask_format(self, mask_format: MaskFormat) -> str:
+        return mask_format.value
+
+    @field_validator("mask_format")
+    @classmethod
+    def check_mask_format(cls, mask_format: MaskFormat) -> MaskFormat:
+        return check_foreground_mask_format(mask_format)
+
+    @model_validator(mode="after")
+    def validate_output_uri(self) -> Self:
+        check_output_uri(self.output_uri, self.mask_format)
+        return self
+
+
+class ForegroundSegmentRequest(ForegroundSegmentParams):
+    # base64の画像かgs://のURI
+    image: str
+
 
 class ForegroundSegmentResponse(BaseModel):
     model_config = ConfigDict(arbitrary_types_allowed=True)
-    mask: str
+    # mask_formatに応じてbase64のPNGかCOCO互換のRLE
+    # output_uriを指定した場合は書き出したmaskのURI
+    mask: str | RLEMask
 
     @property
     def mask_image(self) -> Image.Image:
-        return base642pil(self.mask)
+        return decode_mask(self.mask)
+
+
+class ForegroundSegmentBatchUsecaseInput(BaseModel):
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+    images: list[Image.Image]
+    segmenter_type: SegmenterType
+    resolution: ForegroundResolution | None = None
+    # imagesと同じ順序の元画像の(width, height)
+    original_sizes: list[tuple[int, int]] | None = None
+
+
+class ForegroundSegmentBatchUsecaseOutput(BaseModel):
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+    masks: list[Image.Image]
+
+
+class ForegroundSegmentBatchRequest(ForegroundSegmentParams):
+    # base64の画像かgs://のURI
+    # 1リクエストでデコードする画像を制限するため、上限を超える場合は422にする
+    images: list[str] = Field(max_length=MAX_BATCH_IMAGES)
+
+
+class ForegroundSegmentBatchResponse(BaseModel):
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+    # リクエストのimagesと同じ順序
+    masks: list[str | RLEMask]
+
+    @property
+    def mask_images(self) -> list[Image.Image]:
+        return [decode_mask(mask) for mask in self.masks]
+
+
+def check_foreground_mask_format(mask_format: MaskFormat) -> MaskFormat:
+    if mask_format == MaskFormat.LABEL_MAP:
+        error_msg = "前景抽出のmaskは1枚のためlabel_mapには対応していません"
+        raise ValueError(error_msg)
+    return mask_format
@@ -0,0 +1,100 @@
+from datetime import datetime
+from enum import Enum
+from typing import Self
+
+from pydantic import BaseModel, model_validator
+
+from segmenter_api.domain.model.mask import CroppedMask, LabelMap, RLEMask
+from segmenter_api.domain.model.text2segment import Text2SegmentParams
+
+CHECKPOINT_FILE_NAME = "_checkpoint.json"
+
+
+class JobStatus(Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+
+
+class JobItemStatus(Enum):
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+
+
+class JobItem(Text2SegmentParams):
+    """manifestの1行。text2segmentのパラメータとgs://の画像を指定する
+    output_uriは指定してもjobの出力先に置き換えられる
+    """
+
+    # 結果を突き合わせるためのid。省略した場合はmanifestの行番号になる
+    id: str | None = None
+    image: str
+
+    @model_validator(mode="after")
+    def check_image(self) -> Self:
+        if not self.image.startswith("gs://"):
+            error_msg = "imageにはgs://から始まるURIを指定してください"
+            raise ValueError(error_msg)
+        return self
+
+
+class JobCreateRequest(BaseModel):
+    # JSONL形式のmanifestのURI(gs://)
+    manifest_uri: str
+    # 結果を書き出すprefix(gs://)。同じprefixで再度作成すると_checkpoint.jsonから再開する
+    output_uri: str
+    # 1回に画像を読み込んで処理する件数(Noneの場合は設定値)
+    batch_size: int | None = None
+
+    @model_validator(mode="after")
+    def check_uris(self) -> Self:
+        if not self.manifest_uri.startswith("gs://"):
+            error_msg = "manifest_uriにはgs://から始まるURIを指定してください"
+            raise ValueError(error_msg)
+        if not self.output_uri.startswith("gs://"):
+            error_msg = "output_uriにはgs://から始まるURIを指定してください"
+            raise ValueError(error_msg)
+        if self.batch_size is not None and self.batch_size < 1:
+            error_msg = "batch_sizeは1以上を指定してください"
+            raise ValueError(error_msg)
+        return self
+
+
+class JobState(BaseModel):
+    """jobの進捗。output_uri/_checkpoint.jsonに保存され、再開時に読み込まれる"""
+
+    job_id: str
+    manifest_uri: str
+    output_uri: str
+    status: JobStatus
+    batch_size: int
+    # manifestの件数(読み込むまではNone)
+    total: int | None = None
+    # この位置より前のitemは処理済みで、再開時はここから処理する
+    next_index: int = 0
+    succeeded: int = 0
+    failed: int = 0
+    created_at: datetime
+    updated_at: datetime
+    # 現在の実行での処理速度(件/秒)と残り時間の見込み
+    items_per_second: float | None = None
+    eta_seconds: float | None = None
+    error: str | None = None
+    # 作成してから再開した回数。同じ回の再開は1つのworkerだけが行える
+    attempt: int = 0
+
+
+class JobItemResult(BaseModel):
+    """output_uri/results/*.jsonlに1行ずつ書き出すitemごとの結果"""
+
+    index: int
+    id: str | None = None
+    status: JobItemStatus
+    labels: list[str] = []
+    bboxes: list[list[float]] = []
+    # 書き出したmaskのURI。rleの場合はmask自体
+    masks: list[str | RLEMask | CroppedMask] = []
+    label_map: LabelMap | None = None
+    image_size: tuple[int, int] | None = None
+    error: str | None = None
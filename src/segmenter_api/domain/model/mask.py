@@ -0,0 +1,207 @@
+import math
+from enum import Enum
+
+import numpy as np
+from PIL import Image
+from pydantic import BaseModel
+
+from segmenter_api.utils.image import base642pil
+from segmenter_api.utils.label_map import label_palette, stack_label_map
+from segmenter_api.utils.mask import (
+    compress_counts,
+    decode_rle,
+    decompress_counts,
+    encode_rle,
+)
+from segmenter_api.utils.mask_encoder import ImageCodec, get_mask_encoder
+
+# RLEやlabel mapにする際の二値化の閾値(BiRefNetのような多値のmaskに適用される)
+MASK_BINARY_THRESHOLD = 128
+
+
+class MaskFormat(Enum):
+    """レスポンスのmaskの形式
+    PNG: base64のPNG画像
+    PNG_1BIT: base64の1bitのPNG画像(二値化される)
+    WEBP_LOSSLESS: base64の可逆WebP画像
+    RLE: COCO互換の圧縮RLE(二値化される)
+    LABEL_MAP: 全instanceをまとめた1枚のlabel画像(二値化される)
+    """
+
+    PNG = "png"
+    PNG_1BIT = "png_1bit"
+    WEBP_LOSSLESS = "webp_lossless"
+    RLE = "rle"
+    LABEL_MAP = "label_map"
+
+
+# base64の画像としてencodeする形式
+IMAGE_MASK_FORMATS = (MaskFormat.PNG, MaskFormat.PNG_1BIT, MaskFormat.WEBP_LOSSLESS)
+
+
+class RLEMask(BaseModel):
+    """COCO互換のRLE。pycocotools.mask.decodeにそのまま渡せる"""
+
+    # [height, width]
+    size: tuple[int, int]
+    # 圧縮したcounts文字列
+    counts: str
+
+    def to_image(self) -> Image.Image:
+        mask = decode_rle(decompress_counts(self.counts), self.size)
+        return Image.fromarray(mask.astype(np.uint8) * 255)
+
+
+class LabelMapInstance(BaseModel):
+    # label画像上の画素値
+    index: int
+    label: str
+    bbox: list[float]
+    # 他のinstanceとの重なりを除いてlabel画像上で見えている画素数
+    area: int
+
+
+class LabelMap(BaseModel):
+    """全instanceのmaskを1枚にまとめたlabel画像
+    画素値0は背景で、instances[i].indexの画素がi番目のinstanceを表す
+    instanceが255個以下ならpalette PNG、それ以外は16bit grayscaleのPNGになる
+    """
+
+    # base64のPNG画像
+    image: str
+    instances: list[LabelMapInstance]
+
+    def to_masks(self) -> list[Image.Image]:
+        """instanceごとの二値mask画像に戻す"""
+        label_map = np.asarray(base642pil(self.image))
+        return [
+            Image.fromarray((label_map == instance.index).astype(np.uint8) * 255)
+            for instance in self.instances
+        ]
+
+
+def encode_label_map(
+    masks: list[Image.Image],
+    labels: list[str],
+    bboxes: list[list[float]],
+    image_size: tuple[int, int],
+) -> LabelMap:
+    """instance maskをlabel画像と対応表にする
+    重なった画素は面積の小さいinstanceに割り当てる
+    """
+    image, instances = build_label_map(masks, labels, bboxes, image_size)
+    return LabelMap(
+        image=get_mask_encoder().encode_one(image, ImageCodec.PNG),
+        instances=instances,
+    )
+
+
+def build_label_map(
+    masks: list[Image.Image],
+    labels: list[str],
+    bboxes: list[list[float]],
+    image_size: tuple[int, int],
+) -> tuple[Image.Image, list[LabelMapInstance]]:
+    """encode前のlabel画像と対応表を作る"""
+    width, height = image_size
+    arrays = np.zeros((len(masks), height, width), dtype=bool)
+    for i, mask in enumerate(masks):
+        arrays[i] = np.asarray(mask.convert("L")) >= MASK_BINARY_THRESHOLD
+    label_map, visible_areas = stack_label_map(arrays)
+    image = Image.fromarray(label_map)
+    if image.mode == "L":
+        image = image.convert("P")
+        image.putpalette(label_palette())
+    instances = [
+        LabelMapInstance(index=i + 1, label=label, bbox=bbox, area=int(area))
+        for i, (label, bbox, area) in enumerate(
+            zip(labels, bboxes, visible_areas, strict=True)
+        )
+    ]
+    return image, instances
+
+
+def check_output_uri(output_uri: str | None, mask_format: MaskFormat) -> None:
+    """maskの書き出し先の指定を検証する"""
+    if output_uri is None:
+        return
+    if not output_uri.startswith("gs://"):
+        error_msg = "output_uriはgs://から始まるURIを指定してください"
+        raise ValueError(error_msg)
+    if mask_format == MaskFormat.RLE:
+        error_msg = "rleのmaskはレスポンスに含めるためoutput_uriと同時に指定できません"
+        raise ValueError(error_msg)
+
+
+def encode_masks(
+    masks: list[Image.Image], mask_format: MaskFormat
+) -> list[str | RLEMask]:
+    """mask画像をレスポンスの形式にする"""
+    if mask_format == MaskFormat.LABEL_MAP:
+        error_msg = "label_mapはencode_label_mapで作成してください"
+        raise ValueError(error_msg)
+    if mask_format in IMAGE_MASK_FORMATS:
+        return list(get_mask_encoder().encode(masks, ImageCodec(mask_format.value)))
+    encoded: dict[int, RLEMask] = {}
+    # 同じサイズのmaskをまとめてencodeする
+    indices_by_size: dict[tuple[int, int], list[int]] = {}
+    for i, mask in enumerate(masks):
+        indices_by_size.setdefault(mask.size, []).append(i)
+    for (width, height), indices in indices_by_size.items():
+        arrays = np.stack([np.asarray(masks[i].convert("L")) for i in indices])
+        counts_list = encode_rle(arrays >= MASK_BINARY_THRESHOLD)
+        for i, counts in zip(indices, counts_list, strict=True):
+            encoded[i] = RLEMask(size=(height, width), counts=compress_counts(counts))
+    return [encoded[i] for i in range(len(masks))]
+
+
+class CroppedMask(BaseModel):
+    """bboxの範囲に切り出したmask。範囲外の画素は0として扱う"""
+
+    # mask_formatに応じてbase64のPNGかCOCO互換のRLE
+    mask: str | RLEMask
+    # 切り出した範囲の元画像上の左上の(x, y)
+    offset: tuple[int, int]
+
+    def paste(self, image_size: tuple[int, int]) -> Image.Image:
+        """image_size(width, height)の画像に貼り戻す"""
+        image = Image.new("L", image_size)
+        image.paste(decode_mask(self.mask).convert("L"), self.offset)
+        return image
+
+
+def crop_mask(
+    mask: Image.Image, bbox: list[float], padding: int = 0
+) -> tuple[Image.Image, tuple[int, int]]:
+    """maskをpaddingを加えたbboxの範囲に切り出す
+    SAM2のmaskはbboxの外にはみ出すことがあるため、maskの画素がある範囲も含めて
+    貼り戻した際に元のmaskと一致するようにする
+    Returns:
+        切り出したmask, 切り出した範囲の左上の(x, y)
+    """
+    width, height = mask.size
+    x1, y1, x2, y2 = bbox
+    left = max(0, math.floor(x1) - padding)
+    top = max(0, math.floor(y1) - padding)
+    right = min(width, math.ceil(x2) + padding)
+    bottom = min(height, math.ceil(y2) + padding)
+    nonzero_bbox = mask.getbbox()
+    if nonzero_bbox is not None:
+        left = min(left, nonzero_bbox[0])
+        top = min(top, nonzero_bbox[1])
+        right = max(right, nonzero_bbox[2])
+        bottom = max(bottom, nonzero_bbox[3])
+    # 空の画像はPNGにできないため最低1画素は残す
+    right = max(right, min(left + 1, width))
+    bottom = max(bottom, min(top + 1, height))
+    return mask.crop((left, top, right, bottom)), (left, top)
+
+
+def decode_mask(mask: str | RLEMask) -> Image.Image:
+    if isinstance(mask, RLEMask):
+        return mask.to_image()
+    image = base642pil(mask)
+    # 1bitのPNGとRGBで保存される可逆WebPはgrayscaleに揃える
+    if image.mode == "1" or image.format == "WEBP":
+        return image.convert("L")
+    return image
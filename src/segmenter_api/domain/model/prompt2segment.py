@@ -0,0 +1,99 @@
+from typing import Self
+
+import numpy as np
+from PIL import Image
+from pydantic import BaseModel, ConfigDict, field_serializer, model_validator
+
+from segmenter_api.domain.factory.segmenter_factory import SegmenterType
+from segmenter_api.utils.image import base642pil
+
+# SAM2のmask decoderが出力する低解像度maskのサイズ
+LOW_RES_MASK_SIZE = 256
+
+
+class Prompt2SegmentUsecaseInput(BaseModel):
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+    segmenter_type: SegmenterType
+    image: Image.Image | None = None
+    image_id: str | None = None
+    # imageをデコード時に縮小した場合の元画像の(width, height)
+    # 指定した場合、座標とmaskは元画像のサイズを基準にする
+    original_size: tuple[int, int] | None = None
+    point_coords: list[tuple[float, float]] | None = None
+    point_labels: list[int] | None = None
+    box: tuple[float, float, float, float] | None = None
+    mask_input: np.ndarray | None = None
+    multimask_output: bool = False
+
+
+class Prompt2SegmentUsecaseOutput(BaseModel):
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+    image_id: str
+    masks: list[Image.Image]
+    scores: list[float]
+    low_res_logits: np.ndarray
+
+
+class Prompt2SegmentRequest(BaseModel):
+    """点・boxのpromptによるmask修正のリクエスト
+    2回目以降はimageの代わりにレスポンスのimage_idを指定すると
+    image encoderを実行せずにキャッシュした画像特徴量を使う
+    """
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+    segmenter_type: SegmenterType = SegmenterType.SAM2
+    image: str | None = None
+    image_id: str | None = None
+    point_coords: list[tuple[float, float]] | None = None
+    point_labels: list[int] | None = None
+    box: tuple[float, float, float, float] | None = None
+    # 前回のレスポンスのlow_res_logitsのうち1つ(base64の.npy, shape: (256, 256))
+    mask_input: str | None = None
+    multimask_output: bool = False
+
+    @model_validator(mode="after")
+    def check_prompts(self) -> Self:
+        if self.image is None and self.image_id is None:
+            error_msg = "imageかimage_idのどちらかを指定してください"
+            raise ValueError(error_msg)
+        if (self.point_coords is None) != (self.point_labels is None):
+            error_msg = "point_coordsとpoint_labelsは両方指定してください"
+            raise ValueError(error_msg)
+        if self.point_coords is not None and self.point_labels is not None:
+            if len(self.point_coords) != len(self.point_labels):
+                error_msg = "point_coordsとpoint_labelsの長さが一致しません"
+                raise ValueError(error_msg)
+            if any(label not in (0, 1) for label in self.point_labels):
+                error_msg = "point_labelsは0(背景)か1(前景)を指定してください"
+                raise ValueError(error_msg)
+        if self.point_coords is None and self.box is None and self.mask_input is None:
+            error_msg = "point_coords, box, mask_inputのいずれかを指定してください"
+            raise ValueError(error_msg)
+        return self
+
+    @field_serializer("segmenter_type")
+    def serialize_segmenter_type(self, segmenter_type: SegmenterType) -> str:
+        return segmenter_type.value
+
+
+class Prompt2SegmentResponse(BaseModel):
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+    image_id: str
+    masks: list[str]
+    scores: list[float]
+    # 次回のmask_inputに使う低解像度mask logit(base64の.npy, float16)
+    low_res_logits: list[str]
+
+    @model_validator(mode="after")
+    def check_masks_and_scores(self) -> Self:
+        if len(self.masks) != len(self.scores):
+            error_msg = "masksとscoresの長さが一致しません"
+            raise ValueError(error_msg)
+        if len(self.masks) != len(self.low_res_logits):
+            error_msg = "masksとlow_res_logitsの長さが一致しません"
+            raise ValueError(error_msg)
+        return self
+
+    @property
+    def mask_images(self) -> list[Image.Image]:
+        return [base642pil(mask) for mask in self.masks]
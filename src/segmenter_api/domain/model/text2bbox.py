@@ -4,11 +4,13 @@ from PIL import Image
 from pydantic import (
     BaseModel,
     ConfigDict,
+    Field,
     field_serializer,
     model_validator,
 )
 
 from segmenter_api.domain.factory.detector_factory import DetectorType
+from segmenter_api.domain.service.detector import DetectionQuality
 
 
 class Text2BboxInput(BaseModel):
@@ -16,6 +18,14 @@ class Text2BboxInput(BaseModel):
     texts: list[str]
     image: Image.Image
     detector_type: DetectorType
+    quality: DetectionQuality = DetectionQuality.ACCURATE
+    box_threshold: float | None = None
+    text_threshold: float | None = None
+    max_detections: int | None = None
+    use_cache: bool = True
+    # imageをデコード時に縮小した場合の元画像の(width, height)
+    # 指定した場合、座標とmaskは元画像のサイズを基準にする
+    original_size: tuple[int, int] | None = None
 
 
 class Text2BboxOutput(BaseModel):
@@ -31,16 +41,34 @@ class Text2BboxOutput(BaseModel):
         return self
 
 
-class Text2BboxRequest(BaseModel):
+class Text2BboxParams(BaseModel):
+    """画像以外のリクエストパラメータ
+    画像をbinaryでアップロードする場合はform fieldかquery parameterで指定する
+    """
+
     model_config = ConfigDict(arbitrary_types_allowed=True)
     detector_type: DetectorType
-    image: str
     texts: list[str]
+    quality: DetectionQuality = DetectionQuality.ACCURATE
+    # 範囲外の値は422にする(Noneの場合はdetectorのデフォルト)
+    box_threshold: float | None = Field(default=None, ge=0, le=1)
+    text_threshold: float | None = Field(default=None, ge=0, le=1)
+    max_detections: int | None = Field(default=None, ge=1)
+    use_cache: bool = True
 
     @field_serializer("detector_type")
     def serialize_detector_type(self, detector_type: DetectorType) -> str:
         return detector_type.value
 
+    @field_serializer("quality")
+    def serialize_quality(self, quality: DetectionQuality) -> str:
+        return quality.value
+
+
+class Text2BboxRequest(Text2BboxParams):
+    # base64の画像かgs://のURI
+    image: str
+
 
 class Text2BboxResponse(BaseModel):
     model_config = ConfigDict(arbitrary_types_allowed=True)
@@ -4,15 +4,23 @@ from PIL import Image
 from pydantic import (
     BaseModel,
     ConfigDict,
+    Field,
     field_serializer,
     model_validator,
 )
 
 from segmenter_api.domain.factory.detector_factory import DetectorType
 from segmenter_api.domain.factory.segmenter_factory import SegmenterType
-from segmenter_api.domain.service.detector import DetectorOutput
+from segmenter_api.domain.model.mask import (
+    CroppedMask,
+    LabelMap,
+    MaskFormat,
+    RLEMask,
+    check_output_uri,
+    decode_mask,
+)
+from segmenter_api.domain.service.detector import DetectionQuality, DetectorOutput
 from segmenter_api.domain.service.segmenter import Bbox2SegmentOutput
-from segmenter_api.utils.image import base642pil
 
 
 class Text2SegmentInput(BaseModel):
@@ -21,6 +29,14 @@ class Text2SegmentInput(BaseModel):
     image: Image.Image
     detector_type: DetectorType
     segmenter_type: SegmenterType
+    quality: DetectionQuality = DetectionQuality.ACCURATE
+    box_threshold: float | None = None
+    text_threshold: float | None = None
+    max_detections: int | None = None
+    use_cache: bool = True
+    # imageをデコード時に縮小した場合の元画像の(width, height)
+    # 指定した場合、座標とmaskは元画像のサイズを基準にする
+    original_size: tuple[int, int] | None = None
 
 
 class Text2SegmentOutput(BaseModel):
@@ -41,12 +57,43 @@ class Text2SegmentOutput(BaseModel):
         return [Image.alpha_composite(image, mask) for mask in self.masks]
 
 
-class Text2SegmentRequest(BaseModel):
+class Text2SegmentParams(BaseModel):
+    """画像以外のリクエストパラメータ
+    画像をbinaryでアップロードする場合はform fieldかquery parameterで指定する
+    """
+
     model_config = ConfigDict(arbitrary_types_allowed=True)
     detector_type: DetectorType
     segmenter_type: SegmenterType
-    image: str
     texts: list[str]
+    quality: DetectionQuality = DetectionQuality.ACCURATE
+    # 範囲外の値は422にする(Noneの場合はdetectorのデフォルト)
+    box_threshold: float | None = Field(default=None, ge=0, le=1)
+    text_threshold: float | None = Field(default=None, ge=0, le=1)
+    max_detections: int | None = Field(default=None, ge=1)
+    use_cache: bool = True
+    mask_format: MaskFormat = MaskFormat.PNG
+    # Trueの場合、各maskをbboxの範囲に切り出して切り出した位置と一緒に返す
+    crop_to_bbox: bool = False
+    # crop_to_bboxでbboxの周囲に含める画素数
+    crop_padding: int = 0
+    # gs://のprefixを指定すると、maskをその下に書き出してbase64の代わりにURIを返す
+    output_uri: str | None = None
+
+    @model_validator(mode="after")
+    def check_crop(self) -> Self:
+        if self.crop_padding < 0:
+            error_msg = "crop_paddingは0以上を指定してください"
+            raise ValueError(error_msg)
+        if self.crop_to_bbox and self.mask_format == MaskFormat.LABEL_MAP:
+            error_msg = "crop_to_bboxはlabel_mapと同時に指定できません"
+            raise ValueError(error_msg)
+        return self
+
+    @model_validator(mode="after")
+    def validate_output_uri(self) -> Self:
+        check_output_uri(self.output_uri, self.mask_format)
+        return self
 
     @field_serializer("detector_type")
     def serialize_detector_type(self, detector_type: DetectorType) -> str:
@@ -56,26 +103,65 @@ class Text2SegmentRequest(BaseModel):
     def serialize_segmenter_type(self, segmenter_type: SegmenterType) -> str:
         return segmenter_type.value
 
+    @field_serializer("quality")
+    def serialize_quality(self, quality: DetectionQuality) -> str:
+        return quality.value
+
+    @field_serializer("mask_format")
+    def serialize_mask_format(self, mask_format: MaskFormat) -> str:
+        return mask_format.value
+
+
+class Text2SegmentRequest(Text2SegmentParams):
+    # base64の画像かgs://のURI
+    image: str
+
 
 class Text2SegmentResponse(BaseModel):
     model_config = ConfigDict(arbitrary_types_allowed=True)
     labels: list[str]
-    masks: list[str]
+    # mask_formatに応じてbase64のPNGかCOCO互換のRLE
+    # mask_formatがlabel_mapの場合は空で、maskはlabel_mapにまとめて返す
+    # crop_to_bboxの場合はbboxの範囲に切り出したCroppedMask
+    # output_uriを指定した場合はbase64の代わりに書き出したmaskのURI
+    masks: list[str | RLEMask | CroppedMask]
     bboxes: list[list[float]]
+    # /prompt2segmentでmaskを修正する際に指定する画像のid
+    image_id: str | None = None
+    label_map: LabelMap | None = None
+    # 元画像の(width, height)。CroppedMaskを貼り戻す際に使う
+    image_size: tuple[int, int] | None = None
 
     @model_validator(mode="after")
     def check_masks_and_labels_and_bboxes(self) -> Self:
-        if len(self.masks) != len(self.labels):
+        if self.label_map is not None:
+            if len(self.masks) != 0:
+                error_msg = "label_mapを返す場合はmasksを空にしてください"
+                raise ValueError(error_msg)
+            if len(self.label_map.instances) != len(self.labels):
+                error_msg = "label_mapのinstancesとlabelsの長さが一致しません"
+                raise ValueError(error_msg)
+        elif len(self.masks) != len(self.labels):
             error_msg = "masksとlabelsの長さが一致しません"
             raise ValueError(error_msg)
-        if len(self.masks) != len(self.bboxes):
-            error_msg = "masksとbboxesの長さが一致しません"
+        if len(self.labels) != len(self.bboxes):
+            error_msg = "labelsとbboxesの長さが一致しません"
             raise ValueError(error_msg)
         return self
 
     @property
     def mask_images(self) -> list[tuple[str, Image.Image]]:
+        if self.label_map is not None:
+            return list(zip(self.labels, self.label_map.to_masks(), strict=True))
         return [
-            (label, base642pil(mask))
+            (label, self._decode_mask(mask))
             for label, mask in zip(self.labels, self.masks, strict=True)
         ]
+
+    def _decode_mask(self, mask: str | RLEMask | CroppedMask) -> Image.Image:
+        if not isinstance(mask, CroppedMask):
+            return decode_mask(mask)
+        if self.image_size is None:
+            error_msg = "切り出したmaskを貼り戻すにはimage_sizeが必要です"
+            raise ValueError(error_msg)
+        return mask.paste(self.image_size)
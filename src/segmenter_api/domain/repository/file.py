@@ -30,3 +30,24 @@ class FileRepositoryInterface(ABC):
         overwrite: bool = False,
     ) -> list[PathLike]:
         pass
+
+    @abstractmethod
+    def read_bytes(self, uri: str) -> bytes:
+        """gs://bucket/path形式のURIのobjectをメモリ上に読み込む
+        Raises:
+            NotFoundError: objectが存在しない場合
+        """
+
+    @abstractmethod
+    def write_bytes(
+        self, uri: str, data: bytes, content_type: str | None = None
+    ) -> None:
+        """gs://bucket/path形式のURIにdataを書き込む。既存のobjectは上書きする"""
+
+    @abstractmethod
+    def create_bytes(
+        self, uri: str, data: bytes, content_type: str | None = None
+    ) -> bool:
+        """objectが存在しない場合だけdataを書き込み、書き込んだかを返す
+        複数のプロセスが同時に呼び出しても書き込めるのは1つだけになる
+        """
@@ -1,14 +1,30 @@
 from abc import ABC, abstractmethod
+from enum import Enum
 from typing import Self
 
 from PIL import Image
 from pydantic import BaseModel, ConfigDict, model_validator
 
 
+class DetectionQuality(Enum):
+    """速度と精度のトレードオフを選ぶdecodingのtier"""
+
+    FAST = "fast"
+    BALANCED = "balanced"
+    ACCURATE = "accurate"
+
+
 class DetectorInput(BaseModel):
     model_config = ConfigDict(arbitrary_types_allowed=True)
     texts: list[str]
     image: Image.Image
+    quality: DetectionQuality = DetectionQuality.ACCURATE
+    # scoreを出力するdetectorで使う閾値とbbox数の上限(Noneの場合はdetectorのデフォルト)
+    box_threshold: float | None = None
+    text_threshold: float | None = None
+    max_detections: int | None = None
+    # Falseの場合は検出結果のキャッシュを使わない
+    use_cache: bool = True
 
 
 class DetectorOutput(BaseModel):
@@ -27,3 +43,9 @@ class Detector(ABC):
     @abstractmethod
     def detect(self, detector_input: DetectorInput) -> DetectorOutput:
         raise NotImplementedError
+
+    def detect_batch(
+        self, detector_inputs: list[DetectorInput]
+    ) -> list[DetectorOutput]:
+        """複数の入力をまとめて処理する。batch処理できるdetectorはoverrideする"""
+        return [self.detect(detector_input) for detector_input in detector_inputs]
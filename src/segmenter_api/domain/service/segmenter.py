@@ -1,5 +1,7 @@
 from abc import ABC, abstractmethod
+from enum import Enum
 
+import numpy as np
 from PIL import Image
 from pydantic import BaseModel, ConfigDict
 
@@ -12,16 +14,66 @@ class Bbox2SegmentInput(BaseModel):
     model_config = ConfigDict(arbitrary_types_allowed=True)
     image: Image.Image
     bboxes: list[tuple[float, float, float, float]]
+    # imageをデコード時に縮小した場合の元画像の(width, height)
+    # 指定した場合、座標とmaskは元画像のサイズを基準にする
+    original_size: tuple[int, int] | None = None
 
 
 class Bbox2SegmentOutput(BaseModel):
     model_config = ConfigDict(arbitrary_types_allowed=True)
     masks: list[Image.Image]
+    # 画像特徴量をキャッシュした場合、prompt2segmentで再利用するためのid
+    image_id: str | None = None
+
+
+class Prompt2SegmentInput(BaseModel):
+    """点・boxのpromptによるsegmentの入力
+    imageかimage_id(キャッシュ済みの画像特徴量)のどちらかを指定する
+    """
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+    image: Image.Image | None = None
+    image_id: str | None = None
+    # imageをデコード時に縮小した場合の元画像の(width, height)
+    # 指定した場合、座標とmaskは元画像のサイズを基準にする
+    original_size: tuple[int, int] | None = None
+    point_coords: list[tuple[float, float]] | None = None
+    # 1: 前景, 0: 背景
+    point_labels: list[int] | None = None
+    box: tuple[float, float, float, float] | None = None
+    # 前回の出力の低解像度mask logit (1, 256, 256)
+    mask_input: np.ndarray | None = None
+    multimask_output: bool = False
+
+
+class Prompt2SegmentOutput(BaseModel):
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+    image_id: str
+    masks: list[Image.Image]
+    scores: list[float]
+    # 次回のmask_inputに使う低解像度mask logit (C, 256, 256)
+    low_res_logits: np.ndarray
+
+
+class ForegroundResolution(Enum):
+    """前景抽出モデルの入力解像度のtier
+    AUTOは入力画像の長辺を含む最小のtierを選ぶ
+    """
+
+    AUTO = "auto"
+    RES_512 = "512"
+    RES_768 = "768"
+    RES_1024 = "1024"
 
 
 class ForegroundSegmentInput(BaseModel):
     model_config = ConfigDict(arbitrary_types_allowed=True)
     image: Image.Image
+    # Noneの場合はデプロイ時の設定(birefnet_default_resolution)を使う
+    resolution: ForegroundResolution | None = None
+    # imageをデコード時に縮小した場合の元画像の(width, height)
+    # 指定した場合、座標とmaskは元画像のサイズを基準にする
+    original_size: tuple[int, int] | None = None
 
 
 class ForegroundSegmentOutput(BaseModel):
@@ -34,8 +86,36 @@ class Segmenter(ABC):
     def bbox2segment(self, bbox2segment_input: Bbox2SegmentInput) -> Bbox2SegmentOutput:
         raise NotImplementedError
 
+    def bbox2segment_batch(
+        self, bbox2segment_inputs: list[Bbox2SegmentInput]
+    ) -> list[Bbox2SegmentOutput]:
+        """複数画像のbbox2segmentをまとめて実行する
+        デフォルトでは1件ずつbbox2segmentを呼び出す。バッチ推論できる実装はoverrideする
+        """
+        return [
+            self.bbox2segment(bbox2segment_input)
+            for bbox2segment_input in bbox2segment_inputs
+        ]
+
+    def prompt2segment(
+        self, prompt2segment_input: Prompt2SegmentInput
+    ) -> Prompt2SegmentOutput:
+        error_msg = f"{self.__class__.__name__}は点・boxのpromptに対応していません"
+        raise NotImplementedError(error_msg)
+
     @abstractmethod
     def foreground_segment(
         self, foreground_segment_input: ForegroundSegmentInput
     ) -> ForegroundSegmentOutput:
         raise NotImplementedError
+
+    def foreground_segment_batch(
+        self, foreground_segment_inputs: list[ForegroundSegmentInput]
+    ) -> list[ForegroundSegmentOutput]:
+        """複数画像の前景抽出をまとめて実行する
+        デフォルトでは1件ずつforeground_segmentを呼び出す。バッチ推論できる実装はoverrideする
+        """
+        return [
+            self.foreground_segment(foreground_segment_input)
+            for foreground_segment_input in foreground_segment_inputs
+        ]
@@ -3,9 +3,17 @@ from __future__ import annotations
 import os
 from typing import Any
 
+from segmenter_api.settings import get_settings
+
 wsgi_app: str = "src.segmenter_api.app.server:api"
 bind: list[str] = [f"0.0.0.0:{int(os.getenv('PORT', '8080'))}"]
-workers: int = 1
+# 検出結果、SAM2の画像embedding、prompt2segmentのimage_id等のキャッシュはworkerごとに
+# 持つため、workerを増やすとリクエストを受けたworker以外のキャッシュは使われない
+# image_idを指定したprompt2segmentは、image_idを返したworkerに届かないと見つからない
+# (1/workersの確率でしか当たらない)ため、使う場合はworkerを1にしてinstanceを増やす
+workers: int = int(os.getenv("GUNICORN_WORKERS", "1"))
+# preload_modelsを指定した場合、masterでモデルを読み込んでからworkerをforkする
+preload_app: bool = bool(get_settings().preload_models)
 worker_class: str = "uvicorn.workers.UvicornWorker"
 timeout: int = 0
 reload: bool = True if os.environ.get("DEBUGGING") else False
@@ -35,3 +43,19 @@ logconfig_dict: dict[str, Any] = {
         },
     },
 }
+
+
+def when_ready(_server: Any) -> None:
+    if preload_app:
+        # preloadしない場合はtorch等を読み込まないよう、使う時だけimportする
+        from segmenter_api.app.preload import preload_models  # noqa: PLC0415
+
+        preload_models()
+
+
+def post_fork(_server: Any, _worker: Any) -> None:
+    if preload_app:
+        # preloadしない場合はtorch等を読み込まないよう、使う時だけimportする
+        from segmenter_api.app.preload import reinitialize_worker  # noqa: PLC0415
+
+        reinitialize_worker(workers)
@@ -1,3 +1,4 @@
+from collections.abc import Hashable
 from functools import lru_cache
 
 from segmenter_api.domain.factory.detector_factory import (
@@ -5,21 +6,80 @@ from segmenter_api.domain.factory.detector_factory import (
     DetectorType,
 )
 from segmenter_api.domain.repository.file import FileRepositoryInterface
-from segmenter_api.domain.service.detector import Detector
+from segmenter_api.domain.service.detector import Detector, DetectorOutput
+from segmenter_api.infra.service.detector.caching import CachingDetector
+from segmenter_api.infra.service.detector.concurrency_limited import (
+    ConcurrencyLimitedDetector,
+)
 from segmenter_api.infra.service.detector.florence2_detector import (
     Florence2Detector,
+    create_feature_cache,
 )
 from segmenter_api.infra.service.detector.grounding_dino import (
     GroundingDinoDetector,
 )
+from segmenter_api.infra.service.detector.micro_batching import (
+    MicroBatchingDetector,
+)
+from segmenter_api.infra.service.runtime.model_executor import ModelExecutor
+from segmenter_api.infra.service.runtime.torch_runtime import TorchRuntime
+from segmenter_api.settings import get_settings
+from segmenter_api.utils.cache import LRUCache
 from segmenter_api.utils.logger import get_logger
+from segmenter_api.utils.metrics import get_metrics
 
 logger = get_logger(__name__)
 
+settings = get_settings()
+
 
 class DetectorFactory(DetectorFactoryInterface):
+    def __init__(self) -> None:
+        # base/largeで共有するFlorence2の画像特徴量キャッシュ
+        self.florence2_feature_cache = create_feature_cache(
+            settings.florence2_feature_cache_max_bytes
+        )
+        # detector_typeをkeyに含めて全detectorで共有する検出結果のキャッシュ
+        self.detection_cache: LRUCache[Hashable, DetectorOutput] = LRUCache(
+            max_items=settings.detection_cache_max_items,
+            ttl_seconds=settings.detection_cache_ttl_seconds,
+        )
+        get_metrics().register_collector(
+            "florence2_feature_cache", self.florence2_feature_cache.stats
+        )
+        get_metrics().register_collector("detection_cache", self.detection_cache.stats)
+
     @lru_cache
     def create(self, detector_type: DetectorType) -> Detector:
+        detector = self._create(detector_type)
+        if settings.detector_batch_max_size > 1:
+            # 同時に届いたリクエストをまとめて1回のforward/generateで処理する
+            detector = MicroBatchingDetector(
+                detector=detector,
+                max_batch_size=settings.detector_batch_max_size,
+                max_wait_ms=settings.detector_batch_max_wait_ms,
+                name=detector_type.value,
+            )
+        # micro-batchingの前で同時に待つリクエスト数を制限する
+        # batchにまとめるため、detector_max_concurrencyはbatchの大きさ以上にする
+        executor = ModelExecutor(
+            name=detector_type.value,
+            max_concurrency=settings.detector_max_concurrency,
+            max_queue_size=settings.model_max_queue_size,
+            min_retry_after_seconds=settings.model_min_retry_after_seconds,
+        )
+        get_metrics().register_collector(
+            f"model_executor.{detector_type.value}", executor.stats
+        )
+        detector = ConcurrencyLimitedDetector(detector=detector, executor=executor)
+        # キャッシュヒット時はbatchingの待ち時間もかからないよう最前段に置く
+        return CachingDetector(
+            detector=detector,
+            cache=self.detection_cache,
+            detector_type=detector_type.value,
+        )
+
+    def _create(self, detector_type: DetectorType) -> Detector:
         from segmenter_api.di import resolve
 
         logger.info(f"Creating detector: {detector_type}")
@@ -27,11 +87,15 @@ class DetectorFactory(DetectorFactoryInterface):
             return Florence2Detector(
                 file_repository=resolve(FileRepositoryInterface),
                 model_type="base",
+                runtime=resolve(TorchRuntime),
+                feature_cache=self.florence2_feature_cache,
             )
         elif detector_type == DetectorType.FLORENCE2_LARGE:
             return Florence2Detector(
                 file_repository=resolve(FileRepositoryInterface),
                 model_type="large",
+                runtime=resolve(TorchRuntime),
+                feature_cache=self.florence2_feature_cache,
             )
         elif detector_type == DetectorType.GROUNDING_DINO:
             return resolve(GroundingDinoDetector)
@@ -5,13 +5,35 @@ from segmenter_api.domain.factory.segmenter_factory import (
     SegmenterType,
 )
 from segmenter_api.domain.service.segmenter import Segmenter
+from segmenter_api.infra.service.runtime.model_executor import ModelExecutor
 from segmenter_api.infra.service.segmenter.birefnet import BiRefNet
+from segmenter_api.infra.service.segmenter.concurrency_limited import (
+    ConcurrencyLimitedSegmenter,
+)
 from segmenter_api.infra.service.segmenter.sam2 import SAM2
+from segmenter_api.settings import get_settings
+from segmenter_api.utils.metrics import get_metrics
+
+settings = get_settings()
 
 
 class SegmenterFactory(SegmenterFactoryInterface):
     @lru_cache
     def create(self, segmenter_type: SegmenterType) -> Segmenter:
+        executor = ModelExecutor(
+            name=segmenter_type.value,
+            max_concurrency=settings.segmenter_max_concurrency,
+            max_queue_size=settings.model_max_queue_size,
+            min_retry_after_seconds=settings.model_min_retry_after_seconds,
+        )
+        get_metrics().register_collector(
+            f"model_executor.{segmenter_type.value}", executor.stats
+        )
+        return ConcurrencyLimitedSegmenter(
+            segmenter=self._create(segmenter_type), executor=executor
+        )
+
+    def _create(self, segmenter_type: SegmenterType) -> Segmenter:
         from segmenter_api.di import resolve
 
         if segmenter_type == SegmenterType.SAM2:
@@ -1,10 +1,14 @@
 import os
+import threading
+import weakref
 from os import PathLike
 from pathlib import Path
 from typing import cast
 
-from google.api_core.exceptions import TooManyRequests
+from google.api_core.exceptions import NotFound, PreconditionFailed, TooManyRequests
+from google.auth.credentials import AnonymousCredentials
 from google.cloud import storage
+from requests.adapters import HTTPAdapter
 from tenacity import (
     retry,
     retry_if_exception_type,
@@ -13,6 +17,7 @@ from tenacity import (
 )
 from tqdm.contrib.concurrent import thread_map
 
+from segmenter_api.domain.model.errors import NotFoundError
 from segmenter_api.domain.model.gcs import GCSPath
 from segmenter_api.domain.repository.file import FileRepositoryInterface
 from segmenter_api.settings import get_settings
@@ -24,10 +29,81 @@ logger = get_logger(__name__)
 settings = get_settings()
 
 
+retry_on_too_many_requests = retry(
+    retry=retry_if_exception_type(TooManyRequests),
+    wait=wait_exponential(multiplier=1, min=1, max=5),
+    stop=stop_after_attempt(30),
+    reraise=True,
+)
+
+
+# fork後にclientを作り直すため、作成したrepositoryを弱参照で保持する
+_repositories: weakref.WeakSet["GCSRepository"] = weakref.WeakSet()
+
+
+def _reset_clients_after_fork() -> None:
+    for repository in list(_repositories):
+        repository.reset_client()
+
+
+os.register_at_fork(after_in_child=_reset_clients_after_fork)
+
+
 class GCSRepository(FileRepositoryInterface):
     def __init__(self):
-        self.client = storage.Client()
         self.bucket_name = settings.google_cloud_storage_bucket
+        self._client: storage.Client | None = None
+        self._client_lock = threading.Lock()
+        _repositories.add(self)
+
+    def reset_client(self) -> None:
+        """次に使う時にclientを作り直させる
+        fork後の子プロセスが親のconnection poolを使わないようにする
+        """
+        self._client = None
+        self._client_lock = threading.Lock()
+
+    @property
+    def client(self) -> storage.Client:
+        """プロセス内で共有するclient。最初に使う時に作成する"""
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    self._client = create_storage_client()
+        return self._client
+
+    @retry_on_too_many_requests
+    def read_bytes(self, uri: str) -> bytes:
+        gcs_path = GCSPath.from_path(uri)
+        blob = self.client.bucket(gcs_path.bucket).blob(gcs_path.blob_path)
+        try:
+            return blob.download_as_bytes()
+        except NotFound as e:
+            error_msg = f"{uri}が見つかりません"
+            raise NotFoundError(error_msg) from e
+
+    @retry_on_too_many_requests
+    def write_bytes(
+        self, uri: str, data: bytes, content_type: str | None = None
+    ) -> None:
+        gcs_path = GCSPath.from_path(uri)
+        blob = self.client.bucket(gcs_path.bucket).blob(gcs_path.blob_path)
+        blob.upload_from_string(data, content_type=content_type)
+
+    @retry_on_too_many_requests
+    def create_bytes(
+        self, uri: str, data: bytes, content_type: str | None = None
+    ) -> bool:
+        gcs_path = GCSPath.from_path(uri)
+        blob = self.client.bucket(gcs_path.bucket).blob(gcs_path.blob_path)
+        try:
+            # generation 0は、objectが存在しない場合だけ書き込む条件になる
+            blob.upload_from_string(
+                data, content_type=content_type, if_generation_match=0
+            )
+        except PreconditionFailed:
+            return False
+        return True
 
     def download(
         self,
@@ -218,3 +294,25 @@ class GCSRepository(FileRepositoryInterface):
             overwrite=overwrite,
         )
         return list(destination_paths)
+
+
+def create_storage_client() -> storage.Client:
+    """GCSのclientを作成する
+    gcs_emulator_hostを指定した場合はemulatorに匿名認証で接続する
+    並列に読み書きしてもconnectionを使い回せるようにpoolを広げる
+    """
+    if settings.gcs_emulator_host is not None:
+        client = storage.Client(
+            project="emulator",
+            credentials=AnonymousCredentials(),
+            client_options={"api_endpoint": settings.gcs_emulator_host},
+        )
+    else:
+        client = storage.Client()
+    adapter = HTTPAdapter(
+        pool_connections=settings.gcs_max_pool_connections,
+        pool_maxsize=settings.gcs_max_pool_connections,
+    )
+    client._http.mount("https://", adapter)  # noqa: SLF001
+    client._http.mount("http://", adapter)  # noqa: SLF001
+    return client
@@ -0,0 +1,168 @@
+import shutil
+import uuid
+from os import PathLike
+from pathlib import Path
+
+from segmenter_api.domain.model.errors import BadRequestError, NotFoundError
+from segmenter_api.domain.model.gcs import GCSPath
+from segmenter_api.domain.repository.file import FileRepositoryInterface
+from segmenter_api.settings import get_settings
+from segmenter_api.utils.file import find_common_root
+
+settings = get_settings()
+
+
+class LocalFileRepository(FileRepositoryInterface):
+    """GCSの代わりにローカルのディレクトリを使うrepository
+    root/bucket/pathをgs://bucket/pathとして扱い、GCSなしで動かす場合やテストで使う
+    """
+
+    def __init__(self, root: Path | None = None):
+        self.root = (root or settings.local_storage_root).resolve()
+        self.bucket_name = settings.google_cloud_storage_bucket
+
+    def download(
+        self,
+        source_paths: list[PathLike[str]],
+        destination_paths: list[Path],
+        overwrite: bool = False,
+    ) -> None:
+        if len(source_paths) != len(destination_paths):
+            error_msg = (
+                f"source_paths (長さ: {len(source_paths)})と"
+                f"destination_paths (長さ: {len(destination_paths)})"
+                "の長さが一致しません"
+            )
+            raise ValueError(error_msg)
+        for source_path, destination_path in zip(
+            source_paths, destination_paths, strict=True
+        ):
+            copy(
+                self._local_path(
+                    GCSPath(bucket=self.bucket_name, blob_path=str(source_path))
+                ),
+                destination_path,
+                overwrite=overwrite,
+            )
+
+    def download_to_dir(
+        self,
+        source_paths: list[PathLike[str]],
+        destination_dir: Path,
+        overwrite: bool = False,
+    ) -> list[Path]:
+        common_root = find_common_root([Path(path) for path in source_paths])
+        destination_paths = [
+            destination_dir / Path(path).relative_to(common_root)
+            for path in source_paths
+        ]
+        self.download(source_paths, destination_paths, overwrite)
+        return destination_paths
+
+    def upload(
+        self,
+        source_paths: list[Path],
+        destination_paths: list[PathLike[str]],
+        overwrite: bool = False,
+    ) -> None:
+        if len(source_paths) != len(destination_paths):
+            error_msg = (
+                f"source_paths (長さ: {len(source_paths)})と"
+                f"destination_paths (長さ: {len(destination_paths)})"
+                "の長さが一致しません"
+            )
+            raise ValueError(error_msg)
+        for source_path, destination_path in zip(
+            source_paths, destination_paths, strict=True
+        ):
+            copy(
+                source_path,
+                self._local_path(
+                    GCSPath(bucket=self.bucket_name, blob_path=str(destination_path))
+                ),
+                overwrite=overwrite,
+            )
+
+    def upload_to_dir(
+        self,
+        source_paths: list[Path],
+        destination_dir: PathLike[str],
+        overwrite: bool = False,
+    ) -> list[PathLike[str]]:
+        common_root = find_common_root(source_paths)
+        destination_paths = [
+            Path(destination_dir) / source_path.relative_to(common_root)
+            for source_path in source_paths
+        ]
+        self.upload(
+            source_paths=source_paths,
+            destination_paths=list(destination_paths),
+            overwrite=overwrite,
+        )
+        return list(destination_paths)
+
+    def read_bytes(self, uri: str) -> bytes:
+        path = self._local_path(GCSPath.from_path(uri))
+        if not path.is_file():
+            error_msg = f"{uri}が見つかりません"
+            raise NotFoundError(error_msg)
+        return path.read_bytes()
+
+    def write_bytes(
+        self,
+        uri: str,
+        data: bytes,
+        content_type: str | None = None,  # noqa: ARG002
+    ) -> None:
+        path = self._local_path(GCSPath.from_path(uri))
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # 読み込み中のobjectが途中までの内容にならないようにrenameで置き換える
+        temporary_path = path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+        temporary_path.write_bytes(data)
+        temporary_path.replace(path)
+
+    def create_bytes(
+        self,
+        uri: str,
+        data: bytes,
+        content_type: str | None = None,  # noqa: ARG002
+    ) -> bool:
+        path = self._local_path(GCSPath.from_path(uri))
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temporary_path = path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+        temporary_path.write_bytes(data)
+        # linkは既存のファイルを置き換えないため、同時に作成しても1つだけが成功する
+        try:
+            path.hardlink_to(temporary_path)
+        except FileExistsError:
+            return False
+        finally:
+            temporary_path.unlink()
+        return True
+
+    def _local_path(self, gcs_path: GCSPath) -> Path:
+        path = (self.root / gcs_path.bucket / gcs_path.blob_path).resolve()
+        if not path.is_relative_to(self.root):
+            error_msg = f"{gcs_path}はstorageの外を指しています"
+            raise BadRequestError(error_msg)
+        return path
+
+
+def copy(source_path: Path, destination_path: Path, overwrite: bool) -> None:
+    """ファイルかディレクトリをcopyする。overwriteしない場合は既存のファイルを残す"""
+    if source_path.is_dir():
+        for file_path in source_path.rglob("*"):
+            if file_path.is_file():
+                copy(
+                    file_path,
+                    destination_path / file_path.relative_to(source_path),
+                    overwrite=overwrite,
+                )
+        return
+    if not source_path.exists():
+        error_msg = f"{source_path}が見つかりません"
+        raise NotFoundError(error_msg)
+    if not overwrite and destination_path.exists():
+        return
+    destination_path.parent.mkdir(parents=True, exist_ok=True)
+    shutil.copyfile(source_path, destination_path)
@@ -0,0 +1,103 @@
+from collections.abc import Hashable
+
+from segmenter_api.domain.service.detector import (
+    Detector,
+    DetectorInput,
+    DetectorOutput,
+)
+from segmenter_api.utils.cache import LRUCache
+from segmenter_api.utils.image import image_hash
+
+
+class CachingDetector(Detector):
+    """同じ(画像, texts, detector_type, 検出パラメータ)に対する検出結果をキャッシュする
+    use_cache=Falseの入力はキャッシュを参照・更新せずにdetectorを呼び出す
+    空白だけが異なるtextは同じkeyにし、labelは呼び出し元の表記で返す
+    """
+
+    def __init__(
+        self,
+        detector: Detector,
+        cache: LRUCache[Hashable, DetectorOutput],
+        detector_type: str,
+    ):
+        self.detector = detector
+        self.cache = cache
+        self.detector_type = detector_type
+
+    def detect(self, detector_input: DetectorInput) -> DetectorOutput:
+        return self.detect_batch([detector_input])[0]
+
+    def detect_batch(
+        self, detector_inputs: list[DetectorInput]
+    ) -> list[DetectorOutput]:
+        normalized_inputs = [
+            normalize_texts(detector_input) for detector_input in detector_inputs
+        ]
+        keys = [
+            self._key(detector_input) if detector_input.use_cache else None
+            for detector_input in normalized_inputs
+        ]
+        detector_outputs: dict[int, DetectorOutput] = {}
+        for idx, key in enumerate(keys):
+            cached = self.cache.get(key) if key is not None else None
+            if cached is not None:
+                detector_outputs[idx] = cached
+        missing = [idx for idx in range(len(keys)) if idx not in detector_outputs]
+        if missing:
+            missing_outputs = self.detector.detect_batch(
+                [normalized_inputs[idx] for idx in missing]
+            )
+            if len(missing_outputs) != len(missing):
+                error_msg = (
+                    f"detect_batchの結果の数({len(missing_outputs)})が"
+                    f"入力の数({len(missing)})と一致しません"
+                )
+                raise ValueError(error_msg)
+            for idx, detector_output in zip(missing, missing_outputs, strict=True):
+                key = keys[idx]
+                if key is not None:
+                    self.cache.put(key, detector_output)
+                detector_outputs[idx] = detector_output
+        return [
+            restore_labels(detector_outputs[idx], detector_input)
+            for idx, detector_input in enumerate(detector_inputs)
+        ]
+
+    def _key(self, detector_input: DetectorInput) -> Hashable:
+        return (
+            self.detector_type,
+            image_hash(detector_input.image),
+            tuple(detector_input.texts),
+            detector_input.quality.value,
+            detector_input.box_threshold,
+            detector_input.text_threshold,
+            detector_input.max_detections,
+        )
+
+
+def normalize_text(text: str) -> str:
+    """textの前後と連続する空白を正規化する"""
+    return " ".join(text.split())
+
+
+def normalize_texts(detector_input: DetectorInput) -> DetectorInput:
+    texts = [normalize_text(text) for text in detector_input.texts]
+    if texts == detector_input.texts:
+        return detector_input
+    return detector_input.model_copy(update={"texts": texts})
+
+
+def restore_labels(
+    detector_output: DetectorOutput, detector_input: DetectorInput
+) -> DetectorOutput:
+    """正規化したtextのlabelを、呼び出し元のtextの表記に戻す
+    キャッシュした出力は他の表記のリクエストでも使うため、copyして書き換える
+    """
+    original_texts: dict[str, str] = {}
+    for text in detector_input.texts:
+        original_texts.setdefault(normalize_text(text), text)
+    labels = [original_texts.get(label, label) for label in detector_output.labels]
+    if labels == detector_output.labels:
+        return detector_output
+    return detector_output.model_copy(update={"labels": labels})
@@ -0,0 +1,22 @@
+from segmenter_api.domain.service.detector import (
+    Detector,
+    DetectorInput,
+    DetectorOutput,
+)
+from segmenter_api.infra.service.runtime.model_executor import ModelExecutor
+
+
+class ConcurrencyLimitedDetector(Detector):
+    """detectorの呼び出しをモデル専用のModelExecutorで実行する"""
+
+    def __init__(self, detector: Detector, executor: ModelExecutor):
+        self.detector = detector
+        self.executor = executor
+
+    def detect(self, detector_input: DetectorInput) -> DetectorOutput:
+        return self.executor.run(self.detector.detect, detector_input)
+
+    def detect_batch(
+        self, detector_inputs: list[DetectorInput]
+    ) -> list[DetectorOutput]:
+        return self.executor.run(self.detector.detect_batch, detector_inputs)
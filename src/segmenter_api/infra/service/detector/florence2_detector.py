@@ -1,26 +1,127 @@
+import time
 import traceback
-from typing import Literal
+from typing import Any, Literal, cast
 
 import torch
 from injector import inject
 from PIL import Image
+from pydantic import BaseModel
 from transformers.models.auto.modeling_auto import AutoModelForCausalLM
 from transformers.models.auto.processing_auto import AutoProcessor
 
 from segmenter_api.domain.repository.file import FileRepositoryInterface
 from segmenter_api.domain.service.detector import (
+    DetectionQuality,
     Detector,
     DetectorInput,
     DetectorOutput,
 )
+from segmenter_api.infra.service.runtime.torch_runtime import TorchRuntime
 from segmenter_api.settings import get_settings
+from segmenter_api.utils.cache import LRUCache
+from segmenter_api.utils.image import ensure_rgb, image_hash
 from segmenter_api.utils.logger import get_logger
+from segmenter_api.utils.metrics import get_metrics
 from segmenter_api.utils.time import stop_watch
 
 logger = get_logger(__name__)
 
 settings = get_settings()
 
+# 1つのbboxの出力に必要なlocation tokenの数
+LOCATION_TOKENS_PER_BOX = 4
+
+
+class DecodingProfile(BaseModel):
+    """generateのdecoding設定
+    max_boxesを指定した場合、text毎のbbox数の上限からtoken budgetを決める
+    """
+
+    num_beams: int
+    max_boxes: int | None
+    max_new_tokens: int = 1024
+
+
+DECODING_PROFILES: dict[DetectionQuality, DecodingProfile] = {
+    DetectionQuality.FAST: DecodingProfile(num_beams=1, max_boxes=10),
+    DetectionQuality.BALANCED: DecodingProfile(num_beams=2, max_boxes=30),
+    DetectionQuality.ACCURATE: DecodingProfile(num_beams=3, max_boxes=None),
+}
+
+
+class Florence2Model:
+    """trust_remote_codeで読み込んだFlorence2のmodelとprocessorを型付きで呼び出す
+    AutoModelForCausalLMとAutoProcessorの型にはFlorence2独自のmethodがないため、
+    Anyとして扱うのはこのclassの中だけにする
+    _encode_image等のprivate APIはtransformers 4.51.2で読み込む
+    microsoft/Florence-2-{base,large}のmodeling_florence2.pyと
+    processing_florence2.pyの実装に依存するため、更新時は動作を確認する
+    """
+
+    def __init__(self, model: object, processor: object) -> None:
+        self._model = cast(Any, model)
+        self._processor = cast(Any, processor)
+
+    @property
+    def module(self) -> torch.nn.Module:
+        return cast(torch.nn.Module, self._model)
+
+    @property
+    def eos_token_id(self) -> int:
+        return cast(int, self._processor.tokenizer.eos_token_id)
+
+    def preprocess_images(self, images: list[Image.Image]) -> torch.Tensor:
+        return cast(
+            torch.Tensor,
+            self._processor.image_processor(images, return_tensors="pt")[
+                "pixel_values"
+            ],
+        )
+
+    def encode_images(self, pixel_values: torch.Tensor) -> torch.Tensor:
+        """vision towerと射影で、言語モデルに入力する画像のembeddingを求める"""
+        return cast(torch.Tensor, self._model._encode_image(pixel_values))  # noqa: SLF001
+
+    def construct_prompts(self, texts: list[str]) -> list[str]:
+        """task tokenを含むtextを、言語モデルに入力するpromptに変換する"""
+        return cast(list[str], self._processor._construct_prompts(texts))  # noqa: SLF001
+
+    def count_tokens(self, text: str) -> int:
+        return len(
+            self._processor.tokenizer(text, add_special_tokens=False)["input_ids"]
+        )
+
+    def tokenize(
+        self, prompts: list[str], device: torch.device
+    ) -> tuple[torch.Tensor, torch.Tensor]:
+        """promptをpaddingしてtokenizeし、(input_ids, attention_mask)を返す"""
+        tokenized = self._processor.tokenizer(
+            prompts, return_tensors="pt", padding=True
+        ).to(device)
+        return tokenized["input_ids"], tokenized["attention_mask"]
+
+    def embed_tokens(self, input_ids: torch.Tensor) -> torch.Tensor:
+        return cast(torch.Tensor, self._model.get_input_embeddings()(input_ids))
+
+    def generate(self, **kwargs: Any) -> torch.Tensor:
+        return cast(torch.Tensor, self._model.generate(**kwargs))
+
+    def batch_decode(self, generated_ids: torch.Tensor) -> list[str]:
+        return cast(
+            list[str],
+            self._processor.batch_decode(generated_ids, skip_special_tokens=False),
+        )
+
+    def post_process_generation(
+        self, text: str, task: str, image_size: tuple[int, int]
+    ) -> dict[str, Any]:
+        return cast(
+            dict[str, Any],
+            self._processor.post_process_generation(
+                text, task=task, image_size=image_size
+            ),
+        )
+
 
 class Florence2Detector(Detector):
     @stop_watch
@@ -29,26 +130,35 @@ class Florence2Detector(Detector):
         self,
         file_repository: FileRepositoryInterface,
         model_type: Literal["base", "large"],
+        runtime: TorchRuntime,
+        feature_cache: LRUCache[tuple[str, str], torch.Tensor] | None = None,
     ):
         self.file_repository = file_repository
-        self.device = "cuda" if torch.cuda.is_available() else "cpu"
-        self.torch_dtype = torch.float16 if torch.cuda.is_available() else torch.float32
-        self.model, self.processor = self._load_model(model_type)
+        self.runtime = runtime
+        self.model_type = model_type
+        # 画像のvision特徴量のキャッシュ。key: (画像のcontent hash, model_type)
+        self.feature_cache = (
+            feature_cache
+            if feature_cache is not None
+            else create_feature_cache(settings.florence2_feature_cache_max_bytes)
+        )
+        self.device = runtime.device
+        self.torch_dtype = runtime.dtype
+        self.model = self._load_model(model_type)
+        runtime.register(self.model.module)
         self.task_prompt = "<OPEN_VOCABULARY_DETECTION>"
 
-    def _load_model(
-        self, model_type: Literal["base", "large"]
-    ) -> tuple[AutoModelForCausalLM, AutoProcessor]:
-        def _load_model_from_path(
-            path: str,
-        ) -> tuple[AutoModelForCausalLM, AutoProcessor]:
+    def _load_model(self, model_type: Literal["base", "large"]) -> Florence2Model:
+        def _load_model_from_path(path: str) -> Florence2Model:
             model = AutoModelForCausalLM.from_pretrained(
                 path,
                 torch_dtype=self.torch_dtype,
                 trust_remote_code=True,
-            ).to(self.device)
+            )
             processor = AutoProcessor.from_pretrained(path, trust_remote_code=True)
-            return model, processor
+            florence2_model = Florence2Model(model, processor)
+            florence2_model.module.to(self.device)
+            return florence2_model
 
         match model_type:
             case "base":
@@ -74,47 +184,190 @@ class Florence2Detector(Detector):
 
     @stop_watch
     def detect(self, detector_input: DetectorInput) -> DetectorOutput:
+        return self.detect_batch([detector_input])[0]
+
+    @stop_watch
+    def detect_batch(
+        self, detector_inputs: list[DetectorInput]
+    ) -> list[DetectorOutput]:
+        """複数のDetectorInputのpromptをまとめてgenerateする
+        全てのpromptを(入力, text)の組に展開し、同じqualityの組を1つのbatchにする
+        """
         # 前処理
-        image = detector_input.image.convert("RGB")
-        labels: list[str] = []
-        bboxes: list[tuple[float, float, float, float]] = []
-        for text in detector_input.texts:
-            _bboxes = self._detect(text=text, image=image)
-            labels += [text] * len(_bboxes)
-            bboxes += _bboxes
-        return DetectorOutput(labels=labels, bboxes=bboxes)
+        # decode時にRGBにしてあるため、RGBの画像はcopyせずにそのまま使う
+        images = [
+            ensure_rgb(detector_input.image) for detector_input in detector_inputs
+        ]
+        # textのない入力の画像はencodeしない
+        active_indices = [
+            idx
+            for idx, detector_input in enumerate(detector_inputs)
+            if detector_input.texts
+        ]
+        image_features = dict(
+            zip(
+                active_indices,
+                self._encode_images([images[idx] for idx in active_indices]),
+                strict=True,
+            )
+        )
+        results: list[list[list[tuple[float, float, float, float]]]] = [
+            [[] for _ in detector_input.texts] for detector_input in detector_inputs
+        ]
+        qualities = dict.fromkeys(
+            detector_input.quality for detector_input in detector_inputs
+        )
+        for quality in qualities:
+            started_at = time.perf_counter()
+            profile = DECODING_PROFILES[quality]
+            pairs = [
+                (input_idx, text_idx)
+                for input_idx, detector_input in enumerate(detector_inputs)
+                if detector_input.quality == quality
+                for text_idx in range(len(detector_input.texts))
+            ]
+            # 全てのpromptを1回のgenerateでまとめて処理する(メモリ保護のためchunk分割)
+            batch_size = settings.florence2_max_batch_size
+            for start in range(0, len(pairs), batch_size):
+                chunk = pairs[start : start + batch_size]
+                bboxes_list = self._detect(
+                    texts=[detector_inputs[i].texts[j] for i, j in chunk],
+                    image_features=[image_features[i] for i, _ in chunk],
+                    image_sizes=[images[i].size for i, _ in chunk],
+                    profile=profile,
+                )
+                for (i, j), bboxes in zip(chunk, bboxes_list, strict=True):
+                    results[i][j] = bboxes
+            # tier毎のlatencyを記録し、デフォルトのtierを決める材料にする
+            get_metrics().observe(
+                f"florence2_{self.model_type}.detect.{quality.value}",
+                time.perf_counter() - started_at,
+            )
+
+        detector_outputs: list[DetectorOutput] = []
+        for detector_input, bboxes_per_text in zip(
+            detector_inputs, results, strict=True
+        ):
+            labels: list[str] = []
+            output_bboxes: list[tuple[float, float, float, float]] = []
+            for text, text_bboxes in zip(
+                detector_input.texts, bboxes_per_text, strict=True
+            ):
+                labels += [text] * len(text_bboxes)
+                output_bboxes += text_bboxes
+            detector_outputs.append(DetectorOutput(labels=labels, bboxes=output_bboxes))
+        return detector_outputs
+
+    def _encode_images(self, images: list[Image.Image]) -> list[torch.Tensor]:
+        """画像をvision towerでencodeし、言語モデルに入力する特徴量を返す
+        同じ画像の特徴量はfeature_cacheから再利用し、
+        キャッシュにない画像はまとめて1回のforwardでencodeする
+        """
+        keys = [(image_hash(image), self.model_type) for image in images]
+        image_features: dict[tuple[str, str], torch.Tensor] = {}
+        for key in keys:
+            cached = self.feature_cache.get(key)
+            if cached is not None:
+                image_features[key] = cached
+        missing = {
+            key: image
+            for key, image in zip(keys, images, strict=True)
+            if key not in image_features
+        }
+        if missing:
+            # 個別にキャッシュできるようにbatchの特徴量をcopyして分割する
+            pixel_values = self.model.preprocess_images(list(missing.values())).to(
+                self.device, self.torch_dtype
+            )
+            with self.runtime.inference():
+                encoded = self.model.encode_images(pixel_values)
+            for key, batch_features in zip(missing, encoded.split(1), strict=True):
+                features = batch_features.clone()
+                self.feature_cache.put(key, features)
+                image_features[key] = features
+        return [image_features[key] for key in keys]
+
+    def _max_new_tokens(self, texts: list[str], profile: DecodingProfile) -> int:
+        """bbox数の上限から生成token数の上限を決める
+        1つのbboxはlabelのtokenとlocation tokenで表現される
+        """
+        if profile.max_boxes is None:
+            return profile.max_new_tokens
+        label_tokens = max(self.model.count_tokens(text) for text in texts)
+        # bos/eosの分を加える
+        budget = profile.max_boxes * (label_tokens + LOCATION_TOKENS_PER_BOX) + 2
+        return min(budget, profile.max_new_tokens)
 
     def _detect(
-        self, text: str, image: Image.Image
-    ) -> list[tuple[float, float, float, float]]:
-        prompt = f"{self.task_prompt}{text}"
-        encoded = self.processor(
-            text=prompt,
-            images=image,
-            return_tensors="pt",
-        ).to(self.device, self.torch_dtype)
+        self,
+        texts: list[str],
+        image_features: list[torch.Tensor],
+        image_sizes: list[tuple[int, int]],
+        profile: DecodingProfile,
+    ) -> list[list[tuple[float, float, float, float]]]:
+        """複数のtextに対するdetectionを1回のgenerateで行う
+        Args:
+            texts: 検出対象のtextのリスト
+            image_features: textと同じ順序の、各textに対応する画像の特徴量
+            image_sizes: textと同じ順序の、各textに対応する画像のサイズ
+            profile: decoding設定
+        Returns:
+            textsと同じ順序の、text毎のbboxのリスト
+        """
+        prompts = self.model.construct_prompts(
+            [f"{self.task_prompt}{text}" for text in texts]
+        )
+        input_ids, text_attention_mask = self.model.tokenize(prompts, self.device)
 
         # 本処理
-        generated_ids = self.model.generate(
-            input_ids=encoded["input_ids"],
-            pixel_values=encoded["pixel_values"],
-            # max_new_tokens=4096,
-            max_new_tokens=1024,
-            num_beams=3,
-            # do_sample=False,
-        )
+        with self.runtime.inference():
+            # encode済みの画像特徴量を使い、vision towerを再実行しない
+            image_embeds = torch.cat(image_features)
+            text_embeds = self.model.embed_tokens(input_ids)
+            inputs_embeds = torch.cat([image_embeds, text_embeds], dim=1)
+            attention_mask = torch.cat(
+                [
+                    torch.ones(
+                        image_embeds.shape[:2],
+                        dtype=text_attention_mask.dtype,
+                        device=self.device,
+                    ),
+                    text_attention_mask,
+                ],
+                dim=1,
+            )
+            generated_ids = self.model.generate(
+                input_ids=None,
+                inputs_embeds=inputs_embeds,
+                attention_mask=attention_mask,
+                max_new_tokens=self._max_new_tokens(texts=texts, profile=profile),
+                num_beams=profile.num_beams,
+                do_sample=False,
+                # 閉じtokenを出力した時点で生成を打ち切る
+                eos_token_id=self.model.eos_token_id,
+                early_stopping=profile.num_beams > 1,
+            )
 
         # decode
-        generated_text = self.processor.batch_decode(
-            generated_ids, skip_special_tokens=False
-        )[0]
+        generated_texts = self.model.batch_decode(generated_ids)
 
         # 後処理
-        parsed_answer = self.processor.post_process_generation(
-            generated_text,
-            task=self.task_prompt,
-            image_size=image.size,
-        )
-        bboxes = parsed_answer["<OPEN_VOCABULARY_DETECTION>"]["bboxes"]
-        bboxes_tuple = [tuple(bbox) for bbox in bboxes]
-        return bboxes_tuple
+        bboxes_list: list[list[tuple[float, float, float, float]]] = []
+        for generated_text, image_size in zip(
+            generated_texts, image_sizes, strict=True
+        ):
+            parsed_answer = self.model.post_process_generation(
+                generated_text,
+                task=self.task_prompt,
+                image_size=image_size,
+            )
+            bboxes = parsed_answer[self.task_prompt]["bboxes"]
+            bboxes_list.append([tuple(bbox) for bbox in bboxes])
+        return bboxes_list
+
+
+def create_feature_cache(max_bytes: int) -> LRUCache[tuple[str, str], torch.Tensor]:
+    return LRUCache(
+        max_bytes=max_bytes,
+        sizeof=lambda tensor: tensor.element_size() * tensor.nelement(),
+    )
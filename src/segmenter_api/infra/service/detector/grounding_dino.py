@@ -1,44 +1,313 @@
+import hashlib
+from pathlib import Path
+from typing import cast
+
 import torch
+from injector import inject
+from PIL import Image
+from transformers.modeling_outputs import BaseModelOutput
 from transformers.models.auto.modeling_auto import AutoModelForZeroShotObjectDetection
 from transformers.models.auto.processing_auto import AutoProcessor
+from transformers.models.grounding_dino.modeling_grounding_dino import (
+    GroundingDinoObjectDetectionOutput,
+    generate_masks_with_special_tokens_and_transfer_map,
+)
 
 from segmenter_api.domain.service.detector import (
     Detector,
     DetectorInput,
     DetectorOutput,
 )
+from segmenter_api.infra.service.runtime.torch_runtime import TorchRuntime
+from segmenter_api.settings import get_settings
+from segmenter_api.utils.cache import LRUCache
+from segmenter_api.utils.image import ensure_rgb
+from segmenter_api.utils.logger import get_logger
+from segmenter_api.utils.metrics import get_metrics
+from segmenter_api.utils.time import stop_watch
+
+logger = get_logger(__name__)
+
+settings = get_settings()
+
+DEFAULT_BOX_THRESHOLD = 0.4
+DEFAULT_TEXT_THRESHOLD = 0.3
 
 
 class GroundingDinoDetector(Detector):
-    def __init__(self):
+    @inject
+    def __init__(self, runtime: TorchRuntime):
         model_id = "IDEA-Research/grounding-dino-base"
-        self.device = "cuda"
+        self.runtime = runtime
+        self.device = runtime.device
         self.processor = AutoProcessor.from_pretrained(model_id)
+        # fp16の重みでは精度が落ちるため、重みはfp32のままautocastで推論する
         self.model = AutoModelForZeroShotObjectDetection.from_pretrained(model_id).to(
             self.device
         )
+        self.model.eval()
+        runtime.register(self.model)
+        # text backbone(BERT)の出力をprompt毎にキャッシュし、
+        # forwardでは画像特徴量とcross-modal fusionだけを計算する
+        self.text_feature_cache: LRUCache[str, torch.Tensor] = LRUCache(
+            max_items=settings.grounding_dino_text_cache_max_items
+        )
+        self.model.model.text_backbone = CachedTextBackbone(
+            text_backbone=self.model.model.text_backbone,
+            cache=self.text_feature_cache,
+            pad_token_id=self.processor.tokenizer.pad_token_id,
+        )
+        get_metrics().register_collector(
+            "grounding_dino_text_cache", self.text_feature_cache.stats
+        )
+        if settings.grounding_dino_vocabulary_path is not None:
+            self.warm_up(load_vocabulary(settings.grounding_dino_vocabulary_path))
+
+    @stop_watch
+    def warm_up(self, prompt_sets: list[list[str]]) -> None:
+        """prompt setのtext backbone出力を事前に計算してキャッシュする"""
+        if not prompt_sets:
+            return
+        tokenized = self.processor.tokenizer(
+            [build_prompt(texts) for texts in prompt_sets],
+            padding=True,
+            return_tensors="pt",
+        ).to(self.device)
+        input_ids = tokenized["input_ids"]
+        text_self_attention_masks, position_ids = (
+            generate_masks_with_special_tokens_and_transfer_map(input_ids)
+        )
+        # GroundingDinoModel.forwardと同じ長さに切り詰める
+        max_text_len = self.model.config.max_text_len
+        with self.runtime.inference(mixed_precision=True):
+            self.model.model.text_backbone(
+                input_ids[:, :max_text_len],
+                text_self_attention_masks[:, None, :max_text_len, :max_text_len],
+                tokenized["token_type_ids"][:, :max_text_len],
+                position_ids[:, :max_text_len],
+                return_dict=True,
+            )
+        logger.info(f"{len(prompt_sets)}件のprompt setでtext cacheをwarm upしました")
 
     def detect(self, detector_input: DetectorInput) -> DetectorOutput:
+        return self.detect_batch([detector_input])[0]
+
+    @stop_watch
+    def detect_batch(
+        self, detector_inputs: list[DetectorInput]
+    ) -> list[DetectorOutput]:
+        """複数の画像を1回のforwardで処理する
+        閾値とbbox数の上限は入力毎に適用する
+        """
+        detector_outputs = [
+            DetectorOutput(labels=[], bboxes=[]) for _ in detector_inputs
+        ]
+        # textのない入力はforwardに含めない
+        active_indices = [
+            idx
+            for idx, detector_input in enumerate(detector_inputs)
+            if detector_input.texts
+        ]
+        if active_indices:
+            for idx, detector_output in zip(
+                active_indices,
+                self._detect([detector_inputs[idx] for idx in active_indices]),
+                strict=True,
+            ):
+                detector_outputs[idx] = detector_output
+        return detector_outputs
+
+    def _detect(self, detector_inputs: list[DetectorInput]) -> list[DetectorOutput]:
+        # decode時にRGBにしてあるため、RGBの画像はcopyせずにそのまま使う
+        images = [
+            ensure_rgb(detector_input.image) for detector_input in detector_inputs
+        ]
         inputs = self.processor(
-            images=detector_input.image,
-            text=detector_input.texts,
+            images=images,
+            text=[
+                build_prompt(detector_input.texts) for detector_input in detector_inputs
+            ],
+            padding=True,
             return_tensors="pt",
         ).to(self.device)
-        with torch.no_grad():
+        with self.runtime.inference(mixed_precision=True):
             outputs = self.model(**inputs)
+        logits: torch.Tensor = outputs.logits
+        pred_boxes: torch.Tensor = outputs.pred_boxes
 
-        results = self.processor.post_process_grounded_object_detection(
-            outputs,
-            inputs.input_ids,
-            box_threshold=0.4,
-            text_threshold=0.3,
-            target_sizes=[detector_input.image.size[::-1]],
-        )
+        detector_outputs: list[DetectorOutput] = []
+        for idx, (detector_input, image) in enumerate(
+            zip(detector_inputs, images, strict=True)
+        ):
+            detector_outputs.append(
+                self._post_process(
+                    logits=logits[idx : idx + 1],
+                    pred_boxes=pred_boxes[idx : idx + 1],
+                    input_ids=inputs.input_ids[idx : idx + 1],
+                    detector_input=detector_input,
+                    image=image,
+                )
+            )
+        return detector_outputs
 
-        result = results[0]
-        labels = result["labels"]
-        bboxes = result["boxes"].tolist()
+    def _post_process(
+        self,
+        logits: torch.Tensor,
+        pred_boxes: torch.Tensor,
+        input_ids: torch.Tensor,
+        detector_input: DetectorInput,
+        image: Image.Image,
+    ) -> DetectorOutput:
+        """batchから切り出した1枚の画像の出力を、その入力の閾値で後処理する"""
+        result = self.processor.post_process_grounded_object_detection(
+            GroundingDinoObjectDetectionOutput(
+                logits=cast(torch.FloatTensor, logits.float()),
+                pred_boxes=cast(torch.FloatTensor, pred_boxes.float()),
+            ),
+            input_ids,
+            threshold=(
+                detector_input.box_threshold
+                if detector_input.box_threshold is not None
+                else DEFAULT_BOX_THRESHOLD
+            ),
+            text_threshold=(
+                detector_input.text_threshold
+                if detector_input.text_threshold is not None
+                else DEFAULT_TEXT_THRESHOLD
+            ),
+            target_sizes=[image.size[::-1]],
+        )[0]
+        # scoreの高い順にmax_detections件まで残す
+        order = torch.argsort(result["scores"], descending=True)
+        if detector_input.max_detections is not None:
+            order = order[: detector_input.max_detections]
+        # promptは正規化したtextから作るため、検出したphraseを呼び出し元のtextに戻す
+        labels = [
+            restore_label(phrase, detector_input.texts)
+            for phrase in result["text_labels"]
+        ]
+        bboxes = result["boxes"]
         return DetectorOutput(
-            labels=labels,
-            bboxes=bboxes,
+            labels=[labels[i] for i in order.tolist()],
+            bboxes=[tuple(bbox) for bbox in bboxes[order].tolist()],
         )
+
+
+class CachedTextBackbone(torch.nn.Module):
+    """GroundingDINOのtext backboneの出力をprompt毎にキャッシュする
+    batchの各行をpadding前のtoken列とattention maskをkeyにキャッシュし、
+    キャッシュにない行だけをbackboneで計算する
+    paddingのtokenは自分自身にしかattendしないため、各行の出力はpaddingの長さに依存しない
+    """
+
+    def __init__(
+        self,
+        text_backbone: torch.nn.Module,
+        cache: LRUCache[str, torch.Tensor],
+        pad_token_id: int,
+    ):
+        super().__init__()
+        self.text_backbone = text_backbone
+        self.cache = cache
+        self.pad_token_id = pad_token_id
+
+    def forward(
+        self,
+        input_ids: torch.Tensor,
+        attention_mask: torch.Tensor,
+        token_type_ids: torch.Tensor,
+        position_ids: torch.Tensor,
+        return_dict: bool | None = None,
+    ) -> BaseModelOutput | tuple[torch.Tensor]:
+        lengths = (input_ids != self.pad_token_id).sum(dim=1).tolist()
+        keys = [
+            self._key(
+                input_ids[idx, :length],
+                attention_mask[idx, ..., :length, :length],
+                position_ids[idx, :length],
+            )
+            for idx, length in enumerate(lengths)
+        ]
+        hidden_states: list[torch.Tensor | None] = [self.cache.get(key) for key in keys]
+        missing = [idx for idx, hidden in enumerate(hidden_states) if hidden is None]
+        if missing:
+            outputs = self.text_backbone(
+                input_ids[missing],
+                attention_mask[missing],
+                token_type_ids[missing],
+                position_ids[missing],
+                return_dict=True,
+            )
+            for row, idx in enumerate(missing):
+                hidden = outputs.last_hidden_state[row, : lengths[idx]].clone()
+                self.cache.put(keys[idx], hidden)
+                hidden_states[idx] = hidden
+
+        # paddingの位置は後段でmaskされるため0で埋める
+        first = next(hidden for hidden in hidden_states if hidden is not None)
+        last_hidden_state = first.new_zeros(
+            (input_ids.shape[0], input_ids.shape[1], first.shape[-1])
+        )
+        for idx, hidden in enumerate(hidden_states):
+            assert hidden is not None
+            last_hidden_state[idx, : lengths[idx]] = hidden
+        if return_dict is False:
+            return (last_hidden_state,)
+        return BaseModelOutput(
+            last_hidden_state=cast(torch.FloatTensor, last_hidden_state)
+        )
+
+    @staticmethod
+    def _key(
+        input_ids: torch.Tensor,
+        attention_mask: torch.Tensor,
+        position_ids: torch.Tensor,
+    ) -> str:
+        hasher = hashlib.blake2b(digest_size=16)
+        for tensor in (input_ids, attention_mask, position_ids):
+            hasher.update(tensor.cpu().numpy().tobytes())
+        return hasher.hexdigest()
+
+
+def build_prompt(texts: list[str]) -> str:
+    """GroundingDINOの入力形式("a cat. a dog.")にtextを結合する
+    同じprompt setが同じtoken列になるよう、正規化・重複除去・ソートしてから結合する
+    """
+    normalized = sorted({text.strip().lower() for text in texts})
+    return ". ".join(normalized) + "."
+
+
+def restore_label(phrase: str, texts: list[str]) -> str:
+    """検出したphraseに対応する呼び出し元のtextを返す
+    phraseはtokenizerでdecodeした小文字のtoken列で、空白の位置が変わることがある
+    ("t-shirt"が"t - shirt"になる等)ため、小文字にして空白を除いて比較する
+    textの一部だけが閾値を超えた場合はphraseを含むtextを、
+    隣り合うtextがまとめて検出された場合はphraseに含まれる最初のtextを返す
+    """
+    key = compact(phrase)
+    for matches in (
+        lambda text: compact(text) == key,
+        lambda text: key in compact(text),
+        lambda text: compact(text) in key,
+    ):
+        for text in texts:
+            if key and compact(text) and matches(text):
+                return text
+    return phrase
+
+
+def compact(text: str) -> str:
+    return "".join(text.lower().split())
+
+
+def load_vocabulary(path: Path) -> list[list[str]]:
+    """vocabularyファイルを読み込む
+    1行が1つのprompt setで、textはカンマ区切り。空行と#で始まる行は無視する
+    """
+    prompt_sets: list[list[str]] = []
+    for raw_line in path.read_text().splitlines():
+        line = raw_line.strip()
+        if not line or line.startswith("#"):
+            continue
+        prompt_sets.append([text for text in line.split(",") if text.strip()])
+    return prompt_sets
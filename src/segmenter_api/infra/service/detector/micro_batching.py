@@ -0,0 +1,111 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from segmenter_api.domain.service.detector import (
+    Detector,
+    DetectorInput,
+    DetectorOutput,
+)
+from segmenter_api.utils.logger import get_logger
+from segmenter_api.utils.metrics import get_metrics
+
+logger = get_logger(__name__)
+
+
+class MicroBatchingDetector(Detector):
+    """複数リクエストのdetectを短い時間窓でまとめ、detect_batchで一括処理する
+    最初のリクエストの到着からmax_wait_msの間に届いたリクエストを
+    最大max_batch_size件まで1つのbatchにまとめ、結果を各呼び出し元に返す
+    """
+
+    def __init__(
+        self,
+        detector: Detector,
+        max_batch_size: int,
+        max_wait_ms: float,
+        name: str = "detector",
+    ):
+        self.detector = detector
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.name = name
+        self._queue: queue.Queue[
+            tuple[DetectorInput, Future[DetectorOutput], float]
+        ] = queue.Queue()
+        self._lock = threading.Lock()
+        self._worker: threading.Thread | None = None
+
+    def detect(self, detector_input: DetectorInput) -> DetectorOutput:
+        return self._submit(detector_input).result()
+
+    def detect_batch(
+        self, detector_inputs: list[DetectorInput]
+    ) -> list[DetectorOutput]:
+        futures = [self._submit(detector_input) for detector_input in detector_inputs]
+        return [future.result() for future in futures]
+
+    def _submit(self, detector_input: DetectorInput) -> Future[DetectorOutput]:
+        self._ensure_worker()
+        future: Future[DetectorOutput] = Future()
+        self._queue.put((detector_input, future, time.perf_counter()))
+        return future
+
+    def _ensure_worker(self) -> None:
+        # workerは最初のリクエスト時に起動する
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(
+                    target=self._run,
+                    name=f"micro-batching-{self.name}",
+                    daemon=True,
+                )
+                self._worker.start()
+
+    def _run(self) -> None:
+        while True:
+            self._process(self._collect())
+
+    def _collect(self) -> list[tuple[DetectorInput, Future[DetectorOutput], float]]:
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.perf_counter()
+            try:
+                # 待ち時間を過ぎても、既にqueueにあるリクエストはbatchに含める
+                batch.append(self._queue.get(timeout=max(timeout, 0)))
+            except queue.Empty:
+                break
+        return batch
+
+    def _process(
+        self, batch: list[tuple[DetectorInput, Future[DetectorOutput], float]]
+    ) -> None:
+        started_at = time.perf_counter()
+        metrics = get_metrics()
+        metrics.observe(f"micro_batching.{self.name}.batch_size", len(batch))
+        for _, _, enqueued_at in batch:
+            metrics.observe(
+                f"micro_batching.{self.name}.wait_seconds", started_at - enqueued_at
+            )
+        try:
+            detector_outputs = self.detector.detect_batch(
+                [detector_input for detector_input, _, _ in batch]
+            )
+            # 結果の数が合わない場合もworkerを止めず、batchの全リクエストを失敗にする
+            if len(detector_outputs) != len(batch):
+                error_msg = (
+                    f"detect_batchの結果の数({len(detector_outputs)})が"
+                    f"入力の数({len(batch)})と一致しません"
+                )
+                raise ValueError(error_msg)
+        except Exception as e:  # noqa: BLE001
+            logger.warning(f"batch処理に失敗しました: {e}")
+            for _, future, _ in batch:
+                future.set_exception(e)
+            return
+        for (_, future, _), detector_output in zip(
+            batch, detector_outputs, strict=True
+        ):
+            future.set_result(detector_output)
@@ -0,0 +1,124 @@
+import math
+import os
+import threading
+import time
+import weakref
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, TypeVar
+
+from segmenter_api.domain.model.errors import TooManyRequestsError
+from segmenter_api.utils.metrics import get_metrics
+
+T = TypeVar("T")
+
+# 推論時間の移動平均(EWMA)で直近の値にかける重み
+LATENCY_SMOOTHING = 0.2
+
+
+# fork後にthread poolを作り直すため、作成したexecutorを弱参照で保持する
+_executors: weakref.WeakSet["ModelExecutor"] = weakref.WeakSet()
+
+
+def _reset_executors_after_fork() -> None:
+    for executor in list(_executors):
+        executor.reset()
+
+
+os.register_at_fork(after_in_child=_reset_executors_after_fork)
+
+
+class ModelExecutor:
+    """1つのモデルの推論を専用のthread poolで実行する
+    同時に推論するのはmax_concurrency件までで、空きを待てるのはmax_queue_size件まで
+    それを超えたリクエストは待たせずにTooManyRequestsErrorで断る
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_concurrency: int,
+        max_queue_size: int,
+        min_retry_after_seconds: int = 1,
+    ):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_queue_size = max_queue_size
+        self.min_retry_after_seconds = min_retry_after_seconds
+        self.reset()
+        _executors.add(self)
+
+    def reset(self) -> None:
+        """thread poolと待ち行列を作り直す
+        fork後の子プロセスには親のthreadが存在しないため、fork時に呼び出される
+        """
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.max_concurrency, thread_name_prefix=f"model-{self.name}"
+        )
+        self._lock = threading.Lock()
+        # 受け付けてまだ終わっていないリクエスト数と、そのうち実行中の数
+        self._pending = 0
+        self._running = 0
+        self._latency_seconds: float | None = None
+
+    def run(self, fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        with self._lock:
+            if self._pending >= self.max_concurrency + self.max_queue_size:
+                retry_after = self._retry_after()
+                admitted = False
+            else:
+                self._pending += 1
+                admitted = True
+        if not admitted:
+            get_metrics().increment(f"model_executor.{self.name}.rejected")
+            error_msg = (
+                f"{self.name}の待ち行列が一杯です。"
+                f"{retry_after}秒後に再試行してください"
+            )
+            raise TooManyRequestsError(error_msg, retry_after=retry_after)
+        future = self._executor.submit(
+            self._execute, time.perf_counter(), fn, *args, **kwargs
+        )
+        return future.result()
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "running": self._running,
+                "queued": self._pending - self._running,
+                "max_concurrency": self.max_concurrency,
+                "max_queue_size": self.max_queue_size,
+                "latency_seconds": self._latency_seconds,
+            }
+
+    def _execute(
+        self, enqueued_at: float, fn: Callable[..., T], *args: Any, **kwargs: Any
+    ) -> T:
+        started_at = time.perf_counter()
+        with self._lock:
+            self._running += 1
+        metrics = get_metrics()
+        metrics.observe(
+            f"model_executor.{self.name}.wait_seconds", started_at - enqueued_at
+        )
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            latency = time.perf_counter() - started_at
+            with self._lock:
+                self._running -= 1
+                self._pending -= 1
+                self._latency_seconds = (
+                    latency
+                    if self._latency_seconds is None
+                    else LATENCY_SMOOTHING * latency
+                    + (1 - LATENCY_SMOOTHING) * self._latency_seconds
+                )
+            metrics.observe(f"model_executor.{self.name}.latency", latency)
+
+    def _retry_after(self) -> int:
+        """待ち行列が1件分空くまでの見込み時間(秒)。lockを取った状態で呼ぶ"""
+        if self._latency_seconds is None:
+            return self.min_retry_after_seconds
+        estimate = self._latency_seconds * self._pending / self.max_concurrency
+        return max(self.min_retry_after_seconds, math.ceil(estimate))
@@ -0,0 +1,128 @@
+from collections.abc import Iterator
+from contextlib import contextmanager, nullcontext
+
+import torch
+
+from segmenter_api.settings import get_settings
+from segmenter_api.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+settings = get_settings()
+
+# 共有メモリ上の各tensorの先頭の境界(byte)
+ALIGNMENT = 64
+
+
+class TorchRuntime:
+    """全モデルで共有するdeviceとdtypeの設定
+    CUDAがあれば重みをfp16で、なければfp32で持ち、
+    CPUでbf16に対応していればautocastでbf16の演算を使う
+    """
+
+    def __init__(
+        self,
+        device: str = settings.torch_device,
+        cpu_autocast: bool = settings.torch_cpu_autocast,
+    ):
+        self.device = resolve_device(device)
+        if self.is_cuda:
+            # 重みをfp16にキャストするモデルの重みのdtype
+            self.dtype = torch.float16
+            # fp32の重みのまま混合精度で推論するモデルのautocastのdtype
+            self.autocast_dtype: torch.dtype | None = torch.bfloat16
+        else:
+            self.dtype = torch.float32
+            self.autocast_dtype = (
+                torch.bfloat16 if cpu_autocast and is_cpu_bf16_supported() else None
+            )
+        logger.info(
+            f"TorchRuntime: device={self.device}, dtype={self.dtype}, "
+            f"autocast_dtype={self.autocast_dtype}"
+        )
+        # 読み込んだモデル。preload時にweightを共有メモリに移すために保持する
+        self.modules: list[torch.nn.Module] = []
+
+    def register(self, module: torch.nn.Module) -> torch.nn.Module:
+        self.modules.append(module)
+        return module
+
+    def share_memory(self) -> int:
+        """登録したモデルのparameterとbufferを、モデル・dtypeごとに1つの共有メモリにまとめる
+        fork後の子プロセスはweightをcopyせずに共有する
+        tensorごとにshare_memory_するとfile descriptorがtensorの数だけ開くため、
+        1つの領域にcopyしてからviewに置き換える
+        Returns:
+            共有メモリに移したbyte数
+        """
+        if self.is_cuda:
+            error_msg = "CUDAのモデルは共有メモリに移せません"
+            raise ValueError(error_msg)
+        return sum(share_module_memory(module) for module in self.modules)
+
+    @property
+    def is_cuda(self) -> bool:
+        return self.device.type == "cuda"
+
+    @contextmanager
+    def inference(self, mixed_precision: bool = False) -> Iterator[None]:
+        """推論用のcontext
+        Args:
+            mixed_precision: fp32の重みのまま推論するモデルはTrueにし、
+                CUDAでもautocastする。CPUではどのモデルも重みがfp32のため、
+                対応していればautocastする
+        """
+        use_autocast = self.autocast_dtype is not None and (
+            mixed_precision or not self.is_cuda
+        )
+        autocast = (
+            torch.autocast(self.device.type, dtype=self.autocast_dtype)
+            if use_autocast
+            else nullcontext()
+        )
+        with torch.inference_mode(), autocast:
+            yield
+
+
+def share_module_memory(module: torch.nn.Module) -> int:
+    tensors: dict[int, torch.Tensor] = {}
+    for tensor in [*module.parameters(), *module.buffers()]:
+        # weight tyingで共有しているtensorは1回だけ移す
+        tensors.setdefault(id(tensor), tensor)
+    shared_bytes = 0
+    for dtype in {tensor.dtype for tensor in tensors.values()}:
+        group = [tensor for tensor in tensors.values() if tensor.dtype == dtype]
+        offsets = []
+        numel = 0
+        for tensor in group:
+            offsets.append(numel)
+            # SIMDのloadが揃うよう各tensorの先頭を64byte境界に置く
+            nbytes = tensor.numel() * dtype.itemsize
+            numel += (nbytes + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT // dtype.itemsize
+        storage = torch.empty(numel, dtype=dtype).share_memory_()
+        with torch.no_grad():
+            for tensor, offset in zip(group, offsets, strict=True):
+                view = storage[offset : offset + tensor.numel()].view(tensor.shape)
+                view.copy_(tensor)
+                tensor.data = view
+        shared_bytes += storage.numel() * dtype.itemsize
+    return shared_bytes
+
+
+def resolve_device(device: str) -> torch.device:
+    """設定値(auto, cuda, cuda:1, cpu等)からdeviceを決める"""
+    if device == "auto":
+        return torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    resolved = torch.device(device)
+    if resolved.type == "cuda" and not torch.cuda.is_available():
+        error_msg = f"torch_device={device}が指定されましたがCUDAが利用できません"
+        raise ValueError(error_msg)
+    return resolved
+
+
+def is_cpu_bf16_supported() -> bool:
+    """CPUがbf16の演算に対応しているか(AVX512-BF16/AMX等)"""
+    try:
+        return bool(torch.ops.mkldnn._is_mkldnn_bf16_supported())  # noqa: SLF001
+    except (AttributeError, RuntimeError):
+        return False
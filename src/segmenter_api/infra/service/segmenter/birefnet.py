@@ -1,61 +1,191 @@
+import time
+from collections import defaultdict
+
+import numpy as np
 import torch
+import torch.nn.functional as F  # noqa: N812
+from injector import inject
 from PIL import Image
-from torchvision import transforms
 from transformers.models.auto.modeling_auto import AutoModelForImageSegmentation
 
 from segmenter_api.domain.service.segmenter import (
     Bbox2SegmentInput,
     Bbox2SegmentOutput,
+    ForegroundResolution,
     ForegroundSegmentInput,
     ForegroundSegmentOutput,
     Segmenter,
 )
-from segmenter_api.utils.image import resize_image_keep_aspect
+from segmenter_api.infra.service.runtime.torch_runtime import TorchRuntime
+from segmenter_api.infra.service.segmenter.postprocess import (
+    probabilities_to_images,
+    unletterbox,
+)
+from segmenter_api.settings import get_settings
+from segmenter_api.utils.image import ensure_rgb
+from segmenter_api.utils.metrics import get_metrics
+from segmenter_api.utils.time import stop_watch
+
+settings = get_settings()
+
+# ImageNetの正規化定数
+IMAGE_MEAN = (0.485, 0.456, 0.406)
+IMAGE_STD = (0.229, 0.224, 0.225)
+
+# 解像度tierごとの入力サイズ(正方形の一辺)
+TIER_SIZES = {
+    ForegroundResolution.RES_512: 512,
+    ForegroundResolution.RES_768: 768,
+    ForegroundResolution.RES_1024: 1024,
+}
 
 
 class BiRefNet(Segmenter):
-    def __init__(self):
+    @inject
+    def __init__(self, runtime: TorchRuntime):
         self.model = AutoModelForImageSegmentation.from_pretrained(
             "zhengpeng7/BiRefNet", trust_remote_code=True
         )
         torch.set_float32_matmul_precision(["high", "highest"][0])
-        self.model.to("cuda")
+        self.runtime = runtime
+        self.device = runtime.device
+        self.dtype = runtime.dtype
+        self.model.to(self.device, self.dtype)
         self.model.eval()
-        self.model.half()
-        self.birefnet_image_size = (1024, 1024)
+        runtime.register(self.model)
+        self.default_resolution = ForegroundResolution(
+            settings.birefnet_default_resolution
+        )
+        # 正規化定数はリクエストごとに作らずdevice上に保持する
+        self.mean = torch.tensor(IMAGE_MEAN, device=self.device).view(1, 3, 1, 1)
+        self.std = torch.tensor(IMAGE_STD, device=self.device).view(1, 3, 1, 1)
 
+    @stop_watch
     def foreground_segment(
         self, foreground_segment_input: ForegroundSegmentInput
     ) -> ForegroundSegmentOutput:
-        # resize
-        resized_image = resize_image_keep_aspect(
-            img=foreground_segment_input.image,
-            long_size=max(self.birefnet_image_size),
-        ).convert("RGB")
-        input_image = Image.new("RGB", self.birefnet_image_size)
-        input_image.paste(resized_image)
-
-        transform_image = transforms.Compose(
-            [
-                transforms.ToTensor(),
-                transforms.Normalize([0.485, 0.456, 0.406], [0.229, 0.224, 0.225]),
+        return self.foreground_segment_batch([foreground_segment_input])[0]
+
+    @stop_watch
+    def foreground_segment_batch(
+        self, foreground_segment_inputs: list[ForegroundSegmentInput]
+    ) -> list[ForegroundSegmentOutput]:
+        """複数画像を1つのtensorにまとめて1回のforwardで前景抽出する
+        入力サイズの異なるtierは別のbatchにする
+        """
+        indices_by_size: dict[int, list[int]] = defaultdict(list)
+        for i, foreground_segment_input in enumerate(foreground_segment_inputs):
+            size = select_tier_size(
+                foreground_segment_input.image.size,
+                foreground_segment_input.resolution or self.default_resolution,
+            )
+            indices_by_size[size].append(i)
+
+        masks: dict[int, Image.Image] = {}
+        batch_size = settings.birefnet_max_batch_size
+        for size, indices in sorted(indices_by_size.items()):
+            for chunk_start in range(0, len(indices), batch_size):
+                chunk = indices[chunk_start : chunk_start + batch_size]
+                images = [foreground_segment_inputs[i].image for i in chunk]
+                # 縮小して入力された画像のmaskは元画像のサイズで返す
+                output_sizes = [
+                    foreground_segment_inputs[i].original_size or image.size
+                    for i, image in zip(chunk, images, strict=True)
+                ]
+                for i, mask in zip(
+                    chunk, self._segment(images, size, output_sizes), strict=True
+                ):
+                    masks[i] = mask
+        return [
+            ForegroundSegmentOutput(mask=masks[i])
+            for i in range(len(foreground_segment_inputs))
+        ]
+
+    def _segment(
+        self,
+        images: list[Image.Image],
+        size: int,
+        output_sizes: list[tuple[int, int]],
+    ) -> list[Image.Image]:
+        """1つのtierのbatchを推論し、tierごとのlatencyとpeak memoryを記録する
+        maskはoutput_sizesの(width, height)に補間して返す
+        """
+        metrics = get_metrics()
+        is_cuda = self.runtime.is_cuda
+        if is_cuda:
+            torch.cuda.reset_peak_memory_stats(self.device)
+        started_at = time.perf_counter()
+        with self.runtime.inference():
+            input_images, resized_sizes = self._preprocess(images, size)
+            preds = self.model(input_images)[-1].sigmoid()
+            masks = [
+                probabilities_to_images(
+                    unletterbox(
+                        pred, content_size=resized_size, output_size=output_size
+                    )
+                )[0]
+                for pred, resized_size, output_size in zip(
+                    preds, resized_sizes, output_sizes, strict=True
+                )
             ]
+        # 後処理でhostへcopyしているためここで計測すればGPUの処理時間も含まれる
+        metrics.observe(
+            f"birefnet.foreground_segment.{size}.latency",
+            time.perf_counter() - started_at,
         )
+        metrics.observe(f"birefnet.foreground_segment.{size}.batch_size", len(images))
+        if is_cuda:
+            metrics.observe(
+                f"birefnet.foreground_segment.{size}.peak_memory_bytes",
+                torch.cuda.max_memory_allocated(self.device),
+            )
+        return masks
 
-        input_images = transform_image(input_image).unsqueeze(0).to("cuda").half()
-
-        # Prediction
-        with torch.no_grad():
-            preds = self.model(input_images)[-1].sigmoid().cpu()
-        pred = preds[0].squeeze()
-        pred_pil = transforms.ToPILImage()(pred)
-        mask = pred_pil.resize(input_image.size)
-        # 元サイズに戻す
-        output_mask = mask.crop(
-            (0, 0, resized_image.size[0], resized_image.size[1])
-        ).resize(foreground_segment_input.image.size)
-        return ForegroundSegmentOutput(mask=output_mask)
+    def _preprocess(
+        self, images: list[Image.Image], size: int
+    ) -> tuple[torch.Tensor, list[tuple[int, int]]]:
+        """縦横比を維持して長辺をsizeにリサイズし、
+        左上に寄せてpaddingした正規化済みのbatch tensorを作る
+        """
+        batch = torch.zeros(len(images), 3, size, size, device=self.device)
+        resized_sizes: list[tuple[int, int]] = []
+        for i, image in enumerate(images):
+            resized_w, resized_h = resized_size_keep_aspect(image.size, size)
+            pixels = torch.from_numpy(np.array(ensure_rgb(image)))
+            tensor = pixels.to(self.device).permute(2, 0, 1).unsqueeze(0).float()
+            batch[i, :, :resized_h, :resized_w] = F.interpolate(
+                tensor / 255,
+                size=(resized_h, resized_w),
+                mode="bilinear",
+                align_corners=False,
+                antialias=True,
+            ).clamp_(0, 1)[0]
+            resized_sizes.append((resized_w, resized_h))
+        # paddingは元の実装と同じく黒画素を正規化した値にする
+        batch = (batch - self.mean) / self.std
+        return batch.to(self.dtype), resized_sizes
 
     def bbox2segment(self, bbox2segment_input: Bbox2SegmentInput) -> Bbox2SegmentOutput:
         error_msg = "BiRefNetはbbox2segmentに対応していません"
         raise NotImplementedError(error_msg)
+
+
+def select_tier_size(
+    image_size: tuple[int, int], resolution: ForegroundResolution
+) -> int:
+    """tierの入力サイズを返す。AUTOは長辺を含む最小のtier(最大は1024)を選ぶ"""
+    if resolution != ForegroundResolution.AUTO:
+        return TIER_SIZES[resolution]
+    long_side = max(image_size)
+    sizes = sorted(TIER_SIZES.values())
+    return next((size for size in sizes if size >= long_side), sizes[-1])
+
+
+def resized_size_keep_aspect(
+    image_size: tuple[int, int], long_size: int
+) -> tuple[int, int]:
+    """resize_image_keep_aspectと同じ規則でリサイズ後のサイズを計算する"""
+    width, height = image_size
+    if height > width:
+        return int(long_size * width / height), long_size
+    return long_size, int(long_size * height / width)
@@ -0,0 +1,47 @@
+from segmenter_api.domain.service.segmenter import (
+    Bbox2SegmentInput,
+    Bbox2SegmentOutput,
+    ForegroundSegmentInput,
+    ForegroundSegmentOutput,
+    Prompt2SegmentInput,
+    Prompt2SegmentOutput,
+    Segmenter,
+)
+from segmenter_api.infra.service.runtime.model_executor import ModelExecutor
+
+
+class ConcurrencyLimitedSegmenter(Segmenter):
+    """segmenterの呼び出しをモデル専用のModelExecutorで実行する
+    SAM2のpredictorのように推論中の状態を持つモデルに同時に入るthread数を制限する
+    """
+
+    def __init__(self, segmenter: Segmenter, executor: ModelExecutor):
+        self.segmenter = segmenter
+        self.executor = executor
+
+    def bbox2segment(self, bbox2segment_input: Bbox2SegmentInput) -> Bbox2SegmentOutput:
+        return self.executor.run(self.segmenter.bbox2segment, bbox2segment_input)
+
+    def bbox2segment_batch(
+        self, bbox2segment_inputs: list[Bbox2SegmentInput]
+    ) -> list[Bbox2SegmentOutput]:
+        return self.executor.run(self.segmenter.bbox2segment_batch, bbox2segment_inputs)
+
+    def prompt2segment(
+        self, prompt2segment_input: Prompt2SegmentInput
+    ) -> Prompt2SegmentOutput:
+        return self.executor.run(self.segmenter.prompt2segment, prompt2segment_input)
+
+    def foreground_segment(
+        self, foreground_segment_input: ForegroundSegmentInput
+    ) -> ForegroundSegmentOutput:
+        return self.executor.run(
+            self.segmenter.foreground_segment, foreground_segment_input
+        )
+
+    def foreground_segment_batch(
+        self, foreground_segment_inputs: list[ForegroundSegmentInput]
+    ) -> list[ForegroundSegmentOutput]:
+        return self.executor.run(
+            self.segmenter.foreground_segment_batch, foreground_segment_inputs
+        )
@@ -0,0 +1,43 @@
+"""segmenterの出力tensorをmask画像にする後処理
+二値化・letterboxの除去・元画像サイズへの補間をモデルのdevice上で行い、
+hostへはuint8のmaskを1回だけcopyする
+"""
+
+import torch
+import torch.nn.functional as F  # noqa: N812
+from PIL import Image
+
+
+def binary_masks_to_images(masks: torch.Tensor) -> list[Image.Image]:
+    """(N, H, W)の二値maskを0/255のmask画像のリストにする"""
+    arrays = masks.to(torch.uint8).mul_(255).cpu().numpy()
+    # 連続した2次元のuint8配列はImage.fromarrayでcopyされずに共有される
+    return [Image.fromarray(array) for array in arrays]
+
+
+def probabilities_to_images(probabilities: torch.Tensor) -> list[Image.Image]:
+    """(N, H, W)の[0, 1]の確率mapを0-255のmask画像のリストにする"""
+    arrays = probabilities.mul(255).round_().clamp_(0, 255).to(torch.uint8)
+    return [Image.fromarray(array) for array in arrays.cpu().numpy()]
+
+
+def unletterbox(
+    probabilities: torch.Tensor,
+    content_size: tuple[int, int],
+    output_size: tuple[int, int],
+) -> torch.Tensor:
+    """左上に寄せてpaddingした入力に対する(1, S, S)の出力からpaddingを除き、
+    1回の補間で元画像のサイズ(output_size)に戻した(1, H, W)のtensorを返す
+    Args:
+        probabilities: モデルの出力
+        content_size: padding前の画像の(width, height)
+        output_size: 元画像の(width, height)
+    """
+    content_w, content_h = content_size
+    output_w, output_h = output_size
+    cropped = probabilities[:, :content_h, :content_w].unsqueeze(0).float()
+    if (content_w, content_h) == (output_w, output_h):
+        return cropped[0]
+    return F.interpolate(
+        cropped, size=(output_h, output_w), mode="bilinear", align_corners=False
+    )[0]
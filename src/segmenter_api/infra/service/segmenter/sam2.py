@@ -1,4 +1,5 @@
 import traceback
+from collections.abc import Sequence
 
 import numpy as np
 import torch
@@ -6,19 +7,28 @@ from hydra import initialize_config_dir
 from hydra.core.global_hydra import GlobalHydra
 from injector import inject
 from PIL import Image
+from pydantic import BaseModel, ConfigDict
 from sam2.build_sam import build_sam2
 from sam2.sam2_image_predictor import SAM2ImagePredictor
 
+from segmenter_api.domain.model.errors import BadRequestError, NotFoundError
 from segmenter_api.domain.repository.file import FileRepositoryInterface
 from segmenter_api.domain.service.segmenter import (
     Bbox2SegmentInput,
     Bbox2SegmentOutput,
     ForegroundSegmentInput,
     ForegroundSegmentOutput,
+    Prompt2SegmentInput,
+    Prompt2SegmentOutput,
     Segmenter,
 )
+from segmenter_api.infra.service.runtime.torch_runtime import TorchRuntime
+from segmenter_api.infra.service.segmenter.postprocess import binary_masks_to_images
 from segmenter_api.settings import get_settings
+from segmenter_api.utils.cache import LRUCache
+from segmenter_api.utils.image import ensure_rgb, image_hash
 from segmenter_api.utils.logger import get_logger
+from segmenter_api.utils.metrics import get_metrics
 from segmenter_api.utils.time import stop_watch
 
 logger = get_logger(__name__)
@@ -26,16 +36,42 @@ logger = get_logger(__name__)
 settings = get_settings()
 
 
+class SAM2Embedding(BaseModel):
+    """SAM2ImagePredictor.set_imageで計算される1枚分の画像特徴量"""
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+    image_embed: torch.Tensor
+    high_res_feats: list[torch.Tensor]
+    orig_hw: tuple[int, int]
+
+    @property
+    def nbytes(self) -> int:
+        return sum(
+            tensor.element_size() * tensor.nelement()
+            for tensor in [self.image_embed, *self.high_res_feats]
+        )
+
+
 class SAM2(Segmenter):
     @inject
     @stop_watch
-    def __init__(self, file_repository: FileRepositoryInterface):
+    def __init__(self, file_repository: FileRepositoryInterface, runtime: TorchRuntime):
         """Initialize SAM2 model.
         We have to configure hydra manually because of:
         https://github.com/facebookresearch/sam2/issues/573
         """
         self.file_repository = file_repository
+        self.runtime = runtime
         self._load_model()
+        self.runtime.register(self.predictor.model)
+        # 画像のcontent hashをkeyにしたimage encoderの出力のキャッシュ
+        self.embedding_cache: LRUCache[str, SAM2Embedding] = LRUCache(
+            max_bytes=settings.sam2_embedding_cache_max_bytes,
+            sizeof=lambda embedding: embedding.nbytes,
+        )
+        get_metrics().register_collector(
+            "sam2_embedding_cache", self.embedding_cache.stats
+        )
 
     def _load_model(self):
         try:
@@ -51,38 +87,226 @@ class SAM2(Segmenter):
                 version_base="1.3",
             )
             self.predictor = SAM2ImagePredictor(
-                build_sam2("sam2.1_hiera_l", checkpoint)
+                build_sam2(
+                    "sam2.1_hiera_l", checkpoint, device=str(self.runtime.device)
+                )
             )
         except Exception as e:
             logger.warning(f"ローカルモデルのロードに失敗しました: {e}")
             logger.warning(traceback.format_exc())
             logger.warning("公開モデルのロードを試みます")
             self.predictor = SAM2ImagePredictor.from_pretrained(
-                "facebook/sam2-hiera-large"
+                "facebook/sam2-hiera-large", device=str(self.runtime.device)
             )
 
     @stop_watch
     def bbox2segment(self, bbox2segment_input: Bbox2SegmentInput) -> Bbox2SegmentOutput:
-        if len(bbox2segment_input.bboxes) == 0:
-            logger.warning("input bboxが空です")
-            return Bbox2SegmentOutput(masks=[])
-        mask_images: list[Image.Image] = []
-        with torch.inference_mode(), torch.autocast("cuda", dtype=torch.bfloat16):
-            self.predictor.set_image(image=bbox2segment_input.image.convert("RGB"))
-            binary_masks, _, _ = self.predictor.predict(
-                box=np.array(bbox2segment_input.bboxes),
-                multimask_output=False,
+        return self.bbox2segment_batch([bbox2segment_input])[0]
+
+    @stop_watch
+    def bbox2segment_batch(
+        self, bbox2segment_inputs: list[Bbox2SegmentInput]
+    ) -> list[Bbox2SegmentOutput]:
+        """複数画像のimage encoderを1回のforwardで実行し、画像ごとのmaskを返す"""
+        outputs = [Bbox2SegmentOutput(masks=[]) for _ in bbox2segment_inputs]
+        indices = []
+        for i, bbox2segment_input in enumerate(bbox2segment_inputs):
+            if len(bbox2segment_input.bboxes) == 0:
+                logger.warning("input bboxが空です")
+                continue
+            indices.append(i)
+        batch_size = settings.sam2_max_batch_size
+        for chunk_start in range(0, len(indices), batch_size):
+            chunk = indices[chunk_start : chunk_start + batch_size]
+            with self.runtime.inference(mixed_precision=True):
+                keys = self._set_images(
+                    [ensure_rgb(bbox2segment_inputs[i].image) for i in chunk],
+                    original_sizes=[
+                        bbox2segment_inputs[i].original_size for i in chunk
+                    ],
+                    is_batch=True,
+                )
+                for img_idx, (i, key) in enumerate(zip(chunk, keys, strict=True)):
+                    # (bbox数, 1, H, W)
+                    binary_masks, _, _ = self._predict(
+                        img_idx=img_idx, box=bbox2segment_inputs[i].bboxes
+                    )
+                    outputs[i] = Bbox2SegmentOutput(
+                        masks=binary_masks_to_images(binary_masks[:, 0]),
+                        image_id=key,
+                    )
+            get_metrics().observe("sam2.bbox2segment.batch_size", len(chunk))
+        return outputs
+
+    @stop_watch
+    def prompt2segment(
+        self, prompt2segment_input: Prompt2SegmentInput
+    ) -> Prompt2SegmentOutput:
+        """キャッシュした画像特徴量に対してprompt encoderとmask decoderだけを実行する"""
+        with self.runtime.inference(mixed_precision=True):
+            if prompt2segment_input.image is not None:
+                image_id = self._set_images(
+                    [ensure_rgb(prompt2segment_input.image)],
+                    original_sizes=[prompt2segment_input.original_size],
+                )[0]
+            elif prompt2segment_input.image_id is not None:
+                image_id = prompt2segment_input.image_id
+                embedding = self.embedding_cache.get(image_id)
+                if embedding is None:
+                    error_msg = (
+                        f"image_id: {image_id}の画像特徴量が見つかりません。"
+                        "imageを指定して再度リクエストしてください"
+                    )
+                    raise NotFoundError(error_msg)
+                self._restore_embeddings([embedding])
+            else:
+                error_msg = "imageかimage_idのどちらかを指定してください"
+                raise BadRequestError(error_msg)
+            # (1, C, H, W)
+            binary_masks, scores, low_res_logits = self._predict(
+                img_idx=0,
+                points=(
+                    (
+                        prompt2segment_input.point_coords,
+                        prompt2segment_input.point_labels,
+                    )
+                    if prompt2segment_input.point_coords is not None
+                    and prompt2segment_input.point_labels is not None
+                    else None
+                ),
+                box=prompt2segment_input.box,
+                mask_input=prompt2segment_input.mask_input,
+                multimask_output=prompt2segment_input.multimask_output,
             )
-        if binary_masks.ndim == 4:
-            binary_masks = binary_masks.squeeze(1)
-        masks = np.uint8(binary_masks) * 255
-        for mask in masks:
-            mask_image = Image.fromarray(mask)
-            mask_images.append(mask_image)
-        return Bbox2SegmentOutput(masks=mask_images)
+            masks = binary_masks_to_images(binary_masks[0])
+        return Prompt2SegmentOutput(
+            image_id=image_id,
+            masks=masks,
+            scores=scores[0].float().tolist(),
+            low_res_logits=low_res_logits[0].float().cpu().numpy(),
+        )
+
+    def _predict(
+        self,
+        img_idx: int,
+        *,
+        points: tuple[list[tuple[float, float]], list[int]] | None = None,
+        box: Sequence[float] | Sequence[Sequence[float]] | None = None,
+        mask_input: np.ndarray | None = None,
+        multimask_output: bool = False,
+    ) -> tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
+        """predictorにセット済みのimg_idx番目の画像に対してmaskを推論する
+        pointsは(座標, label)の組で指定する
+        SAM2ImagePredictor.predictと異なり、出力をhostへcopyせずdevice上のtensorで返す
+        Returns:
+            元画像サイズに補間して二値化したmask (B, C, H, W),
+            maskのscore (B, C), 低解像度のmask logit (B, C, 256, 256)
+        """
+        predictor = self.predictor
+        point_coords, point_labels = points if points is not None else (None, None)
+        prepared_mask_input, coords, labels, boxes = predictor._prep_prompts(  # noqa: SLF001
+            point_coords,
+            point_labels,
+            box,
+            mask_input,
+            normalize_coords=True,
+            img_idx=img_idx,
+        )
+        return predictor._predict(  # noqa: SLF001
+            coords,
+            labels,
+            boxes,
+            prepared_mask_input,
+            multimask_output=multimask_output,
+            return_logits=False,
+            img_idx=img_idx,
+        )
+
+    def _set_images(
+        self,
+        images: list[Image.Image],
+        original_sizes: list[tuple[int, int] | None] | None = None,
+        is_batch: bool = False,
+    ) -> list[str]:
+        """predictorに画像をセットし、画像ごとのcontent hashを返す
+        キャッシュにない画像だけをまとめてimage encoderに通し、
+        キャッシュにある画像は特徴量を復元する
+        original_sizesを指定した場合は縮小前の(width, height)を画像サイズとして扱い、
+        promptの座標の正規化とmaskの補間を元画像の座標系で行う
+        """
+        if original_sizes is None:
+            original_sizes = [None] * len(images)
+        orig_hw_by_key: dict[str, tuple[int, int] | None] = {}
+        keys = []
+        for image, original_size in zip(images, original_sizes, strict=True):
+            key = image_hash(image)
+            if original_size is not None and original_size != image.size:
+                # 同じ画素でも元画像のサイズが違えばmaskの座標系が異なる
+                key = f"{key}:{original_size[0]}x{original_size[1]}"
+            keys.append(key)
+            orig_hw_by_key[key] = (
+                (original_size[1], original_size[0]) if original_size else None
+            )
+        embeddings: dict[str, SAM2Embedding] = {}
+        missing: dict[str, Image.Image] = {}
+        for key, image in zip(keys, images, strict=True):
+            embedding = self.embedding_cache.get(key)
+            if embedding is not None:
+                embeddings[key] = embedding
+            else:
+                missing[key] = image
+        if missing:
+            self.predictor.set_image_batch(
+                [np.array(image) for image in missing.values()]
+            )
+            features = self.predictor._features  # noqa: SLF001
+            orig_hws = self.predictor._orig_hw  # noqa: SLF001
+            for i, key in enumerate(missing):
+                embedding = SAM2Embedding(
+                    image_embed=split(features["image_embed"], i),
+                    high_res_feats=[
+                        split(feat, i) for feat in features["high_res_feats"]
+                    ],
+                    orig_hw=orig_hw_by_key[key] or tuple(orig_hws[i]),
+                )
+                self.embedding_cache.put(key, embedding)
+                embeddings[key] = embedding
+        self._restore_embeddings([embeddings[key] for key in keys], is_batch=is_batch)
+        return keys
+
+    def _restore_embeddings(
+        self, embeddings: list[SAM2Embedding], is_batch: bool = False
+    ) -> None:
+        """キャッシュした特徴量をpredictorの状態として復元する"""
+        predictor = self.predictor
+        predictor.reset_predictor()
+        predictor._features = {  # noqa: SLF001
+            "image_embed": concat([e.image_embed for e in embeddings]),
+            "high_res_feats": [
+                concat(list(level))
+                for level in zip(*[e.high_res_feats for e in embeddings], strict=True)
+            ],
+        }
+        predictor._orig_hw = [e.orig_hw for e in embeddings]  # noqa: SLF001
+        predictor._is_image_set = True  # noqa: SLF001
+        predictor._is_batch = is_batch  # noqa: SLF001
 
     def foreground_segment(
         self, foreground_segment_input: ForegroundSegmentInput
     ) -> ForegroundSegmentOutput:
         error_msg = "SAM2は前景抽出に対応していません"
         raise NotImplementedError(error_msg)
+
+
+def split(tensor: torch.Tensor, index: int) -> torch.Tensor:
+    """batchからindex番目を取り出す
+    キャッシュがbatch全体のtensorを保持し続けないようにcopyする。1枚の場合はcopyしない
+    """
+    if tensor.shape[0] == 1:
+        return tensor
+    return tensor[index : index + 1].clone()
+
+
+def concat(tensors: list[torch.Tensor]) -> torch.Tensor:
+    """batch次元で結合する。1つの場合はcopyしない"""
+    return tensors[0] if len(tensors) == 1 else torch.cat(tensors)
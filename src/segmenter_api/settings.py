@@ -6,9 +6,87 @@ from pydantic_settings import BaseSettings
 
 class CommonSettings(BaseSettings):
     google_cloud_storage_bucket: str = "segmenter-api"
+    # ファイルの読み書き先(gcs, local)。localはlocal_storage_rootの下の
+    # ディレクトリをbucketとして扱い、gs://bucket/pathを読み書きする
+    file_repository_backend: str = "gcs"
+    local_storage_root: Path = Path("data/storage")
+    # fake-gcs-server等のemulatorのURL(例: http://localhost:4443)。匿名認証で接続する
+    gcs_emulator_host: str | None = None
+    # GCS clientのHTTP connection poolの大きさ(並列に読み書きするobject数の上限)
+    gcs_max_pool_connections: int = 32
+    # リクエストでgs://を指定できるbucket(Noneの場合はgoogle_cloud_storage_bucketのみ)
+    gcs_allowed_buckets: list[str] | None = None
+    # trueの場合はbucketを制限せず、service accountが読み書きできる全bucketを許可する
+    gcs_allow_any_bucket: bool = False
+    # 同時に実行するjobの数。超えたjobはqueuedのまま待つ
+    job_max_concurrent_jobs: int = 1
+    # jobで1回に読み込んで処理するitem数のデフォルト
+    job_batch_size: int = 32
+    # jobで同時に処理するitem数と、次のbatchの画像を先読みするthread数
+    job_item_concurrency: int = 8
+    job_prefetch_workers: int = 8
+    # jobのcheckpointを更新しない時間の上限(秒)。実行中のworkerはこの1/3ごとに更新し、
+    # 超えたjobは実行していたworkerが停止したとみなして別のworkerが再開できる
+    job_lease_seconds: int = 300
+    # gunicornのmasterでfork前に読み込むモデル(florence2_base, sam2, birefnet等)
+    # 指定した場合、workerはweightを共有メモリで共有する。CPUでのみ有効
+    preload_models: list[str] = []
     florence2_base_model_path: Path = Path("models/microsoft/Florence-2-base")
     florence2_large_model_path: Path = Path("models/microsoft/Florence-2-large")
     sam2_model_path: Path = Path("models/facebook/sam2.1-hiera-large")
+    # モデルを載せるdevice(auto, cuda, cuda:1, cpu等)。autoはCUDAがあればcudaを使う
+    torch_device: str = "auto"
+    # CPUで推論する際、対応CPUならbf16のautocastを使う
+    torch_cpu_autocast: bool = True
+    # 入力画像をデコードする際の長辺の上限。超える画像は縮小してから推論する(Noneで無効)
+    input_image_max_side: int | None = 2048
+    # 1回のgenerateでまとめて処理するpromptの最大数
+    florence2_max_batch_size: int = 16
+    # Florence2の画像特徴量キャッシュの上限(byte)
+    florence2_feature_cache_max_bytes: int = 256 * 1024**2
+    # 複数リクエストのdetectをまとめるmicro-batchingの設定(max_size<=1で無効)
+    detector_batch_max_size: int = 8
+    detector_batch_max_wait_ms: float = 10.0
+    # モデルごとに同時に推論するリクエスト数
+    # SAM2のpredictorは推論中の状態を持つため、segmenterは1にする
+    # detectorはmicro-batchingでまとめるため、detector_batch_max_size以上にする
+    segmenter_max_concurrency: int = 1
+    detector_max_concurrency: int = 8
+    # モデルごとに推論の空きを待てるリクエスト数。超えたリクエストは429を返す
+    # Cloud Runのmax_instance_request_concurrencyは同時推論数とこの値の和にする
+    model_max_queue_size: int = 16
+    # 429のRetry-Afterの最小値(秒)
+    # 推論時間の移動平均から見込んだ値の方が大きければそちらを返す
+    model_min_retry_after_seconds: int = 1
+    # text2segmentをdecode→detect→segment→encodeのpipelineで処理する
+    # 段ごとにworkerを持ち、別々のリクエストのdetectとsegmentを同時に実行する
+    text2segment_pipeline_enabled: bool = True
+    # pipelineの段の間のqueueの大きさ。最初の段が一杯の場合は429を返す
+    text2segment_pipeline_queue_size: int = 16
+    # decodeとencodeの段のworker数
+    text2segment_pipeline_io_workers: int = 2
+    # 検出結果のキャッシュの上限(件数)と有効期限(秒)
+    detection_cache_max_items: int = 4096
+    detection_cache_ttl_seconds: float = 3600
+    # SAM2のimage encoderの出力のキャッシュの上限(byte)
+    sam2_embedding_cache_max_bytes: int = 1024**3
+    # SAM2のimage encoderを1回のforwardで処理する最大画像数
+    sam2_max_batch_size: int = 8
+    # BiRefNetで1回のforwardに含める最大画像数
+    birefnet_max_batch_size: int = 4
+    # BiRefNetの入力解像度のデフォルト(auto, 512, 768, 1024)
+    # 既存のクライアントのmaskを変えないため1024とし、autoはリクエストかこの設定で選ぶ
+    birefnet_default_resolution: str = "1024"
+    # maskを並列にencodeするthread数
+    mask_encode_max_workers: int = 4
+    # PNGのzlib圧縮レベル(0-9)。Pillowのデフォルトは6で、低いほど速くサイズは大きい
+    mask_png_compress_level: int = 3
+    # 可逆WebPのmethod(0-6)。大きいほど小さくなるが遅い
+    mask_webp_method: int = 0
+    # GroundingDINOのtext backbone出力のキャッシュの上限(prompt set数)
+    grounding_dino_text_cache_max_items: int = 1024
+    # 起動時にtext cacheをwarm upするvocabularyファイル(1行1prompt set, カンマ区切り)
+    grounding_dino_vocabulary_path: Path | None = None
 
 
 @lru_cache
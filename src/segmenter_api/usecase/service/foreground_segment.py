@@ -1,8 +1,14 @@
 """uv run python src/segmenter_api/usecase/service/foreground_segment.py \
 --image-path tests/data/abema_water.png \
 --output-image-path data/abema_water_segmented.png
+
+解像度tierごとのlatencyとpeak memoryを計測する場合:
+uv run python src/segmenter_api/usecase/service/foreground_segment.py \
+--image-path tests/data/abema_water.png \
+--benchmark --iterations 10
 """
 
+import json
 from argparse import ArgumentParser, Namespace
 
 from injector import inject
@@ -13,13 +19,17 @@ from segmenter_api.domain.factory.segmenter_factory import (
     SegmenterType,
 )
 from segmenter_api.domain.model.foreground_segment import (
+    ForegroundSegmentBatchUsecaseInput,
+    ForegroundSegmentBatchUsecaseOutput,
     ForegroundSegmentUsecaseInput,
     ForegroundSegmentUsecaseOutput,
 )
 from segmenter_api.domain.service.segmenter import (
+    ForegroundResolution,
     ForegroundSegmentInput,
     ForegroundSegmentOutput,
 )
+from segmenter_api.utils.metrics import get_metrics
 from segmenter_api.utils.time import stop_watch
 
 
@@ -41,29 +51,109 @@ class ForegroundSegmentUsecase:
         foreground_segment_output: ForegroundSegmentOutput = (
             segmenter.foreground_segment(
                 foreground_segment_input=ForegroundSegmentInput(
-                    image=foreground_segment_usecase_input.image
+                    image=foreground_segment_usecase_input.image,
+                    resolution=foreground_segment_usecase_input.resolution,
+                    original_size=foreground_segment_usecase_input.original_size,
                 )
             )
         )
         return ForegroundSegmentUsecaseOutput(mask=foreground_segment_output.mask)
 
+    @stop_watch
+    def foreground_segment_batch(
+        self, foreground_segment_batch_usecase_input: ForegroundSegmentBatchUsecaseInput
+    ) -> ForegroundSegmentBatchUsecaseOutput:
+        segmenter = self.segmenter_factory.create(
+            foreground_segment_batch_usecase_input.segmenter_type
+        )
+        images = foreground_segment_batch_usecase_input.images
+        # 元画像のサイズを指定しない場合は、各画像のサイズのmaskを返す
+        original_sizes: list[tuple[int, int] | None] = [None] * len(images)
+        if foreground_segment_batch_usecase_input.original_sizes:
+            original_sizes = list(foreground_segment_batch_usecase_input.original_sizes)
+        foreground_segment_outputs: list[ForegroundSegmentOutput] = (
+            segmenter.foreground_segment_batch(
+                foreground_segment_inputs=[
+                    ForegroundSegmentInput(
+                        image=image,
+                        resolution=foreground_segment_batch_usecase_input.resolution,
+                        original_size=original_size,
+                    )
+                    for image, original_size in zip(images, original_sizes, strict=True)
+                ]
+            )
+        )
+        return ForegroundSegmentBatchUsecaseOutput(
+            masks=[output.mask for output in foreground_segment_outputs]
+        )
+
 
 def main(args: Namespace) -> None:
     from segmenter_api.di import resolve
 
     input_image = Image.open(args.image_path)
-    output = resolve(ForegroundSegmentUsecase).foreground_segment(
+    usecase = resolve(ForegroundSegmentUsecase)
+    if args.benchmark:
+        benchmark(usecase, input_image, args.iterations)
+        return
+    output = usecase.foreground_segment(
         ForegroundSegmentUsecaseInput(
             image=input_image,
             segmenter_type=SegmenterType.BIREFNET,
+            resolution=ForegroundResolution(args.resolution),
         )
     )
     output.mask.save(args.output_image_path)
 
 
+def benchmark(
+    usecase: ForegroundSegmentUsecase, input_image: Image.Image, iterations: int
+) -> None:
+    """解像度tierごとにforeground_segmentを実行し、metricsに記録された
+    latencyとpeak memoryを出力する。初回はwarm upとして計測から除く
+    """
+    for resolution in ForegroundResolution:
+        if resolution == ForegroundResolution.AUTO:
+            continue
+        usecase_input = ForegroundSegmentUsecaseInput(
+            image=input_image,
+            segmenter_type=SegmenterType.BIREFNET,
+            resolution=resolution,
+        )
+        usecase.foreground_segment(usecase_input)
+    metrics = get_metrics()
+    metrics.reset()
+    for resolution in ForegroundResolution:
+        if resolution == ForegroundResolution.AUTO:
+            continue
+        usecase_input = ForegroundSegmentUsecaseInput(
+            image=input_image,
+            segmenter_type=SegmenterType.BIREFNET,
+            resolution=resolution,
+        )
+        for _ in range(iterations):
+            usecase.foreground_segment(usecase_input)
+    observations = {
+        name: summary
+        for name, summary in metrics.snapshot()["observations"].items()
+        if name.startswith("birefnet.")
+    }
+    print(json.dumps(observations, indent=2))
+
+
 if __name__ == "__main__":
     parser = ArgumentParser()
     parser.add_argument("--image-path", type=str, required=True)
-    parser.add_argument("--output-image-path", type=str, required=True)
+    parser.add_argument("--output-image-path", type=str)
+    parser.add_argument(
+        "--resolution",
+        type=str,
+        default=ForegroundResolution.RES_1024.value,
+        choices=[resolution.value for resolution in ForegroundResolution],
+    )
+    parser.add_argument("--benchmark", action="store_true")
+    parser.add_argument("--iterations", type=int, default=10)
     args = parser.parse_args()
+    if not args.benchmark and args.output_image_path is None:
+        parser.error("--output-image-pathを指定してください")
     main(args)
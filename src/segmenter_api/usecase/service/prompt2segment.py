@@ -0,0 +1,47 @@
+from injector import inject
+
+from segmenter_api.domain.factory.segmenter_factory import SegmenterFactoryInterface
+from segmenter_api.domain.model.prompt2segment import (
+    Prompt2SegmentUsecaseInput,
+    Prompt2SegmentUsecaseOutput,
+)
+from segmenter_api.domain.service.segmenter import (
+    Prompt2SegmentInput,
+    Prompt2SegmentOutput,
+)
+from segmenter_api.utils.time import stop_watch
+
+
+class Prompt2SegmentUsecase:
+    @inject
+    def __init__(
+        self,
+        segmenter_factory: SegmenterFactoryInterface,
+    ):
+        self.segmenter_factory = segmenter_factory
+
+    @stop_watch
+    def prompt2segment(
+        self, prompt2segment_usecase_input: Prompt2SegmentUsecaseInput
+    ) -> Prompt2SegmentUsecaseOutput:
+        segmenter = self.segmenter_factory.create(
+            prompt2segment_usecase_input.segmenter_type
+        )
+        prompt2segment_output: Prompt2SegmentOutput = segmenter.prompt2segment(
+            prompt2segment_input=Prompt2SegmentInput(
+                image=prompt2segment_usecase_input.image,
+                image_id=prompt2segment_usecase_input.image_id,
+                original_size=prompt2segment_usecase_input.original_size,
+                point_coords=prompt2segment_usecase_input.point_coords,
+                point_labels=prompt2segment_usecase_input.point_labels,
+                box=prompt2segment_usecase_input.box,
+                mask_input=prompt2segment_usecase_input.mask_input,
+                multimask_output=prompt2segment_usecase_input.multimask_output,
+            )
+        )
+        return Prompt2SegmentUsecaseOutput(
+            image_id=prompt2segment_output.image_id,
+            masks=prompt2segment_output.masks,
+            scores=prompt2segment_output.scores,
+            low_res_logits=prompt2segment_output.low_res_logits,
+        )
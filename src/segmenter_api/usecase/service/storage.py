@@ -0,0 +1,104 @@
+import base64
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from typing import TypeVar
+
+from injector import inject
+from PIL import Image
+
+from segmenter_api.domain.model.errors import BadRequestError
+from segmenter_api.domain.model.gcs import GCSPath
+from segmenter_api.domain.model.mask import MaskFormat
+from segmenter_api.domain.repository.file import FileRepositoryInterface
+from segmenter_api.settings import get_settings
+from segmenter_api.utils.mask_encoder import ImageCodec, get_mask_encoder
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+settings = get_settings()
+
+
+class StorageUsecase:
+    """リクエストで指定されたgs://の画像の読み込みと、maskの書き出しを行う
+    objectは一時ファイルを経由せずメモリ上で読み書きする
+    """
+
+    @inject
+    def __init__(self, file_repository: FileRepositoryInterface):
+        self.file_repository = file_repository
+
+    def read_image(self, image: str) -> bytes:
+        """base64の画像かgs://のURIから、エンコードされた画像のbytesを得る"""
+        if not is_gcs_uri(image):
+            return base64.b64decode(image)
+        check_bucket(image)
+        return self.file_repository.read_bytes(image)
+
+    def read_images(self, images: list[str]) -> list[bytes]:
+        """複数の画像を並列に読み込み、入力と同じ順序で返す"""
+        return parallel_map(self.read_image, images)
+
+    def write_masks(
+        self,
+        masks: list[Image.Image],
+        mask_format: MaskFormat,
+        output_uri: str,
+        names: list[str],
+    ) -> list[str]:
+        """maskをmask_formatでencodeしてoutput_uriの下に書き出し、書き出したURIを返す"""
+        return self.write_images(
+            masks,
+            codec=ImageCodec(mask_format.value),
+            output_uri=output_uri,
+            names=names,
+        )
+
+    def write_images(
+        self,
+        images: list[Image.Image],
+        codec: ImageCodec,
+        output_uri: str,
+        names: list[str],
+    ) -> list[str]:
+        """画像をencodeしてoutput_uri/{name}{拡張子}に並列に書き出す"""
+        check_bucket(output_uri)
+        encoded = get_mask_encoder().encode_to_bytes(images, codec)
+        uris = [f"{output_uri.rstrip('/')}/{name}{codec.extension}" for name in names]
+        parallel_map(
+            lambda item: self.file_repository.write_bytes(
+                item[0], item[1], content_type=codec.content_type
+            ),
+            list(zip(uris, encoded, strict=True)),
+        )
+        return uris
+
+
+def is_gcs_uri(value: str) -> bool:
+    # base64の文字に":"は含まれないためbase64の画像と区別できる
+    return value.startswith("gs://")
+
+
+def check_bucket(uri: str) -> None:
+    """設定で許可されたbucketかを確認する
+    許可するbucketを指定しない場合はgoogle_cloud_storage_bucketのみ許可し、
+    全bucketを許可するにはgcs_allow_any_bucketを明示的に指定する
+    """
+    if settings.gcs_allow_any_bucket:
+        return
+    bucket = GCSPath.from_path(uri).bucket
+    allowed_buckets = settings.gcs_allowed_buckets
+    if allowed_buckets is None:
+        allowed_buckets = [settings.google_cloud_storage_bucket]
+    if bucket not in allowed_buckets:
+        error_msg = f"bucket: {bucket}へのアクセスは許可されていません"
+        raise BadRequestError(error_msg)
+
+
+def parallel_map(func: Callable[[T], R], items: list[T]) -> list[R]:
+    """I/Oを並列に実行する。同時に実行する数はconnection poolの大きさまでにする"""
+    if len(items) <= 1:
+        return [func(item) for item in items]
+    max_workers = min(len(items), settings.gcs_max_pool_connections)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(func, items))
@@ -16,6 +16,7 @@ from segmenter_api.domain.factory.detector_factory import (
 )
 from segmenter_api.domain.model.text2bbox import Text2BboxInput, Text2BboxOutput
 from segmenter_api.domain.service.detector import DetectorInput, DetectorOutput
+from segmenter_api.utils.image import scale_bboxes
 from segmenter_api.utils.time import stop_watch
 
 
@@ -30,18 +31,29 @@ class Text2BboxUsecase:
     @stop_watch
     def text2bbox(self, text2bbox_input: Text2BboxInput) -> Text2BboxOutput:
         detector = self.detector_factory.create(text2bbox_input.detector_type)
+        image = text2bbox_input.image
         detector_output: DetectorOutput = detector.detect(
             detector_input=DetectorInput(
                 texts=text2bbox_input.texts,
-                image=text2bbox_input.image.convert("RGB"),
+                image=image,
+                quality=text2bbox_input.quality,
+                box_threshold=text2bbox_input.box_threshold,
+                text_threshold=text2bbox_input.text_threshold,
+                max_detections=text2bbox_input.max_detections,
+                use_cache=text2bbox_input.use_cache,
             )
         )
         assert_bboxes_in_image(
             bboxes=detector_output.bboxes,
-            image_size=text2bbox_input.image.size,
+            image_size=image.size,
         )
+        # 縮小した画像上のbboxを元画像の座標に戻す
         return Text2BboxOutput(
-            bboxes=detector_output.bboxes,
+            bboxes=scale_bboxes(
+                detector_output.bboxes,
+                from_size=image.size,
+                to_size=text2bbox_input.original_size or image.size,
+            ),
             labels=detector_output.labels,
         )
 
@@ -24,6 +24,7 @@ from segmenter_api.domain.model.text2segment import (
 )
 from segmenter_api.domain.service.detector import DetectorInput, DetectorOutput
 from segmenter_api.domain.service.segmenter import Bbox2SegmentInput, Bbox2SegmentOutput
+from segmenter_api.utils.image import scale_bboxes
 from segmenter_api.utils.time import stop_watch
 
 
@@ -39,14 +40,45 @@ class Text2SegmentUsecase:
 
     @stop_watch
     def text2segment(self, text2segment_input: Text2SegmentInput) -> Text2SegmentOutput:
+        return self.segment(text2segment_input, self.detect(text2segment_input))
+
+    @stop_watch
+    def detect(self, text2segment_input: Text2SegmentInput) -> DetectorOutput:
+        """bboxを元画像の座標で返す
+        text2segmentのpipelineでは、detectとsegmentを別のstageで実行する
+        """
         detector = self.detector_factory.create(text2segment_input.detector_type)
-        segmenter = self.segmenter_factory.create(text2segment_input.segmenter_type)
+        image = text2segment_input.image
+        original_size = text2segment_input.original_size or image.size
         detector_output: DetectorOutput = detector.detect(
             detector_input=DetectorInput(
                 texts=text2segment_input.texts,
-                image=text2segment_input.image.convert("RGB"),
+                image=image,
+                quality=text2segment_input.quality,
+                box_threshold=text2segment_input.box_threshold,
+                text_threshold=text2segment_input.text_threshold,
+                max_detections=text2segment_input.max_detections,
+                use_cache=text2segment_input.use_cache,
             )
         )
+        assert_bboxes_in_image(
+            bboxes=detector_output.bboxes,
+            image_size=image.size,
+        )
+        # 縮小した画像上のbboxを元画像の座標に戻す
+        # detector_outputはcacheと共有されるため変更せずに作り直す
+        return DetectorOutput(
+            labels=detector_output.labels,
+            bboxes=scale_bboxes(
+                detector_output.bboxes, from_size=image.size, to_size=original_size
+            ),
+        )
+
+    @stop_watch
+    def segment(
+        self, text2segment_input: Text2SegmentInput, detector_output: DetectorOutput
+    ) -> Text2SegmentOutput:
+        """detectの結果のbboxをsegmentする"""
         if len(detector_output.bboxes) == 0:
             return Text2SegmentOutput(
                 masks=[],
@@ -54,20 +86,20 @@ class Text2SegmentUsecase:
                 detector_output=detector_output,
                 bbox2segment_output=Bbox2SegmentOutput(masks=[]),
             )
-        assert_bboxes_in_image(
-            bboxes=detector_output.bboxes,
-            image_size=text2segment_input.image.size,
-        )
+        segmenter = self.segmenter_factory.create(text2segment_input.segmenter_type)
+        image = text2segment_input.image
+        original_size = text2segment_input.original_size or image.size
         bbox2segment_output: Bbox2SegmentOutput = segmenter.bbox2segment(
             bbox2segment_input=Bbox2SegmentInput(
-                image=text2segment_input.image.convert("RGB"),
+                image=image,
                 bboxes=detector_output.bboxes,
+                original_size=original_size,
             )
         )
         masks = bbox2segment_output.masks
         assert_mask_size_is_image_size(
             masks=masks,
-            image_size=text2segment_input.image.size,
+            image_size=original_size,
         )
         return Text2SegmentOutput(
             masks=masks,
@@ -1,32 +1,117 @@
 from injector import inject
+from PIL import Image
 
 from segmenter_api.domain.model.foreground_segment import (
+    ForegroundSegmentBatchRequest,
+    ForegroundSegmentBatchResponse,
+    ForegroundSegmentBatchUsecaseInput,
+    ForegroundSegmentParams,
     ForegroundSegmentRequest,
     ForegroundSegmentResponse,
     ForegroundSegmentUsecaseInput,
 )
+from segmenter_api.domain.model.mask import MaskFormat, RLEMask, encode_masks
+from segmenter_api.settings import get_settings
 from segmenter_api.usecase.service.foreground_segment import (
     ForegroundSegmentUsecase,
 )
-from segmenter_api.utils.image import base642pil, pil2base64
+from segmenter_api.usecase.service.storage import StorageUsecase
+from segmenter_api.utils.image import decode_image
 from segmenter_api.utils.time import stop_watch
 
 
 class ForegroundSegmentUserInterface:
     @inject
-    def __init__(self, foreground_segment_usecase: ForegroundSegmentUsecase):
+    def __init__(
+        self,
+        foreground_segment_usecase: ForegroundSegmentUsecase,
+        storage_usecase: StorageUsecase,
+    ):
         self.foreground_segment_usecase = foreground_segment_usecase
+        self.storage_usecase = storage_usecase
 
     @stop_watch
     def foreground_segment(
         self, foreground_segment_request: ForegroundSegmentRequest
     ) -> ForegroundSegmentResponse:
+        return self._foreground_segment(
+            params=foreground_segment_request,
+            image_bytes=self.storage_usecase.read_image(
+                foreground_segment_request.image
+            ),
+        )
+
+    @stop_watch
+    def foreground_segment_upload(
+        self, params: ForegroundSegmentParams, image_bytes: bytes
+    ) -> ForegroundSegmentResponse:
+        """binaryでアップロードされた画像に対して前景抽出を行う"""
+        return self._foreground_segment(params=params, image_bytes=image_bytes)
+
+    def _foreground_segment(
+        self, params: ForegroundSegmentParams, image_bytes: bytes
+    ) -> ForegroundSegmentResponse:
+        image, original_size = decode_image(
+            image_bytes, max_side=get_settings().input_image_max_side
+        )
         usecase_input = ForegroundSegmentUsecaseInput(
-            image=base642pil(image_base64=foreground_segment_request.image),
-            segmenter_type=foreground_segment_request.segmenter_type,
+            image=image,
+            segmenter_type=params.segmenter_type,
+            resolution=params.resolution,
+            original_size=original_size,
         )
         usecase_output = self.foreground_segment_usecase.foreground_segment(
             foreground_segment_usecase_input=usecase_input,
         )
-        mask_array = pil2base64(usecase_output.mask)
-        return ForegroundSegmentResponse(mask=mask_array)
+        (mask,) = self._encode_masks(
+            [usecase_output.mask],
+            mask_format=params.mask_format,
+            output_uri=params.output_uri,
+            names=["mask"],
+        )
+        return ForegroundSegmentResponse(mask=mask)
+
+    @stop_watch
+    def foreground_segment_batch(
+        self, foreground_segment_batch_request: ForegroundSegmentBatchRequest
+    ) -> ForegroundSegmentBatchResponse:
+        max_side = get_settings().input_image_max_side
+        decoded = [
+            decode_image(image_bytes, max_side=max_side)
+            for image_bytes in self.storage_usecase.read_images(
+                foreground_segment_batch_request.images
+            )
+        ]
+        usecase_input = ForegroundSegmentBatchUsecaseInput(
+            images=[image for image, _ in decoded],
+            segmenter_type=foreground_segment_batch_request.segmenter_type,
+            resolution=foreground_segment_batch_request.resolution,
+            original_sizes=[original_size for _, original_size in decoded],
+        )
+        usecase_output = self.foreground_segment_usecase.foreground_segment_batch(
+            foreground_segment_batch_usecase_input=usecase_input,
+        )
+        return ForegroundSegmentBatchResponse(
+            masks=self._encode_masks(
+                usecase_output.masks,
+                mask_format=foreground_segment_batch_request.mask_format,
+                output_uri=foreground_segment_batch_request.output_uri,
+                names=[f"mask_{i:03d}" for i in range(len(usecase_output.masks))],
+            )
+        )
+
+    def _encode_masks(
+        self,
+        masks: list[Image.Image],
+        mask_format: MaskFormat,
+        output_uri: str | None,
+        names: list[str],
+    ) -> list[str | RLEMask]:
+        """output_uriを指定した場合はmaskを書き出してURIを返す"""
+        if output_uri is None:
+            return encode_masks(masks, mask_format)
+        return list(
+            self.storage_usecase.write_masks(
+                masks, mask_format=mask_format, output_uri=output_uri, names=names
+            )
+        )
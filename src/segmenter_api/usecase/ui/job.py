@@ -0,0 +1,410 @@
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import UTC, datetime, timedelta
+from functools import partial
+from typing import Any
+
+from injector import inject, singleton
+from pydantic import ValidationError
+
+from segmenter_api.domain.model.errors import (
+    BadRequestError,
+    BaseApiError,
+    NotFoundError,
+    TooManyRequestsError,
+)
+from segmenter_api.domain.model.job import (
+    CHECKPOINT_FILE_NAME,
+    JobCreateRequest,
+    JobItem,
+    JobItemResult,
+    JobItemStatus,
+    JobState,
+    JobStatus,
+)
+from segmenter_api.domain.model.mask import MaskFormat
+from segmenter_api.domain.model.text2segment import (
+    Text2SegmentParams,
+    Text2SegmentResponse,
+)
+from segmenter_api.domain.repository.file import FileRepositoryInterface
+from segmenter_api.settings import get_settings
+from segmenter_api.usecase.service.storage import StorageUsecase, check_bucket
+from segmenter_api.usecase.ui.text2segment import Text2SegmentUserInterface
+from segmenter_api.utils.logger import get_logger
+from segmenter_api.utils.metrics import get_metrics
+from segmenter_api.utils.time import stop_watch
+
+logger = get_logger(__name__)
+
+settings = get_settings()
+
+# 実行中とみなすjobの状態
+ACTIVE_STATUSES = (JobStatus.QUEUED, JobStatus.RUNNING)
+
+
+@singleton
+class JobUserInterface:
+    """manifestに列挙した画像をまとめてtext2segmentするjobを管理する
+    jobはbackgroundのthreadで実行し、itemごとの結果と進捗をoutput_uriの下に書き出す
+    output_uri/
+        _checkpoint.json: jobの進捗。next_indexより前のitemは処理済み
+        _claims/{attempt}.json: 作成・再開したworkerが最初に書いたjobの状態
+        results/{batchの先頭のindex}.jsonl: itemごとの結果(JobItemResult)
+        items/{index}/: itemのmask
+    gunicornのworkerごとに実行中のjobの状態をメモリに持つため、
+    終了したjobと他のworkerが実行しているjobは
+    gs://{google_cloud_storage_bucket}/jobs/{job_id}に記録したoutput_uriの
+    checkpointから読み込む
+    """
+
+    @inject
+    def __init__(
+        self,
+        text2segment_user_interface: Text2SegmentUserInterface,
+        storage_usecase: StorageUsecase,
+        file_repository: FileRepositoryInterface,
+    ):
+        self.text2segment_user_interface = text2segment_user_interface
+        self.storage_usecase = storage_usecase
+        self.file_repository = file_repository
+        self.jobs: dict[str, JobState] = {}
+        self.lock = threading.Lock()
+        # checkpointを古い状態で上書きしないよう、書き込みを順番に行う
+        self.checkpoint_lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(
+            max_workers=settings.job_max_concurrent_jobs, thread_name_prefix="job"
+        )
+        threading.Thread(
+            target=self._heartbeat, name="job-heartbeat", daemon=True
+        ).start()
+
+    @stop_watch
+    def create_job(self, job_create_request: JobCreateRequest) -> JobState:
+        """jobを作成して実行を予約する
+        output_uriに_checkpoint.jsonがある場合は、そのjobを続きから再開する
+        他のworkerが実行中のjobは再開せず、そのcheckpointを返す
+        """
+        check_bucket(job_create_request.manifest_uri)
+        check_bucket(job_create_request.output_uri)
+        checkpoint = self._read_checkpoint(job_create_request.output_uri)
+        now = datetime.now(UTC)
+        if checkpoint is None:
+            state = JobState(
+                job_id=uuid.uuid4().hex,
+                manifest_uri=job_create_request.manifest_uri,
+                output_uri=job_create_request.output_uri,
+                status=JobStatus.QUEUED,
+                batch_size=job_create_request.batch_size or settings.job_batch_size,
+                created_at=now,
+                updated_at=now,
+            )
+        else:
+            check_manifest(job_create_request, checkpoint)
+            with self.lock:
+                current = self.jobs.get(checkpoint.job_id)
+            if current is not None and current.status in ACTIVE_STATUSES:
+                return current
+            if checkpoint.status == JobStatus.SUCCEEDED or is_lease_alive(
+                checkpoint, now
+            ):
+                return checkpoint
+            logger.info(
+                f"job: {checkpoint.job_id}を{checkpoint.next_index}件目から再開します"
+            )
+            state = checkpoint.model_copy(
+                update={
+                    "status": JobStatus.QUEUED,
+                    "batch_size": job_create_request.batch_size
+                    or checkpoint.batch_size,
+                    "updated_at": now,
+                    "items_per_second": None,
+                    "eta_seconds": None,
+                    "error": None,
+                    "attempt": checkpoint.attempt + 1,
+                }
+            )
+        claimed = self._claim(state)
+        if claimed is not None:
+            # 同時に作成・再開した他のworkerが実行する
+            check_manifest(job_create_request, claimed)
+            return claimed
+        self.file_repository.write_bytes(
+            job_index_uri(state.job_id),
+            state.output_uri.encode(),
+            content_type="text/plain",
+        )
+        with self.lock:
+            self.jobs[state.job_id] = state
+        self._write_checkpoint(state)
+        self.executor.submit(self._run, state.job_id)
+        return state
+
+    def get_job(self, job_id: str) -> JobState:
+        with self.lock:
+            state = self.jobs.get(job_id)
+        if state is None:
+            state = self._read_job(job_id)
+        if state is None:
+            error_msg = (
+                f"job: {job_id}が見つかりません。"
+                "再起動した場合は同じmanifest_uriとoutput_uriでjobを作成すると再開します"
+            )
+            raise NotFoundError(error_msg)
+        return state
+
+    def _run(self, job_id: str) -> None:
+        state = self._update(job_id, status=JobStatus.RUNNING)
+        try:
+            manifest = self.file_repository.read_bytes(state.manifest_uri)
+            lines = [line for line in manifest.decode("utf-8").splitlines() if line]
+            self._update(job_id, total=len(lines))
+            self._process(job_id, lines)
+        except Exception as e:
+            logger.exception(f"job: {job_id}が失敗しました")
+            self._update(job_id, status=JobStatus.FAILED, error=error_message(e))
+            return
+        self._update(job_id, status=JobStatus.SUCCEEDED, eta_seconds=0)
+
+    def _process(self, job_id: str, lines: list[str]) -> None:
+        """batchごとに処理し、処理中に次のbatchの画像を読み込んでおく"""
+        state = self.get_job(job_id)
+        starts = list(range(state.next_index, len(lines), state.batch_size))
+        started_at = time.perf_counter()
+        processed = 0
+        with (
+            ThreadPoolExecutor(max_workers=settings.job_prefetch_workers) as io_pool,
+            ThreadPoolExecutor(max_workers=settings.job_item_concurrency) as item_pool,
+        ):
+            batch_size = state.batch_size
+            prefetched = (
+                self._prefetch(io_pool, lines, starts[0], batch_size) if starts else []
+            )
+            for i, start in enumerate(starts):
+                batch = prefetched
+                if i + 1 < len(starts):
+                    prefetched = self._prefetch(
+                        io_pool, lines, starts[i + 1], batch_size
+                    )
+                # 同時に処理したitemのdetectはmicro-batchingでまとめられる
+                results = list(
+                    item_pool.map(
+                        partial(self._process_item, state),
+                        *zip(*batch, strict=True),
+                    )
+                )
+                self._write_results(state, start, results)
+                processed += len(results)
+                items_per_second = processed / (time.perf_counter() - started_at)
+                next_index = start + len(results)
+                succeeded = sum(r.status == JobItemStatus.SUCCEEDED for r in results)
+                metrics = get_metrics()
+                metrics.increment("job.items.succeeded", succeeded)
+                metrics.increment("job.items.failed", len(results) - succeeded)
+                metrics.observe("job.items_per_second", items_per_second)
+                state = self._update(
+                    job_id,
+                    next_index=next_index,
+                    succeeded=state.succeeded + succeeded,
+                    failed=state.failed + len(results) - succeeded,
+                    items_per_second=items_per_second,
+                    eta_seconds=(len(lines) - next_index) / items_per_second,
+                )
+
+    def _prefetch(
+        self,
+        io_pool: ThreadPoolExecutor,
+        lines: list[str],
+        start: int,
+        batch_size: int,
+    ) -> list[tuple[int, str, Future[bytes]]]:
+        """batchのitemの画像の読み込みをio_poolで始める"""
+        return [
+            (index, lines[index], io_pool.submit(self._read_image, lines[index]))
+            for index in range(start, min(start + batch_size, len(lines)))
+        ]
+
+    def _read_image(self, line: str) -> bytes:
+        item = JobItem.model_validate_json(line)
+        return self.storage_usecase.read_image(item.image)
+
+    def _process_item(
+        self,
+        state: JobState,
+        index: int,
+        line: str,
+        loaded: Future[bytes],
+    ) -> JobItemResult:
+        """1件の失敗でjob全体を止めないよう、例外はitemの結果として記録する"""
+        try:
+            item = JobItem.model_validate_json(line)
+        except ValidationError as e:
+            return JobItemResult(
+                index=index, status=JobItemStatus.FAILED, error=error_message(e)
+            )
+        item_id = item.id if item.id is not None else str(index)
+        try:
+            image_bytes = loaded.result()
+        except Exception as e:  # noqa: BLE001
+            return JobItemResult(
+                index=index,
+                id=item_id,
+                status=JobItemStatus.FAILED,
+                error=error_message(e),
+            )
+        # rleのmaskは小さいため書き出さずに結果に含める
+        output_uri = (
+            None
+            if item.mask_format == MaskFormat.RLE
+            else f"{state.output_uri.rstrip('/')}/items/{index:06d}"
+        )
+        try:
+            response = self._text2segment(
+                item.model_copy(update={"output_uri": output_uri}), image_bytes
+            )
+        except Exception as e:  # noqa: BLE001
+            return JobItemResult(
+                index=index,
+                id=item_id,
+                status=JobItemStatus.FAILED,
+                error=error_message(e),
+            )
+        return JobItemResult(
+            index=index,
+            id=item_id,
+            status=JobItemStatus.SUCCEEDED,
+            labels=response.labels,
+            bboxes=response.bboxes,
+            masks=response.masks,
+            label_map=response.label_map,
+            image_size=response.image_size,
+        )
+
+    def _text2segment(
+        self, params: Text2SegmentParams, image_bytes: bytes
+    ) -> Text2SegmentResponse:
+        """モデルの待ち行列が一杯の場合はitemを失敗にせず、空くまで待って再試行する"""
+        while True:
+            try:
+                return self.text2segment_user_interface.text2segment_upload(
+                    params=params, image_bytes=image_bytes
+                )
+            except TooManyRequestsError as e:
+                time.sleep(e.retry_after)
+
+    def _write_results(
+        self, state: JobState, start: int, results: list[JobItemResult]
+    ) -> None:
+        # 再開時に同じbatchを処理し直しても同じファイルを上書きする
+        self.file_repository.write_bytes(
+            f"{state.output_uri.rstrip('/')}/results/{start:06d}.jsonl",
+            "".join(f"{result.model_dump_json()}\n" for result in results).encode(),
+            content_type="application/jsonl",
+        )
+
+    def _update(self, job_id: str, **changes: Any) -> JobState:
+        """jobの状態を更新してcheckpointに書き出す
+        終了したjobはメモリから除き、以降の状態はcheckpointから返す
+        """
+        with self.checkpoint_lock:
+            with self.lock:
+                state = self.jobs[job_id].model_copy(
+                    update={**changes, "updated_at": datetime.now(UTC)}
+                )
+                self.jobs[job_id] = state
+            self._write_checkpoint(state)
+            if state.status not in ACTIVE_STATUSES:
+                # checkpointを書き出してから除くため、get_jobは古い状態を返さない
+                with self.lock:
+                    del self.jobs[job_id]
+        return state
+
+    def _heartbeat(self) -> None:
+        """実行中のjobのcheckpointを定期的に更新し、他のworkerに再開させない
+        1つのitemの処理やqueuedで待つ時間がjob_lease_secondsを超えても更新できる
+        """
+        while True:
+            time.sleep(settings.job_lease_seconds / 3)
+            with self.lock:
+                job_ids = [
+                    job_id
+                    for job_id, state in self.jobs.items()
+                    if state.status in ACTIVE_STATUSES
+                ]
+            for job_id in job_ids:
+                try:
+                    self._update(job_id)
+                except KeyError:
+                    # job_idsを集めた後に終了してメモリから除いたjob
+                    continue
+                except Exception:
+                    logger.exception(f"job: {job_id}のcheckpointを更新できませんでした")
+
+    def _claim(self, state: JobState) -> JobState | None:
+        """jobのこの回の作成・再開を予約する
+        他のworkerが先に予約していた場合は、そのworkerのjobの状態を返す
+        """
+        uri = f"{state.output_uri.rstrip('/')}/_claims/{state.attempt:06d}.json"
+        if self.file_repository.create_bytes(
+            uri, state.model_dump_json().encode(), content_type="application/json"
+        ):
+            return None
+        return JobState.model_validate_json(self.file_repository.read_bytes(uri))
+
+    def _read_job(self, job_id: str) -> JobState | None:
+        """他のworkerが作成したjobの状態をcheckpointから読み込む"""
+        # job_idはURIの一部になるため、作成時のidの形式以外は探さない
+        if not job_id.isalnum():
+            return None
+        try:
+            output_uri = self.file_repository.read_bytes(job_index_uri(job_id))
+        except NotFoundError:
+            return None
+        return self._read_checkpoint(output_uri.decode("utf-8"))
+
+    def _read_checkpoint(self, output_uri: str) -> JobState | None:
+        try:
+            checkpoint = self.file_repository.read_bytes(checkpoint_uri(output_uri))
+        except NotFoundError:
+            return None
+        return JobState.model_validate_json(checkpoint)
+
+    def _write_checkpoint(self, state: JobState) -> None:
+        self.file_repository.write_bytes(
+            checkpoint_uri(state.output_uri),
+            state.model_dump_json(indent=2).encode(),
+            content_type="application/json",
+        )
+
+
+def checkpoint_uri(output_uri: str) -> str:
+    return f"{output_uri.rstrip('/')}/{CHECKPOINT_FILE_NAME}"
+
+
+def job_index_uri(job_id: str) -> str:
+    """job_idからoutput_uriを探すためのobject"""
+    return f"gs://{settings.google_cloud_storage_bucket}/jobs/{job_id}"
+
+
+def check_manifest(job_create_request: JobCreateRequest, state: JobState) -> None:
+    if state.manifest_uri != job_create_request.manifest_uri:
+        error_msg = (
+            f"output_uri: {job_create_request.output_uri}には"
+            f"別のmanifest({state.manifest_uri})のjobの結果があります"
+        )
+        raise BadRequestError(error_msg)
+
+
+def is_lease_alive(state: JobState, now: datetime) -> bool:
+    """他のworkerが実行中で、checkpointを更新し続けているか"""
+    return state.status in ACTIVE_STATUSES and now - state.updated_at < timedelta(
+        seconds=settings.job_lease_seconds
+    )
+
+
+def error_message(error: Exception) -> str:
+    if isinstance(error, BaseApiError):
+        return error.msg
+    return f"{error.__class__.__name__}: {error}"
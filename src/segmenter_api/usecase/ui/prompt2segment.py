@@ -0,0 +1,85 @@
+import numpy as np
+from injector import inject
+
+from segmenter_api.domain.model.errors import BadRequestError
+from segmenter_api.domain.model.prompt2segment import (
+    LOW_RES_MASK_SIZE,
+    Prompt2SegmentRequest,
+    Prompt2SegmentResponse,
+    Prompt2SegmentUsecaseInput,
+)
+from segmenter_api.settings import get_settings
+from segmenter_api.usecase.service.prompt2segment import Prompt2SegmentUsecase
+from segmenter_api.usecase.service.storage import StorageUsecase
+from segmenter_api.utils.array import base642ndarray, ndarray2base64
+from segmenter_api.utils.image import decode_image
+from segmenter_api.utils.mask_encoder import ImageCodec, get_mask_encoder
+from segmenter_api.utils.time import stop_watch
+
+
+class Prompt2SegmentUserInterface:
+    @inject
+    def __init__(
+        self,
+        prompt2segment_usecase: Prompt2SegmentUsecase,
+        storage_usecase: StorageUsecase,
+    ):
+        self.prompt2segment_usecase = prompt2segment_usecase
+        self.storage_usecase = storage_usecase
+
+    @stop_watch
+    def prompt2segment(
+        self, prompt2segment_request: Prompt2SegmentRequest
+    ) -> Prompt2SegmentResponse:
+        image, original_size = None, None
+        if prompt2segment_request.image is not None:
+            image, original_size = decode_image(
+                self.storage_usecase.read_image(prompt2segment_request.image),
+                max_side=get_settings().input_image_max_side,
+            )
+        usecase_input = Prompt2SegmentUsecaseInput(
+            segmenter_type=prompt2segment_request.segmenter_type,
+            image=image,
+            image_id=prompt2segment_request.image_id,
+            original_size=original_size,
+            point_coords=prompt2segment_request.point_coords,
+            point_labels=prompt2segment_request.point_labels,
+            box=prompt2segment_request.box,
+            mask_input=(
+                decode_mask_input(prompt2segment_request.mask_input)
+                if prompt2segment_request.mask_input is not None
+                else None
+            ),
+            multimask_output=prompt2segment_request.multimask_output,
+        )
+        usecase_output = self.prompt2segment_usecase.prompt2segment(
+            prompt2segment_usecase_input=usecase_input,
+        )
+        return Prompt2SegmentResponse(
+            image_id=usecase_output.image_id,
+            masks=get_mask_encoder().encode(usecase_output.masks, ImageCodec.PNG),
+            scores=usecase_output.scores,
+            low_res_logits=[
+                ndarray2base64(logit.astype(np.float16))
+                for logit in usecase_output.low_res_logits
+            ],
+        )
+
+
+def decode_mask_input(mask_input_base64: str) -> np.ndarray:
+    """base64の低解像度mask logitをmask decoderの入力(1, 256, 256)に変換する"""
+    try:
+        mask_input = base642ndarray(mask_input_base64)
+    except (ValueError, EOFError, OSError) as e:
+        error_msg = f"mask_inputを.npyとして読み込めません: {e}"
+        raise BadRequestError(error_msg) from e
+    expected_shape = (LOW_RES_MASK_SIZE, LOW_RES_MASK_SIZE)
+    if mask_input.shape[-2:] != expected_shape or mask_input.size != np.prod(
+        expected_shape
+    ):
+        error_msg = (
+            f"mask_inputのshapeが不正です。expected: {expected_shape}, "
+            f"actual: {mask_input.shape}"
+        )
+        raise BadRequestError(error_msg)
+    return mask_input.reshape(1, *expected_shape).astype(np.float32)
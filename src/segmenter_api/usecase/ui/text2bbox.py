@@ -2,25 +2,55 @@ from injector import inject
 
 from segmenter_api.domain.model.text2bbox import (
     Text2BboxInput,
+    Text2BboxParams,
     Text2BboxRequest,
     Text2BboxResponse,
 )
+from segmenter_api.settings import get_settings
+from segmenter_api.usecase.service.storage import StorageUsecase
 from segmenter_api.usecase.service.text2bbox import Text2BboxUsecase
-from segmenter_api.utils.image import base642pil
+from segmenter_api.utils.image import decode_image
 from segmenter_api.utils.time import stop_watch
 
 
 class Text2BboxUserInterface:
     @inject
-    def __init__(self, text2bbox_usecase: Text2BboxUsecase):
+    def __init__(
+        self, text2bbox_usecase: Text2BboxUsecase, storage_usecase: StorageUsecase
+    ):
         self.text2bbox_usecase = text2bbox_usecase
+        self.storage_usecase = storage_usecase
 
     @stop_watch
     def text2bbox(self, text2bbox_request: Text2BboxRequest) -> Text2BboxResponse:
+        return self._text2bbox(
+            params=text2bbox_request,
+            image_bytes=self.storage_usecase.read_image(text2bbox_request.image),
+        )
+
+    @stop_watch
+    def text2bbox_upload(
+        self, params: Text2BboxParams, image_bytes: bytes
+    ) -> Text2BboxResponse:
+        """binaryでアップロードされた画像に対してtext2bboxを行う"""
+        return self._text2bbox(params=params, image_bytes=image_bytes)
+
+    def _text2bbox(
+        self, params: Text2BboxParams, image_bytes: bytes
+    ) -> Text2BboxResponse:
+        image, original_size = decode_image(
+            image_bytes, max_side=get_settings().input_image_max_side
+        )
         usecase_input = Text2BboxInput(
-            texts=text2bbox_request.texts,
-            image=base642pil(image_base64=text2bbox_request.image),
-            detector_type=text2bbox_request.detector_type,
+            texts=params.texts,
+            image=image,
+            detector_type=params.detector_type,
+            quality=params.quality,
+            box_threshold=params.box_threshold,
+            text_threshold=params.text_threshold,
+            max_detections=params.max_detections,
+            use_cache=params.use_cache,
+            original_size=original_size,
         )
         usecase_output = self.text2bbox_usecase.text2bbox(
             text2bbox_input=usecase_input,
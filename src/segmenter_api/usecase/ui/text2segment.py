@@ -1,35 +1,259 @@
-from injector import inject
+import queue
 
+from injector import inject, singleton
+from PIL import Image
+from pydantic import BaseModel, ConfigDict
+
+from segmenter_api.domain.model.errors import TooManyRequestsError
+from segmenter_api.domain.model.mask import (
+    CroppedMask,
+    LabelMap,
+    MaskFormat,
+    RLEMask,
+    build_label_map,
+    crop_mask,
+    encode_label_map,
+    encode_masks,
+)
 from segmenter_api.domain.model.text2segment import (
     Text2SegmentInput,
+    Text2SegmentOutput,
+    Text2SegmentParams,
     Text2SegmentRequest,
     Text2SegmentResponse,
 )
+from segmenter_api.domain.service.detector import DetectorOutput
+from segmenter_api.settings import get_settings
+from segmenter_api.usecase.service.storage import StorageUsecase
 from segmenter_api.usecase.service.text2segment import Text2SegmentUsecase
-from segmenter_api.utils.image import base642pil, pil2base64
+from segmenter_api.utils.image import decode_image
+from segmenter_api.utils.mask_encoder import ImageCodec
+from segmenter_api.utils.metrics import get_metrics
+from segmenter_api.utils.pipeline import Pipeline, PipelineStage
 from segmenter_api.utils.time import stop_watch
 
 
+class Text2SegmentTask(BaseModel):
+    """text2segmentのpipelineの最初の段(decode)への入力"""
+
+    params: Text2SegmentParams
+    image_bytes: bytes
+
+
+class DecodedTask(BaseModel):
+    """decodeの段の出力"""
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+    params: Text2SegmentParams
+    usecase_input: Text2SegmentInput
+    # デコード時に縮小する前の画像の(width, height)
+    original_size: tuple[int, int]
+
+
+class DetectedTask(DecodedTask):
+    """detectの段の出力"""
+
+    detector_output: DetectorOutput
+
+
+class SegmentedTask(DecodedTask):
+    """segmentの段の出力"""
+
+    usecase_output: Text2SegmentOutput
+
+
+@singleton
 class Text2SegmentUserInterface:
+    """text2segmentをdecode→detect→segment→encodeのpipelineで処理する
+    段ごとにworkerを持つため、あるリクエストのsegment中に別のリクエストのdetectを進められる
+    """
+
     @inject
-    def __init__(self, text2segment_usecase: Text2SegmentUsecase):
+    def __init__(
+        self,
+        text2segment_usecase: Text2SegmentUsecase,
+        storage_usecase: StorageUsecase,
+    ):
         self.text2segment_usecase = text2segment_usecase
+        self.storage_usecase = storage_usecase
+        settings = get_settings()
+        self.pipeline = Pipeline(
+            name="text2segment",
+            stages=[
+                PipelineStage(
+                    "decode", self._decode, settings.text2segment_pipeline_io_workers
+                ),
+                # micro-batchingでまとめられるよう、detectorの同時実行数だけworkerを置く
+                PipelineStage(
+                    "detect", self._detect, settings.detector_max_concurrency
+                ),
+                PipelineStage(
+                    "segment", self._segment, settings.segmenter_max_concurrency
+                ),
+                PipelineStage(
+                    "encode", self._encode, settings.text2segment_pipeline_io_workers
+                ),
+            ],
+            queue_size=settings.text2segment_pipeline_queue_size,
+        )
+        get_metrics().register_collector("pipeline.text2segment", self.pipeline.stats)
 
     @stop_watch
     def text2segment(
         self, text2segment_request: Text2SegmentRequest
     ) -> Text2SegmentResponse:
+        return self._text2segment(
+            params=text2segment_request,
+            image_bytes=self.storage_usecase.read_image(text2segment_request.image),
+        )
+
+    @stop_watch
+    def text2segment_upload(
+        self, params: Text2SegmentParams, image_bytes: bytes
+    ) -> Text2SegmentResponse:
+        """binaryでアップロードされた画像に対してtext2segmentを行う"""
+        return self._text2segment(params=params, image_bytes=image_bytes)
+
+    def _text2segment(
+        self, params: Text2SegmentParams, image_bytes: bytes
+    ) -> Text2SegmentResponse:
+        settings = get_settings()
+        task = Text2SegmentTask(params=params, image_bytes=image_bytes)
+        if not settings.text2segment_pipeline_enabled:
+            return self._encode(self._segment(self._detect(self._decode(task))))
+        try:
+            future = self.pipeline.submit(task)
+        except queue.Full:
+            retry_after = settings.model_min_retry_after_seconds
+            error_msg = (
+                "text2segmentの待ち行列が一杯です。"
+                f"{retry_after}秒後に再試行してください"
+            )
+            raise TooManyRequestsError(error_msg, retry_after=retry_after) from None
+        return future.result()
+
+    def _decode(self, task: Text2SegmentTask) -> DecodedTask:
+        params = task.params
+        image, original_size = decode_image(
+            task.image_bytes, max_side=get_settings().input_image_max_side
+        )
         usecase_input = Text2SegmentInput(
-            texts=text2segment_request.texts,
-            image=base642pil(image_base64=text2segment_request.image),
-            detector_type=text2segment_request.detector_type,
-            segmenter_type=text2segment_request.segmenter_type,
+            texts=params.texts,
+            image=image,
+            detector_type=params.detector_type,
+            quality=params.quality,
+            box_threshold=params.box_threshold,
+            text_threshold=params.text_threshold,
+            max_detections=params.max_detections,
+            use_cache=params.use_cache,
+            segmenter_type=params.segmenter_type,
+            original_size=original_size,
         )
-        usecase_output = self.text2segment_usecase.text2segment(
-            text2segment_input=usecase_input,
+        return DecodedTask(
+            params=params, usecase_input=usecase_input, original_size=original_size
+        )
+
+    def _detect(self, task: DecodedTask) -> DetectedTask:
+        return DetectedTask(
+            params=task.params,
+            usecase_input=task.usecase_input,
+            original_size=task.original_size,
+            detector_output=self.text2segment_usecase.detect(task.usecase_input),
         )
+
+    def _segment(self, task: DetectedTask) -> SegmentedTask:
+        return SegmentedTask(
+            params=task.params,
+            usecase_input=task.usecase_input,
+            original_size=task.original_size,
+            usecase_output=self.text2segment_usecase.segment(
+                task.usecase_input, task.detector_output
+            ),
+        )
+
+    def _encode(self, task: SegmentedTask) -> Text2SegmentResponse:
+        params = task.params
+        usecase_output = task.usecase_output
+        original_size = task.original_size
+        bboxes = [list(bbox) for bbox in usecase_output.detector_output.bboxes]
+        image_id = usecase_output.bbox2segment_output.image_id
+        if params.mask_format == MaskFormat.LABEL_MAP:
+            return Text2SegmentResponse(
+                labels=usecase_output.labels,
+                masks=[],
+                bboxes=bboxes,
+                image_id=image_id,
+                image_size=original_size,
+                label_map=self._label_map(
+                    params,
+                    masks=usecase_output.masks,
+                    labels=usecase_output.labels,
+                    bboxes=bboxes,
+                    image_size=original_size,
+                ),
+            )
+        if not params.crop_to_bbox:
+            masks: list[str | RLEMask | CroppedMask] = list(
+                self._encode_masks(params, usecase_output.masks)
+            )
+            return Text2SegmentResponse(
+                labels=usecase_output.labels,
+                masks=masks,
+                bboxes=bboxes,
+                image_id=image_id,
+                image_size=original_size,
+            )
+        crops = [
+            crop_mask(mask, bbox=bbox, padding=params.crop_padding)
+            for mask, bbox in zip(usecase_output.masks, bboxes, strict=True)
+        ]
+        # 小さい物体ほど切り出した分だけencodeする画素が減る
+        encoded = self._encode_masks(params, [crop for crop, _ in crops])
         return Text2SegmentResponse(
             labels=usecase_output.labels,
-            masks=[pil2base64(image=mask) for mask in usecase_output.masks],
-            bboxes=[list(bbox) for bbox in usecase_output.detector_output.bboxes],
+            masks=[
+                CroppedMask(mask=mask, offset=offset)
+                for mask, (_, offset) in zip(encoded, crops, strict=True)
+            ],
+            bboxes=bboxes,
+            image_id=image_id,
+            image_size=original_size,
+        )
+
+    def _encode_masks(
+        self, params: Text2SegmentParams, masks: list[Image.Image]
+    ) -> list[str | RLEMask]:
+        """output_uriを指定した場合はmaskを書き出してURIを返す"""
+        if params.output_uri is None:
+            return encode_masks(masks, params.mask_format)
+        return list(
+            self.storage_usecase.write_masks(
+                masks,
+                mask_format=params.mask_format,
+                output_uri=params.output_uri,
+                names=[f"mask_{i:03d}" for i in range(len(masks))],
+            )
+        )
+
+    def _label_map(
+        self,
+        params: Text2SegmentParams,
+        masks: list[Image.Image],
+        labels: list[str],
+        bboxes: list[list[float]],
+        image_size: tuple[int, int],
+    ) -> LabelMap:
+        if params.output_uri is None:
+            return encode_label_map(
+                masks, labels=labels, bboxes=bboxes, image_size=image_size
+            )
+        image, instances = build_label_map(
+            masks, labels=labels, bboxes=bboxes, image_size=image_size
+        )
+        (uri,) = self.storage_usecase.write_images(
+            [image],
+            codec=ImageCodec.PNG,
+            output_uri=params.output_uri,
+            names=["label_map"],
         )
+        return LabelMap(image=uri, instances=instances)
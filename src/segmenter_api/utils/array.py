@@ -0,0 +1,17 @@
+import base64
+from io import BytesIO
+
+import numpy as np
+
+
+def ndarray2base64(array: np.ndarray) -> str:
+    """ndarrayを.npy形式でシリアライズしてbase64にする"""
+    buffered = BytesIO()
+    np.save(buffered, array, allow_pickle=False)
+    return base64.b64encode(buffered.getvalue()).decode("utf-8")
+
+
+def base642ndarray(array_base64: str) -> np.ndarray:
+    """base64の.npyをndarrayに戻す。任意のobjectを復元しないようpickleは許可しない"""
+    array_bytes = base64.b64decode(array_base64)
+    return np.load(BytesIO(array_bytes), allow_pickle=False)
@@ -0,0 +1,111 @@
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Callable, Hashable
+from typing import Any, Generic, TypeVar
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class LRUCache(Generic[K, V]):
+    """スレッドセーフなLRUキャッシュ
+    max_bytesを指定した場合はsizeofで計算したbyteサイズの合計で、
+    max_itemsを指定した場合は要素数でLRU順に追い出す
+    ttl_secondsを指定した場合は、登録から一定時間経過したエントリを無効にする
+    """
+
+    def __init__(
+        self,
+        max_bytes: int | None = None,
+        max_items: int | None = None,
+        sizeof: Callable[[V], int] | None = None,
+        ttl_seconds: float | None = None,
+    ):
+        if max_bytes is not None and sizeof is None:
+            error_msg = "max_bytesを指定する場合はsizeofも指定してください"
+            raise ValueError(error_msg)
+        self.max_bytes = max_bytes
+        self.max_items = max_items
+        self.sizeof = sizeof
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        # key -> (value, byteサイズ, 有効期限)
+        self._entries: OrderedDict[K, tuple[V, int, float]] = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: K) -> V | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry[2] < time.monotonic():
+                self._bytes -= self._entries.pop(key)[1]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: K, value: V) -> None:
+        size = self.sizeof(value) if self.sizeof is not None else 0
+        if self.max_bytes is not None and size > self.max_bytes:
+            # 単体で上限を超えるものはキャッシュしない
+            return
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= self._entries.pop(key)[1]
+            expires_at = (
+                time.monotonic() + self.ttl_seconds
+                if self.ttl_seconds is not None
+                else float("inf")
+            )
+            self._entries[key] = (value, size, expires_at)
+            self._bytes += size
+            while self._is_over_capacity():
+                _, (_, evicted_size, _) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def _is_over_capacity(self) -> bool:
+        if self.max_bytes is not None and self._bytes > self.max_bytes:
+            return True
+        return self.max_items is not None and len(self._entries) > self.max_items
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: K) -> bool:
+        return key in self._entries
+
+    @property
+    def nbytes(self) -> int:
+        return self._bytes
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            requests = self.hits + self.misses
+            return {
+                "policy": "lru",
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "hit_rate": self.hits / requests if requests else 0.0,
+                "items": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "max_items": self.max_items,
+                "ttl_seconds": self.ttl_seconds,
+            }
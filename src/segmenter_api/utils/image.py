@@ -1,4 +1,5 @@
 import base64
+import hashlib
 from io import BytesIO
 
 from PIL import Image, ImageDraw
@@ -27,6 +28,11 @@ def resize_image_keep_aspect(img: Image.Image, long_size: int):
 
 def base642pil(image_base64: str) -> Image.Image:
     image_bytes = base64.b64decode(image_base64)
+    return bytes2pil(image_bytes)
+
+
+def bytes2pil(image_bytes: bytes) -> Image.Image:
+    """エンコードされた画像のbytesをPIL.Imageにする"""
     image = Image.open(BytesIO(image_bytes))
     return image
 
@@ -37,6 +43,67 @@ def pil2base64(image: Image.Image) -> str:
     return base64.b64encode(buffered.getvalue()).decode("utf-8")
 
 
+def decode_image(
+    image_bytes: bytes, max_side: int | None = None
+) -> tuple[Image.Image, tuple[int, int]]:
+    """画像をRGBでデコードし、長辺がmax_sideを超える場合は縮小する
+    JPEGはdraft modeで1/2, 1/4, 1/8のスケールのままデコードし、
+    フル解像度の画素を展開しない。それ以外の形式はデコード後に縮小する
+    モデルはRGBの画像を受け取るため、後段で変換し直さないようここで1回だけ変換する
+    Returns:
+        デコードした画像, 元画像の(width, height)
+    """
+    image: Image.Image = Image.open(BytesIO(image_bytes))
+    original_size = image.size
+    if max_side is None or max(original_size) <= max_side:
+        return ensure_rgb(image), original_size
+    if image.format == "JPEG":
+        # max_side以上を保つ最小のスケールでデコードされる
+        image.draft(image.mode, fit_size(original_size, max_side))
+    image = ensure_rgb(image)
+    # Pillowの縮小はアンチエイリアスされるためbilinearで十分
+    image.thumbnail((max_side, max_side), Image.Resampling.BILINEAR)
+    return image, original_size
+
+
+def fit_size(image_size: tuple[int, int], max_side: int) -> tuple[int, int]:
+    """縦横比を維持して長辺がmax_sideになるサイズ"""
+    width, height = image_size
+    scale = max_side / max(width, height)
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def ensure_rgb(image: Image.Image) -> Image.Image:
+    """RGBでない場合だけconvertし、不要なcopyを避ける"""
+    return image if image.mode == "RGB" else image.convert("RGB")
+
+
+def scale_bboxes(
+    bboxes: list[tuple[float, float, float, float]],
+    from_size: tuple[int, int],
+    to_size: tuple[int, int],
+) -> list[tuple[float, float, float, float]]:
+    """from_sizeの画像上のbboxをto_sizeの画像の座標に変換する"""
+    if from_size == to_size:
+        return bboxes
+    scale_x = to_size[0] / from_size[0]
+    scale_y = to_size[1] / from_size[1]
+    return [
+        (x1 * scale_x, y1 * scale_y, x2 * scale_x, y2 * scale_y)
+        for x1, y1, x2, y2 in bboxes
+    ]
+
+
+def image_hash(image: Image.Image) -> str:
+    """デコード後の画素値からcontent hashを計算する
+    同じ画素の画像はエンコード形式に関わらず同じhashになる
+    """
+    hasher = hashlib.blake2b(digest_size=16)
+    hasher.update(f"{image.mode}:{image.size}".encode())
+    hasher.update(image.tobytes())
+    return hasher.hexdigest()
+
+
 def draw_bboxes(
     image: Image.Image, bboxes: list[tuple[int, int, int, int]], color: str = "green"
 ) -> Image.Image:
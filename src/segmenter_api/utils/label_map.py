@@ -0,0 +1,43 @@
+"""複数のinstance maskを1枚のlabel画像にまとめる
+画素値0は背景、i+1はi番目のinstanceを表す
+"""
+
+import numpy as np
+
+# uint8のlabel画像で表せるinstance数の上限
+MAX_UINT8_INSTANCES = 255
+
+
+def stack_label_map(masks: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """(N, H, W)の二値maskを(H, W)のlabel画像にする
+    重なった画素は面積の小さいinstanceを優先し、面積が同じ場合はindexの大きいinstanceを優先する
+    面積の大きい順に描画して小さいinstanceで上書きするため、結果は入力の順序だけで決まる
+    Returns:
+        instance数が255以下ならuint8、それ以外はuint16のlabel画像,
+        label画像上で見えている各instanceの画素数 (N,)
+    """
+    num_masks, height, width = masks.shape
+    dtype = np.uint8 if num_masks <= MAX_UINT8_INSTANCES else np.uint16
+    label_map = np.zeros((height, width), dtype=dtype)
+    masks = masks.astype(bool, copy=False)
+    areas = masks.reshape(num_masks, -1).sum(axis=1)
+    # stableなsortで同じ面積のinstanceはindexの昇順に描画される
+    for index in np.argsort(-areas, kind="stable"):
+        label_map[masks[index]] = index + 1
+    visible_areas = np.bincount(label_map.ravel(), minlength=num_masks + 1)[1:]
+    return label_map, visible_areas
+
+
+def label_palette() -> list[int]:
+    """PASCAL VOCと同じ配色の256色のpalette。背景(0)は黒になる"""
+    palette: list[int] = []
+    for label in range(256):
+        red = green = blue = 0
+        value = label
+        for bit in range(8):
+            red |= ((value >> 0) & 1) << (7 - bit)
+            green |= ((value >> 1) & 1) << (7 - bit)
+            blue |= ((value >> 2) & 1) << (7 - bit)
+            value >>= 3
+        palette.extend((red, green, blue))
+    return palette
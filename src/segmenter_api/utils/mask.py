@@ -0,0 +1,92 @@
+"""COCO互換のrun-length encoding(RLE)
+pycocotoolsのmaskUtils.encode/decodeと同じ形式で、maskは列優先(Fortran順)に走査する
+countsは0の画素のrunから始まり、0と1のrunの長さを交互に並べる
+"""
+
+import numpy as np
+
+
+def encode_rle(masks: np.ndarray) -> list[list[int]]:
+    """(N, H, W)の二値maskを非圧縮のcountsのリストにする
+    列優先への転置はせず、行優先のまま値の変化点だけを求めて列優先の位置に変換する
+    全maskの変化点をまとめて計算し、画素ごとのpython loopを避ける
+    """
+    num_masks, height, width = masks.shape
+    masks = masks.astype(bool, copy=False)
+    mask_indices: list[np.ndarray] = []
+    positions: list[np.ndarray] = []
+    if height > 1:
+        # 同じ列の上下の画素で値が変わる位置
+        changes = np.flatnonzero(masks[:, 1:, :] != masks[:, :-1, :])
+        mask_index, offset = np.divmod(changes, (height - 1) * width)
+        row, col = np.divmod(offset, width)
+        mask_indices.append(mask_index)
+        positions.append(col * height + row + 1)
+    if width > 1:
+        # 列の最後の画素と次の列の先頭の画素で値が変わる位置
+        changes = np.flatnonzero(masks[:, 0, 1:] != masks[:, -1, :-1])
+        mask_index, col = np.divmod(changes, width - 1)
+        mask_indices.append(mask_index)
+        positions.append((col + 1) * height)
+    all_mask_indices = np.concatenate([np.empty(0, dtype=np.intp), *mask_indices])
+    all_positions = np.concatenate([np.empty(0, dtype=np.intp), *positions])
+    order = np.lexsort((all_positions, all_mask_indices))
+    all_mask_indices = all_mask_indices[order]
+    all_positions = all_positions[order]
+    splits = np.searchsorted(all_mask_indices, np.arange(1, num_masks))
+    counts_list: list[list[int]] = []
+    for i, change_positions in enumerate(np.split(all_positions, splits)):
+        boundaries = np.concatenate(([0], change_positions, [height * width]))
+        counts = np.diff(boundaries)
+        # 1の画素から始まる場合は長さ0の0のrunを先頭に置く
+        if masks[i, 0, 0]:
+            counts = np.concatenate(([0], counts))
+        counts_list.append(counts.tolist())
+    return counts_list
+
+
+def decode_rle(counts: list[int], size: tuple[int, int]) -> np.ndarray:
+    """非圧縮のcountsを(H, W)のbool配列にする"""
+    height, width = size
+    values = np.arange(len(counts)) % 2 == 1
+    return np.repeat(values, counts).reshape(width, height).T
+
+
+def compress_counts(counts: list[int]) -> str:
+    """countsをCOCOの圧縮文字列(rleToString)にする
+    3番目以降は2つ前のrunとの差分を、5bitずつ可変長でASCIIに変換する
+    """
+    chars: list[str] = []
+    for i, count in enumerate(counts):
+        x = count - counts[i - 2] if i > 2 else count  # noqa: PLR2004
+        more = True
+        while more:
+            c = x & 0x1F
+            x >>= 5
+            more = x != -1 if c & 0x10 else x != 0
+            if more:
+                c |= 0x20
+            chars.append(chr(c + 48))
+    return "".join(chars)
+
+
+def decompress_counts(compressed: str) -> list[int]:
+    """COCOの圧縮文字列(rleFrString)をcountsに戻す"""
+    counts: list[int] = []
+    p = 0
+    while p < len(compressed):
+        x = 0
+        k = 0
+        more = True
+        while more:
+            c = ord(compressed[p]) - 48
+            x |= (c & 0x1F) << (5 * k)
+            more = bool(c & 0x20)
+            p += 1
+            k += 1
+            if not more and c & 0x10:
+                x |= -1 << (5 * k)
+        if len(counts) > 2:  # noqa: PLR2004
+            x += counts[-2]
+        counts.append(x)
+    return counts
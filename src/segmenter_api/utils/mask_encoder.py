@@ -0,0 +1,108 @@
+import base64
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from enum import Enum
+from functools import lru_cache
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+from segmenter_api.settings import get_settings
+from segmenter_api.utils.metrics import get_metrics
+
+# 1bitにする際の二値化の閾値
+BINARY_THRESHOLD = 128
+
+
+class ImageCodec(Enum):
+    """mask画像のencode形式
+    PNG: 8bitのPNG。zlibの圧縮レベルは設定で変更できる
+    PNG_1BIT: 二値化した1bitのPNG。SAM2のような二値のmask向け
+    WEBP_LOSSLESS: 可逆圧縮のWebP。BiRefNetのような多値のmask向け
+    """
+
+    PNG = "png"
+    PNG_1BIT = "png_1bit"
+    WEBP_LOSSLESS = "webp_lossless"
+
+    @property
+    def extension(self) -> str:
+        return ".webp" if self == ImageCodec.WEBP_LOSSLESS else ".png"
+
+    @property
+    def content_type(self) -> str:
+        return "image/webp" if self == ImageCodec.WEBP_LOSSLESS else "image/png"
+
+
+class MaskEncoder:
+    """mask画像をbase64の画像にencodeする
+    Pillowはencode中にGILを解放するため、
+    複数のmaskは上限付きのthread poolで並列にencodeする
+    形式ごとのencode時間と出力サイズをmetricsに記録する
+    """
+
+    def __init__(
+        self, max_workers: int, png_compress_level: int, webp_method: int
+    ) -> None:
+        self.max_workers = max_workers
+        self.png_compress_level = png_compress_level
+        self.webp_method = webp_method
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="mask-encoder"
+        )
+
+    def encode(self, images: list[Image.Image], codec: ImageCodec) -> list[str]:
+        """入力と同じ順序でbase64の文字列を返す"""
+        return [
+            base64.b64encode(data).decode("utf-8")
+            for data in self.encode_to_bytes(images, codec)
+        ]
+
+    def encode_one(self, image: Image.Image, codec: ImageCodec) -> str:
+        return base64.b64encode(self.encode_one_to_bytes(image, codec)).decode("utf-8")
+
+    def encode_to_bytes(
+        self, images: list[Image.Image], codec: ImageCodec
+    ) -> list[bytes]:
+        """入力と同じ順序でencodeした画像のbytesを返す"""
+        if len(images) <= 1 or self.max_workers <= 1:
+            # 並列にならない場合はthreadに渡すoverheadを避ける
+            return [self.encode_one_to_bytes(image, codec) for image in images]
+        return list(
+            self.executor.map(lambda im: self.encode_one_to_bytes(im, codec), images)
+        )
+
+    def encode_one_to_bytes(self, image: Image.Image, codec: ImageCodec) -> bytes:
+        started_at = time.perf_counter()
+        buffered = BytesIO()
+        if codec == ImageCodec.PNG:
+            image.save(buffered, format="PNG", compress_level=self.png_compress_level)
+        elif codec == ImageCodec.PNG_1BIT:
+            # convert("1")はditheringされるため閾値で二値化する
+            binary = Image.fromarray(np.asarray(image.convert("L")) >= BINARY_THRESHOLD)
+            binary.save(buffered, format="PNG", compress_level=self.png_compress_level)
+        else:
+            image.save(buffered, format="WEBP", lossless=True, method=self.webp_method)
+        metrics = get_metrics()
+        metrics.observe(
+            f"mask_encoder.{codec.value}.latency", time.perf_counter() - started_at
+        )
+        metrics.observe(f"mask_encoder.{codec.value}.bytes", buffered.tell())
+        return buffered.getvalue()
+
+
+@lru_cache
+def get_mask_encoder() -> MaskEncoder:
+    settings = get_settings()
+    return MaskEncoder(
+        # CPU数を超えるthreadは速くならないため上限にする
+        max_workers=min(settings.mask_encode_max_workers, os.cpu_count() or 1),
+        png_compress_level=settings.mask_png_compress_level,
+        webp_method=settings.mask_webp_method,
+    )
+
+
+# fork後の子プロセスでは親のthread poolのthreadが存在しないため作り直す
+os.register_at_fork(after_in_child=get_mask_encoder.cache_clear)
@@ -0,0 +1,83 @@
+import threading
+from collections import deque
+from collections.abc import Callable
+from functools import lru_cache
+from typing import Any
+
+
+class Metrics:
+    """プロセス内のcounterと観測値(latency等)を集計する
+    集計結果は/metricsエンドポイントから参照される
+    """
+
+    def __init__(self, window_size: int = 1024):
+        self.window_size = window_size
+        self._lock = threading.Lock()
+        self._counters: dict[str, float] = {}
+        self._observations: dict[str, deque[float]] = {}
+        self._observation_counts: dict[str, int] = {}
+        self._collectors: dict[str, Callable[[], dict[str, Any]]] = {}
+
+    def increment(self, name: str, value: float = 1) -> None:
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def observe(self, name: str, value: float) -> None:
+        with self._lock:
+            if name not in self._observations:
+                self._observations[name] = deque(maxlen=self.window_size)
+                self._observation_counts[name] = 0
+            self._observations[name].append(value)
+            self._observation_counts[name] += 1
+
+    def reset(self) -> None:
+        """counterと観測値を破棄する。collectorは残す"""
+        with self._lock:
+            self._counters.clear()
+            self._observations.clear()
+            self._observation_counts.clear()
+
+    def register_collector(
+        self, name: str, collector: Callable[[], dict[str, Any]]
+    ) -> None:
+        """snapshot時に呼び出されるcollectorを登録する(cacheのstats等)"""
+        with self._lock:
+            self._collectors[name] = collector
+
+    def snapshot(self) -> dict[str, Any]:
+        with self._lock:
+            counters = dict(self._counters)
+            observations = {
+                name: (list(values), self._observation_counts[name])
+                for name, values in self._observations.items()
+            }
+            collectors = dict(self._collectors)
+        return {
+            "counters": counters,
+            "observations": {
+                name: summarize(values, count)
+                for name, (values, count) in observations.items()
+            },
+            "collectors": {name: collector() for name, collector in collectors.items()},
+        }
+
+
+def summarize(values: list[float], count: int) -> dict[str, float]:
+    """直近window_size件の観測値を要約する"""
+    ordered = sorted(values)
+    return {
+        "count": count,
+        "mean": sum(ordered) / len(ordered),
+        "p50": percentile(ordered, 0.50),
+        "p95": percentile(ordered, 0.95),
+        "max": ordered[-1],
+    }
+
+
+def percentile(ordered: list[float], q: float) -> float:
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+@lru_cache
+def get_metrics() -> Metrics:
+    return Metrics()
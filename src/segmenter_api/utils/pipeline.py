@@ -0,0 +1,101 @@
+import queue
+import threading
+import time
+from collections.abc import Callable
+from concurrent.futures import Future
+from typing import Any
+
+from segmenter_api.utils.logger import get_logger
+from segmenter_api.utils.metrics import get_metrics
+
+logger = get_logger(__name__)
+
+
+class PipelineStage:
+    """pipelineの1段。fnは前の段の出力を受け取り、次の段への入力を返す"""
+
+    def __init__(self, name: str, fn: Callable[[Any], Any], workers: int = 1):
+        self.name = name
+        self.fn = fn
+        self.workers = workers
+
+
+class Pipeline:
+    """複数の段を上限付きのqueueでつないだpipeline
+    段ごとに専用のworkerを持つため、別々のリクエストを異なる段で同時に処理でき、
+    定常状態のthroughputは全段の合計ではなく最も遅い段で決まる
+    次の段のqueueが一杯の場合、前の段のworkerは空くまで待つ
+    """
+
+    def __init__(self, name: str, stages: list[PipelineStage], queue_size: int):
+        self.name = name
+        self.stages = stages
+        self._queues: list[queue.Queue[tuple[Any, Future[Any], float]]] = [
+            queue.Queue(maxsize=queue_size) for _ in stages
+        ]
+        self._lock = threading.Lock()
+        self._workers: list[threading.Thread] = []
+
+    def submit(self, value: Any) -> Future[Any]:
+        """最初の段のqueueに入れ、最後の段の出力が入るFutureを返す
+        Raises:
+            queue.Full: 最初の段のqueueが一杯の場合
+        """
+        self._ensure_workers()
+        future: Future[Any] = Future()
+        self._queues[0].put_nowait((value, future, time.perf_counter()))
+        return future
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            stage.name: {"queued": stage_queue.qsize(), "workers": stage.workers}
+            for stage, stage_queue in zip(self.stages, self._queues, strict=True)
+        }
+
+    def _ensure_workers(self) -> None:
+        # workerは最初のリクエスト時に起動する
+        # fork後の子プロセスでは親のworkerが存在しないため起動し直す
+        with self._lock:
+            if any(worker.is_alive() for worker in self._workers):
+                return
+            self._workers = []
+            for index, stage in enumerate(self.stages):
+                for worker_index in range(stage.workers):
+                    worker = threading.Thread(
+                        target=self._run,
+                        args=(index,),
+                        name=f"pipeline-{self.name}-{stage.name}-{worker_index}",
+                        daemon=True,
+                    )
+                    worker.start()
+                    self._workers.append(worker)
+
+    def _run(self, index: int) -> None:
+        stage = self.stages[index]
+        is_last = index + 1 == len(self.stages)
+        metrics = get_metrics()
+        while True:
+            value, future, enqueued_at = self._queues[index].get()
+            started_at = time.perf_counter()
+            metrics.observe(
+                f"pipeline.{self.name}.{stage.name}.wait_seconds",
+                started_at - enqueued_at,
+            )
+            try:
+                output = stage.fn(value)
+            except Exception as e:  # noqa: BLE001
+                # 失敗したリクエストは後の段に流さず、呼び出し元に例外を返す
+                logger.warning(
+                    f"pipeline: {self.name}の{stage.name}に失敗しました: {e}"
+                )
+                future.set_exception(e)
+                continue
+            finally:
+                metrics.observe(
+                    f"pipeline.{self.name}.{stage.name}.latency",
+                    time.perf_counter() - started_at,
+                )
+            if is_last:
+                future.set_result(output)
+            else:
+                self._queues[index + 1].put((output, future, time.perf_counter()))
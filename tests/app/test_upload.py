@@ -0,0 +1,96 @@
+from io import BytesIO
+
+import pytest
+from fastapi.testclient import TestClient
+from PIL import Image
+
+from segmenter_api.app.server import api
+from segmenter_api.di import DI
+from segmenter_api.domain.factory.detector_factory import (
+    DetectorFactoryInterface,
+    DetectorType,
+)
+from segmenter_api.domain.factory.segmenter_factory import (
+    SegmenterFactoryInterface,
+    SegmenterType,
+)
+from segmenter_api.domain.repository.file import FileRepositoryInterface
+
+
+@pytest.fixture
+def upload_client(
+    monkeypatch: pytest.MonkeyPatch,
+    mock_detector_factory: DetectorFactoryInterface,
+    mock_segmenter_factory: SegmenterFactoryInterface,
+    local_file_repository: FileRepositoryInterface,
+) -> TestClient:
+    di = DI()
+    di.injector.binder.bind(FileRepositoryInterface, to=local_file_repository)
+    di.injector.binder.bind(DetectorFactoryInterface, to=mock_detector_factory)
+    di.injector.binder.bind(SegmenterFactoryInterface, to=mock_segmenter_factory)
+    monkeypatch.setattr("segmenter_api.di._di_instance", di)
+    return TestClient(api)
+
+
+@pytest.fixture
+def image_bytes() -> bytes:
+    buffered = BytesIO()
+    Image.new("RGB", (100, 100)).save(buffered, format="PNG")
+    return buffered.getvalue()
+
+
+def test_text2segment_upload_multipart(
+    upload_client: TestClient,
+    image_bytes: bytes,
+    mock_detector_factory: DetectorFactoryInterface,
+):
+    # テスト実行
+    response = upload_client.post(
+        "/text2segment/upload",
+        files={"image": ("image.png", image_bytes, "image/png")},
+        data={
+            "texts": ["test object", "other object"],
+            "detector_type": DetectorType.FLORENCE2_BASE.value,
+            "segmenter_type": SegmenterType.SAM2.value,
+            "box_threshold": "0.5",
+        },
+    )
+
+    # アサーション
+    assert response.status_code == 200  # noqa: PLR2004
+    assert response.json()["labels"] == ["test object"]
+    detector_input = mock_detector_factory.create.return_value.detect.call_args.kwargs[
+        "detector_input"
+    ]
+    assert detector_input.texts == ["test object", "other object"]
+    assert detector_input.box_threshold == 0.5  # noqa: PLR2004
+    assert detector_input.image.size == (100, 100)
+
+
+def test_foreground_segment_upload_octet_stream(
+    upload_client: TestClient, image_bytes: bytes
+):
+    # テスト実行
+    response = upload_client.post(
+        "/foreground_segment/upload",
+        params={"segmenter_type": SegmenterType.BIREFNET.value, "mask_format": "rle"},
+        content=image_bytes,
+        headers={"Content-Type": "application/octet-stream"},
+    )
+
+    # アサーション
+    assert response.status_code == 200  # noqa: PLR2004
+    assert response.json()["mask"]["size"] == [100, 100]
+
+
+def test_upload_rejects_invalid_params(upload_client: TestClient, image_bytes: bytes):
+    # テスト実行
+    response = upload_client.post(
+        "/text2bbox/upload",
+        params={"detector_type": "unknown", "texts": "test object"},
+        content=image_bytes,
+        headers={"Content-Type": "application/octet-stream"},
+    )
+
+    # アサーション
+    assert response.status_code == 422  # noqa: PLR2004
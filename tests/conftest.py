@@ -1,17 +1,23 @@
 from pathlib import Path
 
+import numpy as np
 import pytest
 from PIL import Image
 from pytest_mock import MockFixture
 
 from segmenter_api.domain.factory.detector_factory import DetectorFactoryInterface
 from segmenter_api.domain.factory.segmenter_factory import SegmenterFactoryInterface
+from segmenter_api.domain.repository.file import FileRepositoryInterface
 from segmenter_api.domain.service.detector import Detector, DetectorOutput
 from segmenter_api.domain.service.segmenter import (
     Bbox2SegmentOutput,
     ForegroundSegmentOutput,
+    Prompt2SegmentOutput,
     Segmenter,
 )
+from segmenter_api.infra.repository.local import LocalFileRepository
+from segmenter_api.usecase.service import storage
+from segmenter_api.usecase.service.storage import StorageUsecase
 
 
 @pytest.fixture
@@ -29,9 +35,19 @@ def mock_segmenter(mocker: MockFixture) -> Segmenter:
     segmenter.bbox2segment.return_value = Bbox2SegmentOutput(
         masks=[Image.new("RGB", (100, 100))]
     )
+    segmenter.prompt2segment.return_value = Prompt2SegmentOutput(
+        image_id="test_image_id",
+        masks=[Image.new("L", (100, 100))],
+        scores=[0.9],
+        low_res_logits=np.zeros((1, 256, 256), dtype=np.float32),
+    )
     segmenter.foreground_segment.return_value = ForegroundSegmentOutput(
         mask=Image.new("RGB", (100, 100))
     )
+    segmenter.foreground_segment_batch.return_value = [
+        ForegroundSegmentOutput(mask=Image.new("L", (100, 100))),
+        ForegroundSegmentOutput(mask=Image.new("L", (60, 80))),
+    ]
     return segmenter
 
 
@@ -53,6 +69,20 @@ def mock_segmenter_factory(
     return factory
 
 
+@pytest.fixture
+def local_file_repository(tmp_path: Path) -> FileRepositoryInterface:
+    return LocalFileRepository(root=tmp_path / "storage")
+
+
+@pytest.fixture
+def storage_usecase(
+    monkeypatch: pytest.MonkeyPatch, local_file_repository: FileRepositoryInterface
+) -> StorageUsecase:
+    # テストではgs://bucket/...を読み書きする
+    monkeypatch.setattr(storage.settings, "gcs_allowed_buckets", ["bucket"])
+    return StorageUsecase(file_repository=local_file_repository)
+
+
 @pytest.fixture
 def test_image() -> Image.Image:
     test_image_path = Path("tests/data/abema_water.png")
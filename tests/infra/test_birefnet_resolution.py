@@ -0,0 +1,34 @@
+import pytest
+
+from segmenter_api.domain.service.segmenter import ForegroundResolution
+from segmenter_api.infra.service.segmenter.birefnet import (
+    resized_size_keep_aspect,
+    select_tier_size,
+)
+
+
+@pytest.mark.parametrize(
+    ("image_size", "expected"),
+    [
+        ((300, 200), 512),
+        ((512, 100), 512),
+        ((513, 100), 768),
+        ((700, 800), 1024),
+        ((4000, 3000), 1024),
+    ],
+)
+def test_select_tier_size_auto(image_size: tuple[int, int], expected: int):
+    # テスト実行・アサーション
+    assert select_tier_size(image_size, ForegroundResolution.AUTO) == expected
+
+
+def test_select_tier_size_fixed():
+    # テスト実行・アサーション
+    assert select_tier_size((4000, 3000), ForegroundResolution.RES_512) == 512  # noqa: PLR2004
+    assert select_tier_size((100, 100), ForegroundResolution.RES_768) == 768  # noqa: PLR2004
+
+
+def test_resized_size_keep_aspect():
+    # テスト実行・アサーション
+    assert resized_size_keep_aspect((1000, 500), 512) == (512, 256)
+    assert resized_size_keep_aspect((300, 600), 768) == (384, 768)
@@ -0,0 +1,68 @@
+import pytest
+from PIL import Image
+from pytest_mock import MockFixture
+
+from segmenter_api.domain.service.detector import (
+    Detector,
+    DetectorInput,
+    DetectorOutput,
+)
+from segmenter_api.infra.service.detector.caching import CachingDetector
+from segmenter_api.utils.cache import LRUCache
+
+
+def create_caching_detector(mocker: MockFixture) -> CachingDetector:
+    detector = mocker.Mock(spec=Detector)
+    detector.detect_batch.side_effect = lambda detector_inputs: [
+        DetectorOutput(labels=d.texts, bboxes=[(0, 0, 1, 1)] * len(d.texts))
+        for d in detector_inputs
+    ]
+    return CachingDetector(
+        detector=detector,
+        cache=LRUCache(max_items=8, ttl_seconds=60),
+        detector_type="stub",
+    )
+
+
+def test_caching_detector_returns_cached_output(mocker: MockFixture):
+    # テストデータの準備
+    caching_detector = create_caching_detector(mocker)
+    image = Image.new("RGB", (10, 10))
+
+    # テスト実行: 空白の違いは正規化して同じkeyにする
+    first = caching_detector.detect(DetectorInput(texts=["a  bottle"], image=image))
+    second = caching_detector.detect(
+        DetectorInput(texts=[" a bottle "], image=image.copy())
+    )
+
+    # アサーション
+    # labelはそれぞれの呼び出し元の表記で返す
+    assert first.labels == ["a  bottle"]
+    assert second.labels == [" a bottle "]
+    assert first.bboxes == second.bboxes
+    caching_detector.detector.detect_batch.assert_called_once()
+    assert caching_detector.cache.stats()["hits"] == 1
+
+
+def test_caching_detector_bypasses_cache(mocker: MockFixture):
+    caching_detector = create_caching_detector(mocker)
+    image = Image.new("RGB", (10, 10))
+
+    detector_input = DetectorInput(texts=["bottle"], image=image, use_cache=False)
+    caching_detector.detect(detector_input)
+    caching_detector.detect(detector_input)
+
+    assert caching_detector.detector.detect_batch.call_count == 2  # noqa: PLR2004
+    assert len(caching_detector.cache) == 0
+
+
+def test_caching_detector_raises_on_output_count_mismatch(mocker: MockFixture):
+    # テストデータの準備
+    caching_detector = create_caching_detector(mocker)
+    caching_detector.detector.detect_batch.side_effect = lambda _: []
+    image = Image.new("RGB", (10, 10))
+
+    # テスト実行・アサーション: 結果を欠落させずにエラーにする
+    with pytest.raises(ValueError, match="一致しません"):
+        caching_detector.detect_batch([DetectorInput(texts=["bottle"], image=image)])
+    assert len(caching_detector.cache) == 0
@@ -0,0 +1,54 @@
+import os
+import uuid
+
+import pytest
+
+from segmenter_api.domain.model.errors import NotFoundError
+from segmenter_api.infra.repository import gcs
+from segmenter_api.infra.repository.gcs import GCSRepository
+
+# fake-gcs-server等のemulatorを起動した場合だけ実行する
+# docker run -p 4443:4443 fsouza/fake-gcs-server -scheme http
+# GCS_EMULATOR_HOST=http://localhost:4443 pytest tests/infra/test_gcs_repository.py
+pytestmark = pytest.mark.skipif(
+    "GCS_EMULATOR_HOST" not in os.environ, reason="GCS emulatorが起動していません"
+)
+
+
+@pytest.fixture
+def repository(monkeypatch: pytest.MonkeyPatch) -> GCSRepository:
+    monkeypatch.setattr(
+        gcs.settings, "gcs_emulator_host", os.environ["GCS_EMULATOR_HOST"]
+    )
+    return GCSRepository()
+
+
+def test_gcs_repository_round_trip(repository: GCSRepository):
+    # テストデータの準備
+    bucket = f"test-{uuid.uuid4().hex[:8]}"
+    repository.client.create_bucket(bucket)
+    uri = f"gs://{bucket}/masks/mask.png"
+
+    # テスト実行
+    repository.write_bytes(uri, b"mask", content_type="image/png")
+
+    # アサーション
+    assert repository.read_bytes(uri) == b"mask"
+    assert (
+        repository.client.bucket(bucket).get_blob("masks/mask.png").content_type
+        == "image/png"
+    )
+    with pytest.raises(NotFoundError):
+        repository.read_bytes(f"gs://{bucket}/missing.png")
+
+
+def test_gcs_repository_create_bytes(repository: GCSRepository):
+    # テストデータの準備
+    bucket = f"test-{uuid.uuid4().hex[:8]}"
+    repository.client.create_bucket(bucket)
+    uri = f"gs://{bucket}/claims/1.json"
+
+    # テスト実行・アサーション
+    assert repository.create_bytes(uri, b"first")
+    assert not repository.create_bytes(uri, b"second")
+    assert repository.read_bytes(uri) == b"first"
@@ -0,0 +1,81 @@
+import torch
+from transformers.modeling_outputs import BaseModelOutput
+from transformers.models.grounding_dino.modeling_grounding_dino import (
+    generate_masks_with_special_tokens_and_transfer_map,
+)
+
+from segmenter_api.infra.service.detector.grounding_dino import (
+    CachedTextBackbone,
+    build_prompt,
+    restore_label,
+)
+from segmenter_api.utils.cache import LRUCache
+
+PAD_TOKEN_ID = 0
+HIDDEN_SIZE = 4
+
+
+class FakeTextBackbone(torch.nn.Module):
+    """token idをそのままhidden stateにするtext backbone"""
+
+    def __init__(self):
+        super().__init__()
+        self.num_rows = 0
+
+    def forward(
+        self, input_ids: torch.Tensor, *_: torch.Tensor, **__: bool
+    ) -> BaseModelOutput:
+        self.num_rows += input_ids.shape[0]
+        hidden = input_ids[..., None].float().expand(-1, -1, HIDDEN_SIZE)
+        return BaseModelOutput(last_hidden_state=hidden)
+
+
+def call_backbone(
+    backbone: CachedTextBackbone, input_ids: torch.Tensor
+) -> torch.Tensor:
+    masks, position_ids = generate_masks_with_special_tokens_and_transfer_map(input_ids)
+    outputs = backbone(
+        input_ids,
+        masks[:, None],
+        torch.zeros_like(input_ids),
+        position_ids,
+        return_dict=True,
+    )
+    return outputs.last_hidden_state
+
+
+def test_cached_text_backbone_skips_cached_rows():
+    # テストデータの準備: 2行目はpaddingあり
+    fake = FakeTextBackbone()
+    backbone = CachedTextBackbone(
+        text_backbone=fake, cache=LRUCache(max_items=8), pad_token_id=PAD_TOKEN_ID
+    )
+    input_ids = torch.tensor([[101, 5, 6, 1012, 102], [101, 7, 1012, 102, 0]])
+
+    # テスト実行
+    first = call_backbone(backbone, input_ids)
+    second = call_backbone(backbone, input_ids.flip(0))
+
+    # アサーション: 2回目はbackboneを呼ばず、行の順序が変わっても同じ出力になる
+    assert fake.num_rows == input_ids.shape[0]
+    assert torch.equal(first, second.flip(0))
+    assert backbone.cache.stats()["hits"] == input_ids.shape[0]
+
+
+def test_build_prompt_normalizes_prompt_set():
+    assert build_prompt([" Logo", "person", "logo"]) == build_prompt(["person", "logo"])
+
+
+def test_restore_label_returns_original_text():
+    # テストデータの準備
+    texts = [" Red Car", "T-Shirt", "cat", "dog"]
+
+    # テスト実行・アサーション
+    # build_promptで正規化したphraseを、呼び出し元の表記に戻す
+    assert restore_label("red car", texts) == " Red Car"
+    assert restore_label("t - shirt", texts) == "T-Shirt"
+    # textの一部だけが検出された場合
+    assert restore_label("car", texts) == " Red Car"
+    # 隣り合うtextがまとめて検出された場合
+    assert restore_label("cat dog", texts) == "cat"
+    assert restore_label("bird", texts) == "bird"
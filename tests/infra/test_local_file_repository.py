@@ -0,0 +1,58 @@
+from pathlib import Path
+
+import pytest
+
+from segmenter_api.domain.model.errors import BadRequestError, NotFoundError
+from segmenter_api.infra.repository.local import LocalFileRepository
+
+
+def test_local_file_repository_round_trip(tmp_path: Path):
+    # テストデータの準備
+    repository = LocalFileRepository(root=tmp_path)
+
+    # テスト実行
+    repository.write_bytes("gs://bucket/masks/mask.png", b"mask")
+    repository.write_bytes("gs://bucket/masks/mask.png", b"overwritten")
+
+    # アサーション
+    assert repository.read_bytes("gs://bucket/masks/mask.png") == b"overwritten"
+    assert (tmp_path / "bucket" / "masks" / "mask.png").read_bytes() == b"overwritten"
+    assert [path.name for path in (tmp_path / "bucket" / "masks").iterdir()] == [
+        "mask.png"
+    ]
+
+
+def test_local_file_repository_create_bytes(tmp_path: Path):
+    # テストデータの準備
+    repository = LocalFileRepository(root=tmp_path)
+
+    # テスト実行
+    created = repository.create_bytes("gs://bucket/claims/1.json", b"first")
+    recreated = repository.create_bytes("gs://bucket/claims/1.json", b"second")
+
+    # アサーション
+    # 既存のobjectは上書きしない
+    assert (created, recreated) == (True, False)
+    assert repository.read_bytes("gs://bucket/claims/1.json") == b"first"
+    assert [path.name for path in (tmp_path / "bucket" / "claims").iterdir()] == [
+        "1.json"
+    ]
+
+
+def test_local_file_repository_not_found(tmp_path: Path):
+    # テストデータの準備
+    repository = LocalFileRepository(root=tmp_path)
+
+    # テスト実行・アサーション
+    with pytest.raises(NotFoundError):
+        repository.read_bytes("gs://bucket/missing.png")
+
+
+def test_local_file_repository_rejects_path_outside_root(tmp_path: Path):
+    # テストデータの準備
+    repository = LocalFileRepository(root=tmp_path / "storage")
+    (tmp_path / "secret.txt").write_text("secret")
+
+    # テスト実行・アサーション
+    with pytest.raises(BadRequestError):
+        repository.read_bytes("gs://bucket/../../secret.txt")
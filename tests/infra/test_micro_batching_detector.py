@@ -0,0 +1,87 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from PIL import Image
+
+from segmenter_api.domain.service.detector import (
+    Detector,
+    DetectorInput,
+    DetectorOutput,
+)
+from segmenter_api.infra.service.detector.micro_batching import (
+    MicroBatchingDetector,
+)
+
+
+class StubDetector(Detector):
+    """detect_batchの呼び出しを記録するCPU上のstub"""
+
+    def __init__(self):
+        self.batch_sizes: list[int] = []
+        self.lock = threading.Lock()
+
+    def detect(self, detector_input: DetectorInput) -> DetectorOutput:
+        return self.detect_batch([detector_input])[0]
+
+    def detect_batch(
+        self, detector_inputs: list[DetectorInput]
+    ) -> list[DetectorOutput]:
+        with self.lock:
+            self.batch_sizes.append(len(detector_inputs))
+        if any(text == "error" for d in detector_inputs for text in d.texts):
+            error_msg = "stub error"
+            raise RuntimeError(error_msg)
+        if any(text == "drop" for d in detector_inputs for text in d.texts):
+            return []
+        return [
+            DetectorOutput(labels=d.texts, bboxes=[(0, 0, 1, 1)] * len(d.texts))
+            for d in detector_inputs
+        ]
+
+
+def test_micro_batching_detector_batches_concurrent_requests():
+    # テストデータの準備
+    stub = StubDetector()
+    detector = MicroBatchingDetector(
+        detector=stub, max_batch_size=4, max_wait_ms=200, name="stub"
+    )
+    image = Image.new("RGB", (10, 10))
+    texts_list = [[f"text{i}"] for i in range(4)]
+
+    # テスト実行
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        outputs = list(
+            executor.map(
+                lambda texts: detector.detect(DetectorInput(texts=texts, image=image)),
+                texts_list,
+            )
+        )
+
+    # アサーション: 各呼び出し元は自分の結果を受け取る
+    assert [output.labels for output in outputs] == texts_list
+    assert sum(stub.batch_sizes) == len(texts_list)
+    assert len(stub.batch_sizes) < len(texts_list)
+
+
+def test_micro_batching_detector_propagates_errors():
+    stub = StubDetector()
+    detector = MicroBatchingDetector(
+        detector=stub, max_batch_size=2, max_wait_ms=1, name="stub"
+    )
+
+    with pytest.raises(RuntimeError, match="stub error"):
+        detector.detect(DetectorInput(texts=["error"], image=Image.new("RGB", (1, 1))))
+
+
+def test_micro_batching_detector_survives_wrong_result_count():
+    stub = StubDetector()
+    detector = MicroBatchingDetector(
+        detector=stub, max_batch_size=2, max_wait_ms=1, name="stub"
+    )
+    image = Image.new("RGB", (1, 1))
+
+    with pytest.raises(ValueError, match="一致しません"):
+        detector.detect(DetectorInput(texts=["drop"], image=image))
+    # workerは止まらず、後続のリクエストを処理する
+    assert detector.detect(DetectorInput(texts=["ok"], image=image)).labels == ["ok"]
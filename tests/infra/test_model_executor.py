@@ -0,0 +1,85 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from segmenter_api.domain.model.errors import TooManyRequestsError
+from segmenter_api.infra.service.runtime.model_executor import ModelExecutor
+
+
+def wait_until(condition, timeout: float = 5) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            error_msg = "条件を満たしませんでした"
+            raise TimeoutError(error_msg)
+        time.sleep(0.001)
+
+
+def test_model_executor_limits_concurrency():
+    # テストデータの準備
+    executor = ModelExecutor(name="stub", max_concurrency=2, max_queue_size=8)
+    lock = threading.Lock()
+    running = 0
+    max_running = 0
+
+    def infer(value: int) -> int:
+        nonlocal running, max_running
+        with lock:
+            running += 1
+            max_running = max(max_running, running)
+        time.sleep(0.02)
+        with lock:
+            running -= 1
+        return value * 2
+
+    # テスト実行
+    with ThreadPoolExecutor(max_workers=6) as pool:
+        results = list(pool.map(lambda value: executor.run(infer, value), range(6)))
+
+    # アサーション
+    assert results == [0, 2, 4, 6, 8, 10]
+    assert max_running == 2  # noqa: PLR2004
+    assert executor.stats()["queued"] == 0
+    assert executor.stats()["running"] == 0
+
+
+def test_model_executor_rejects_when_queue_is_full():
+    # テストデータの準備
+    # 1件が推論中、1件が待ち行列にいる状態にする
+    executor = ModelExecutor(
+        name="stub", max_concurrency=1, max_queue_size=1, min_retry_after_seconds=3
+    )
+    release = threading.Event()
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        futures = [pool.submit(executor.run, release.wait) for _ in range(2)]
+        wait_until(
+            lambda: (executor.stats()["running"], executor.stats()["queued"]) == (1, 1)
+        )
+
+        # テスト実行
+        with pytest.raises(TooManyRequestsError) as error:
+            executor.run(release.wait)
+        release.set()
+
+        # アサーション
+        assert error.value.retry_after == 3  # noqa: PLR2004
+        assert [future.result() for future in futures] == [True, True]
+    # 空いた後は受け付ける
+    assert executor.run(lambda: "ok") == "ok"
+
+
+def test_model_executor_propagates_exception():
+    # テストデータの準備
+    executor = ModelExecutor(name="stub", max_concurrency=1, max_queue_size=0)
+
+    def infer() -> None:
+        error_msg = "stub error"
+        raise RuntimeError(error_msg)
+
+    # テスト実行・アサーション
+    # 失敗した推論も待ち行列から外れる
+    with pytest.raises(RuntimeError):
+        executor.run(infer)
+    assert executor.run(lambda: "ok") == "ok"
@@ -0,0 +1,41 @@
+import numpy as np
+import torch
+
+from segmenter_api.infra.service.segmenter.postprocess import (
+    binary_masks_to_images,
+    probabilities_to_images,
+    unletterbox,
+)
+
+
+def test_binary_masks_to_images():
+    # テストデータの準備
+    masks = torch.zeros(2, 4, 6, dtype=torch.bool)
+    masks[0, :2, :3] = True
+
+    # テスト実行
+    images = binary_masks_to_images(masks)
+
+    # アサーション
+    assert [image.size for image in images] == [(6, 4), (6, 4)]
+    assert [image.mode for image in images] == ["L", "L"]
+    expected = np.zeros((4, 6), dtype=np.uint8)
+    expected[:2, :3] = 255
+    np.testing.assert_array_equal(np.asarray(images[0]), expected)
+    assert np.asarray(images[1]).max() == 0
+
+
+def test_unletterbox_crops_padding_and_resizes_once():
+    # テストデータの準備
+    # 左上の8x4がcontent、それ以外はpadding
+    probabilities = torch.zeros(1, 8, 8)
+    probabilities[:, :4, :8] = 1.0
+
+    # テスト実行
+    restored = unletterbox(probabilities, content_size=(8, 4), output_size=(16, 8))
+    images = probabilities_to_images(restored)
+
+    # アサーション
+    assert restored.shape == (1, 8, 16)
+    assert images[0].size == (16, 8)
+    assert np.asarray(images[0]).min() == 255  # noqa: PLR2004
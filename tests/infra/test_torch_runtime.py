@@ -0,0 +1,68 @@
+import pytest
+import torch
+from pytest_mock import MockFixture
+
+from segmenter_api.infra.service.runtime.torch_runtime import TorchRuntime
+
+
+def test_cpu_runtime_without_autocast():
+    # テスト実行
+    runtime = TorchRuntime(device="cpu", cpu_autocast=False)
+
+    # アサーション
+    assert runtime.device == torch.device("cpu")
+    assert runtime.dtype == torch.float32
+    assert runtime.autocast_dtype is None
+    with runtime.inference(mixed_precision=True):
+        assert torch.is_inference_mode_enabled()
+        assert not torch.is_autocast_enabled("cpu")
+
+
+def test_cpu_runtime_with_bf16_autocast(mocker: MockFixture):
+    # テストデータの準備
+    mocker.patch(
+        "segmenter_api.infra.service.runtime.torch_runtime.is_cpu_bf16_supported",
+        return_value=True,
+    )
+
+    # テスト実行
+    runtime = TorchRuntime(device="cpu", cpu_autocast=True)
+
+    # アサーション
+    assert runtime.autocast_dtype == torch.bfloat16
+    with runtime.inference():
+        assert torch.is_autocast_enabled("cpu")
+        assert torch.get_autocast_dtype("cpu") == torch.bfloat16
+
+
+def test_cuda_runtime_requires_cuda(mocker: MockFixture):
+    # テストデータの準備
+    mocker.patch("torch.cuda.is_available", return_value=False)
+
+    # テスト実行・アサーション
+    assert TorchRuntime(device="auto").device == torch.device("cpu")
+    with pytest.raises(ValueError, match="CUDA"):
+        TorchRuntime(device="cuda")
+
+
+def test_share_memory_moves_weights_into_one_shared_storage():
+    # テストデータの準備
+    runtime = TorchRuntime(device="cpu", cpu_autocast=False)
+    model = torch.nn.Sequential(
+        torch.nn.Linear(7, 5), torch.nn.BatchNorm1d(5), torch.nn.Linear(5, 3)
+    ).eval()
+    inputs = torch.randn(2, 7)
+    expected = model(inputs)
+    runtime.register(model)
+
+    # テスト実行
+    shared_bytes = runtime.share_memory()
+
+    # アサーション
+    tensors = [*model.parameters(), *model.buffers()]
+    assert all(tensor.is_shared() for tensor in tensors)
+    # float32のparameter/bufferとint64のnum_batches_trackedの2つの領域にまとまる
+    storages = {tensor.untyped_storage().data_ptr() for tensor in tensors}
+    assert len(storages) == 2  # noqa: PLR2004
+    assert shared_bytes >= sum(tensor.nbytes for tensor in tensors)
+    assert torch.equal(model(inputs), expected)
@@ -4,7 +4,10 @@ from segmenter_api.domain.factory.segmenter_factory import (
     SegmenterFactoryInterface,
     SegmenterType,
 )
-from segmenter_api.domain.model.foreground_segment import ForegroundSegmentUsecaseInput
+from segmenter_api.domain.model.foreground_segment import (
+    ForegroundSegmentBatchUsecaseInput,
+    ForegroundSegmentUsecaseInput,
+)
 from segmenter_api.usecase.service.foreground_segment import ForegroundSegmentUsecase
 
 
@@ -28,3 +31,28 @@ def test_foreground_segment(mock_segmenter_factory: SegmenterFactoryInterface):
     # モックの呼び出し確認
     mock_segmenter_factory.create.assert_called_once_with(SegmenterType.BIREFNET)
     mock_segmenter_factory.create.return_value.foreground_segment.assert_called_once()
+
+
+def test_foreground_segment_batch(mock_segmenter_factory: SegmenterFactoryInterface):
+    # テストデータの準備
+    input_images = [Image.new("RGB", (100, 100)), Image.new("RGB", (60, 80))]
+
+    # ユースケースのインスタンス化
+    usecase = ForegroundSegmentUsecase(segmenter_factory=mock_segmenter_factory)
+
+    # テスト実行
+    input_data = ForegroundSegmentBatchUsecaseInput(
+        images=input_images, segmenter_type=SegmenterType.BIREFNET
+    )
+
+    output = usecase.foreground_segment_batch(input_data)
+
+    # アサーション
+    assert [mask.size for mask in output.masks] == [
+        image.size for image in input_images
+    ]
+
+    # モックの呼び出し確認
+    segmenter = mock_segmenter_factory.create.return_value
+    segmenter.foreground_segment_batch.assert_called_once()
+    segmenter.foreground_segment.assert_not_called()
@@ -0,0 +1,279 @@
+import json
+import time
+from datetime import UTC, datetime, timedelta
+from io import BytesIO
+
+import pytest
+from PIL import Image
+
+from segmenter_api.domain.factory.detector_factory import DetectorFactoryInterface
+from segmenter_api.domain.factory.segmenter_factory import SegmenterFactoryInterface
+from segmenter_api.domain.model.errors import BadRequestError, NotFoundError
+from segmenter_api.domain.model.job import (
+    JobCreateRequest,
+    JobItemResult,
+    JobItemStatus,
+    JobState,
+    JobStatus,
+)
+from segmenter_api.domain.repository.file import FileRepositoryInterface
+from segmenter_api.usecase.service.storage import StorageUsecase
+from segmenter_api.usecase.service.text2segment import Text2SegmentUsecase
+from segmenter_api.usecase.ui.job import JobUserInterface, checkpoint_uri
+from segmenter_api.usecase.ui.text2segment import Text2SegmentUserInterface
+
+OUTPUT_URI = "gs://bucket/jobs/1"
+MANIFEST_URI = "gs://bucket/manifest.jsonl"
+
+
+@pytest.fixture
+def job_user_interface(
+    mock_detector_factory: DetectorFactoryInterface,
+    mock_segmenter_factory: SegmenterFactoryInterface,
+    local_file_repository: FileRepositoryInterface,
+    storage_usecase: StorageUsecase,
+) -> JobUserInterface:
+    return JobUserInterface(
+        text2segment_user_interface=Text2SegmentUserInterface(
+            text2segment_usecase=Text2SegmentUsecase(
+                segmenter_factory=mock_segmenter_factory,
+                detector_factory=mock_detector_factory,
+            ),
+            storage_usecase=storage_usecase,
+        ),
+        storage_usecase=storage_usecase,
+        file_repository=local_file_repository,
+    )
+
+
+def write_manifest(
+    file_repository: FileRepositoryInterface, num_images: int, missing: list[int]
+) -> None:
+    buffered = BytesIO()
+    Image.new("RGB", (100, 100)).save(buffered, format="PNG")
+    lines = []
+    for index in range(num_images):
+        image_uri = f"gs://bucket/images/{index}.png"
+        if index not in missing:
+            file_repository.write_bytes(image_uri, buffered.getvalue())
+        item = {
+            "id": f"image-{index}",
+            "image": image_uri,
+            "texts": ["test object"],
+            "detector_type": "florence2_base",
+            "segmenter_type": "sam2",
+        }
+        lines.append(json.dumps(item))
+    file_repository.write_bytes(MANIFEST_URI, "\n".join(lines).encode())
+
+
+def wait_for_job(job_user_interface: JobUserInterface, job_id: str) -> JobState:
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        state = job_user_interface.get_job(job_id)
+        if state.status in (JobStatus.SUCCEEDED, JobStatus.FAILED):
+            return state
+        time.sleep(0.01)
+    error_msg = f"job: {job_id}が終わりませんでした"
+    raise TimeoutError(error_msg)
+
+
+def read_results(file_repository: FileRepositoryInterface) -> list[JobItemResult]:
+    root = file_repository.root / "bucket/jobs/1/results"
+    return [
+        JobItemResult.model_validate_json(line)
+        for path in sorted(root.glob("*.jsonl"))
+        for line in path.read_text().splitlines()
+    ]
+
+
+def test_job_processes_manifest(
+    job_user_interface: JobUserInterface,
+    local_file_repository: FileRepositoryInterface,
+):
+    # テストデータの準備
+    # 3件目の画像は存在しない
+    write_manifest(local_file_repository, num_images=5, missing=[2])
+
+    # テスト実行
+    state = job_user_interface.create_job(
+        JobCreateRequest(manifest_uri=MANIFEST_URI, output_uri=OUTPUT_URI, batch_size=2)
+    )
+    state = wait_for_job(job_user_interface, state.job_id)
+
+    # アサーション
+    assert state.status == JobStatus.SUCCEEDED
+    assert (state.total, state.next_index) == (5, 5)
+    assert (state.succeeded, state.failed) == (4, 1)
+    results = read_results(local_file_repository)
+    assert [result.index for result in results] == [0, 1, 2, 3, 4]
+    assert results[2].status == JobItemStatus.FAILED
+    assert results[2].id == "image-2"
+    assert results[0].status == JobItemStatus.SUCCEEDED
+    assert results[0].id == "image-0"
+    assert results[0].masks == [f"{OUTPUT_URI}/items/000000/mask_000.png"]
+    mask = Image.open(BytesIO(local_file_repository.read_bytes(results[0].masks[0])))
+    assert mask.size == (100, 100)
+    checkpoint = JobState.model_validate_json(
+        local_file_repository.read_bytes(checkpoint_uri(OUTPUT_URI))
+    )
+    assert checkpoint == state
+    # 終了したjobはメモリに残さず、checkpointから状態を返す
+    assert state.job_id not in job_user_interface.jobs
+    assert job_user_interface.get_job(state.job_id) == state
+
+
+def test_job_resumes_from_checkpoint(
+    job_user_interface: JobUserInterface,
+    local_file_repository: FileRepositoryInterface,
+    mock_detector_factory: DetectorFactoryInterface,
+):
+    # テストデータの準備
+    # 4件中2件を処理した時点で止まり、checkpointが更新されなくなったjob
+    write_manifest(local_file_repository, num_images=4, missing=[])
+    now = datetime.now(UTC) - timedelta(hours=1)
+    checkpoint = JobState(
+        job_id="stopped",
+        manifest_uri=MANIFEST_URI,
+        output_uri=OUTPUT_URI,
+        status=JobStatus.RUNNING,
+        batch_size=2,
+        total=4,
+        next_index=2,
+        succeeded=2,
+        created_at=now,
+        updated_at=now,
+    )
+    local_file_repository.write_bytes(
+        checkpoint_uri(OUTPUT_URI), checkpoint.model_dump_json().encode()
+    )
+
+    # テスト実行
+    state = job_user_interface.create_job(
+        JobCreateRequest(manifest_uri=MANIFEST_URI, output_uri=OUTPUT_URI)
+    )
+    state = wait_for_job(job_user_interface, state.job_id)
+
+    # アサーション
+    # 処理済みの2件は処理し直さない
+    assert state.job_id == "stopped"
+    assert state.attempt == 1
+    assert state.status == JobStatus.SUCCEEDED
+    assert (state.next_index, state.succeeded, state.failed) == (4, 4, 0)
+    assert [result.index for result in read_results(local_file_repository)] == [2, 3]
+    mock_detector = mock_detector_factory.create.return_value
+    assert mock_detector.detect.call_count == 2  # noqa: PLR2004
+
+
+def test_job_rejects_other_manifest(
+    job_user_interface: JobUserInterface,
+    local_file_repository: FileRepositoryInterface,
+):
+    # テストデータの準備
+    write_manifest(local_file_repository, num_images=1, missing=[])
+    state = job_user_interface.create_job(
+        JobCreateRequest(manifest_uri=MANIFEST_URI, output_uri=OUTPUT_URI)
+    )
+    wait_for_job(job_user_interface, state.job_id)
+
+    # テスト実行・アサーション
+    with pytest.raises(BadRequestError):
+        job_user_interface.create_job(
+            JobCreateRequest(
+                manifest_uri="gs://bucket/other.jsonl", output_uri=OUTPUT_URI
+            )
+        )
+    with pytest.raises(NotFoundError):
+        job_user_interface.get_job("unknown")
+
+
+def test_job_is_not_resumed_while_other_worker_runs_it(
+    job_user_interface: JobUserInterface,
+    local_file_repository: FileRepositoryInterface,
+    mock_detector_factory: DetectorFactoryInterface,
+):
+    # テストデータの準備
+    # 他のworkerが実行中で、checkpointを更新し続けているjob
+    write_manifest(local_file_repository, num_images=2, missing=[])
+    now = datetime.now(UTC)
+    checkpoint = JobState(
+        job_id="running",
+        manifest_uri=MANIFEST_URI,
+        output_uri=OUTPUT_URI,
+        status=JobStatus.RUNNING,
+        batch_size=2,
+        created_at=now,
+        updated_at=now,
+    )
+    local_file_repository.write_bytes(
+        checkpoint_uri(OUTPUT_URI), checkpoint.model_dump_json().encode()
+    )
+
+    # テスト実行
+    state = job_user_interface.create_job(
+        JobCreateRequest(manifest_uri=MANIFEST_URI, output_uri=OUTPUT_URI)
+    )
+
+    # アサーション
+    assert state == checkpoint
+    assert mock_detector_factory.create.return_value.detect.call_count == 0
+
+
+def test_job_is_resumed_by_one_worker(
+    job_user_interface: JobUserInterface,
+    local_file_repository: FileRepositoryInterface,
+):
+    # テストデータの準備
+    # 失敗したjobを、他のworkerが先に再開した
+    write_manifest(local_file_repository, num_images=2, missing=[])
+    now = datetime.now(UTC)
+    checkpoint = JobState(
+        job_id="failed",
+        manifest_uri=MANIFEST_URI,
+        output_uri=OUTPUT_URI,
+        status=JobStatus.FAILED,
+        batch_size=2,
+        created_at=now,
+        updated_at=now,
+    )
+    local_file_repository.write_bytes(
+        checkpoint_uri(OUTPUT_URI), checkpoint.model_dump_json().encode()
+    )
+    resumed = checkpoint.model_copy(update={"status": JobStatus.QUEUED, "attempt": 1})
+    local_file_repository.write_bytes(
+        f"{OUTPUT_URI}/_claims/000001.json", resumed.model_dump_json().encode()
+    )
+
+    # テスト実行
+    state = job_user_interface.create_job(
+        JobCreateRequest(manifest_uri=MANIFEST_URI, output_uri=OUTPUT_URI)
+    )
+
+    # アサーション
+    assert state == resumed
+    with pytest.raises(NotFoundError):
+        job_user_interface.get_job("failed")
+
+
+def test_get_job_reads_checkpoint_of_other_worker(
+    job_user_interface: JobUserInterface,
+    local_file_repository: FileRepositoryInterface,
+    storage_usecase: StorageUsecase,
+):
+    # テストデータの準備
+    write_manifest(local_file_repository, num_images=1, missing=[])
+    state = job_user_interface.create_job(
+        JobCreateRequest(manifest_uri=MANIFEST_URI, output_uri=OUTPUT_URI)
+    )
+    state = wait_for_job(job_user_interface, state.job_id)
+    # 同じstorageを使う別のworker
+    other_worker = JobUserInterface(
+        text2segment_user_interface=job_user_interface.text2segment_user_interface,
+        storage_usecase=storage_usecase,
+        file_repository=local_file_repository,
+    )
+
+    # テスト実行・アサーション
+    assert other_worker.get_job(state.job_id) == state
+    with pytest.raises(NotFoundError):
+        other_worker.get_job("../jobs")
@@ -0,0 +1,82 @@
+import numpy as np
+import pytest
+from pydantic import ValidationError
+
+from segmenter_api.domain.factory.segmenter_factory import (
+    SegmenterFactoryInterface,
+    SegmenterType,
+)
+from segmenter_api.domain.model.errors import BadRequestError
+from segmenter_api.domain.model.prompt2segment import Prompt2SegmentRequest
+from segmenter_api.usecase.service.prompt2segment import Prompt2SegmentUsecase
+from segmenter_api.usecase.service.storage import StorageUsecase
+from segmenter_api.usecase.ui.prompt2segment import Prompt2SegmentUserInterface
+from segmenter_api.utils.array import base642ndarray, ndarray2base64
+
+
+def test_prompt2segment_with_image_id(
+    mock_segmenter_factory: SegmenterFactoryInterface,
+    storage_usecase: StorageUsecase,
+):
+    # テストデータの準備
+    user_interface = Prompt2SegmentUserInterface(
+        prompt2segment_usecase=Prompt2SegmentUsecase(
+            segmenter_factory=mock_segmenter_factory
+        ),
+        storage_usecase=storage_usecase,
+    )
+    previous_logit = np.ones((256, 256), dtype=np.float16)
+    request = Prompt2SegmentRequest(
+        image_id="test_image_id",
+        point_coords=[(10, 10), (50, 50)],
+        point_labels=[1, 0],
+        mask_input=ndarray2base64(previous_logit),
+    )
+
+    # テスト実行
+    response = user_interface.prompt2segment(request)
+
+    # アサーション
+    assert response.image_id == "test_image_id"
+    assert len(response.mask_images) == 1
+    assert response.scores == [0.9]
+    assert base642ndarray(response.low_res_logits[0]).shape == (256, 256)
+    mock_segmenter_factory.create.assert_called_once_with(SegmenterType.SAM2)
+    segmenter = mock_segmenter_factory.create.return_value
+    segmenter_input = segmenter.prompt2segment.call_args.kwargs["prompt2segment_input"]
+    assert segmenter_input.image is None
+    assert segmenter_input.mask_input.shape == (1, 256, 256)
+
+
+def test_prompt2segment_rejects_invalid_mask_input(
+    mock_segmenter_factory: SegmenterFactoryInterface,
+    storage_usecase: StorageUsecase,
+):
+    # テストデータの準備
+    user_interface = Prompt2SegmentUserInterface(
+        prompt2segment_usecase=Prompt2SegmentUsecase(
+            segmenter_factory=mock_segmenter_factory
+        ),
+        storage_usecase=storage_usecase,
+    )
+    request = Prompt2SegmentRequest(
+        image_id="test_image_id",
+        box=(0, 0, 50, 50),
+        mask_input=ndarray2base64(np.zeros((64, 64), dtype=np.float32)),
+    )
+
+    # テスト実行・アサーション
+    with pytest.raises(BadRequestError):
+        user_interface.prompt2segment(request)
+
+
+def test_prompt2segment_request_requires_prompt():
+    # テスト実行・アサーション
+    with pytest.raises(ValidationError):
+        Prompt2SegmentRequest(image_id="test_image_id")
+    with pytest.raises(ValidationError):
+        Prompt2SegmentRequest(box=(0, 0, 50, 50))
+    with pytest.raises(ValidationError):
+        Prompt2SegmentRequest(
+            image_id="test_image_id", point_coords=[(10, 10)], point_labels=[1, 0]
+        )
@@ -0,0 +1,159 @@
+from io import BytesIO
+
+import numpy as np
+import pytest
+from PIL import Image
+from pydantic import ValidationError
+
+from segmenter_api.domain.factory.detector_factory import (
+    DetectorFactoryInterface,
+    DetectorType,
+)
+from segmenter_api.domain.factory.segmenter_factory import (
+    SegmenterFactoryInterface,
+    SegmenterType,
+)
+from segmenter_api.domain.model.errors import BadRequestError
+from segmenter_api.domain.model.foreground_segment import (
+    MAX_BATCH_IMAGES,
+    ForegroundSegmentBatchRequest,
+)
+from segmenter_api.domain.model.mask import MaskFormat
+from segmenter_api.domain.model.text2bbox import Text2BboxParams
+from segmenter_api.domain.model.text2segment import Text2SegmentRequest
+from segmenter_api.domain.repository.file import FileRepositoryInterface
+from segmenter_api.usecase.service import storage
+from segmenter_api.usecase.service.storage import StorageUsecase
+from segmenter_api.usecase.service.text2segment import Text2SegmentUsecase
+from segmenter_api.usecase.ui.text2segment import Text2SegmentUserInterface
+
+
+def test_text2segment_reads_and_writes_gcs_uri(
+    mock_detector_factory: DetectorFactoryInterface,
+    mock_segmenter_factory: SegmenterFactoryInterface,
+    local_file_repository: FileRepositoryInterface,
+    storage_usecase: StorageUsecase,
+):
+    # テストデータの準備
+    buffered = BytesIO()
+    Image.new("RGB", (100, 100)).save(buffered, format="PNG")
+    local_file_repository.write_bytes("gs://bucket/images/1.png", buffered.getvalue())
+    user_interface = Text2SegmentUserInterface(
+        text2segment_usecase=Text2SegmentUsecase(
+            segmenter_factory=mock_segmenter_factory,
+            detector_factory=mock_detector_factory,
+        ),
+        storage_usecase=storage_usecase,
+    )
+
+    # テスト実行
+    response = user_interface.text2segment(
+        Text2SegmentRequest(
+            image="gs://bucket/images/1.png",
+            texts=["test object"],
+            detector_type=DetectorType.FLORENCE2_BASE,
+            segmenter_type=SegmenterType.SAM2,
+            output_uri="gs://bucket/outputs/1/",
+        )
+    )
+
+    # アサーション
+    assert response.masks == ["gs://bucket/outputs/1/mask_000.png"]
+    mask = Image.open(BytesIO(local_file_repository.read_bytes(response.masks[0])))
+    assert mask.size == (100, 100)
+
+
+def test_storage_usecase_rejects_disallowed_bucket(
+    monkeypatch: pytest.MonkeyPatch, storage_usecase: StorageUsecase
+):
+    # テストデータの準備
+    monkeypatch.setattr(storage.settings, "gcs_allowed_buckets", ["allowed"])
+
+    # テスト実行・アサーション
+    with pytest.raises(BadRequestError):
+        storage_usecase.read_image("gs://other/image.png")
+    with pytest.raises(BadRequestError):
+        storage_usecase.write_masks(
+            [Image.fromarray(np.zeros((2, 2), dtype=np.uint8))],
+            mask_format=MaskFormat.PNG,
+            output_uri="gs://other/outputs",
+            names=["mask"],
+        )
+
+
+def test_check_bucket_defaults_to_configured_bucket(monkeypatch: pytest.MonkeyPatch):
+    # テストデータの準備
+    monkeypatch.setattr(storage.settings, "gcs_allowed_buckets", None)
+    monkeypatch.setattr(storage.settings, "google_cloud_storage_bucket", "configured")
+
+    # テスト実行・アサーション
+    storage.check_bucket("gs://configured/image.png")
+    with pytest.raises(BadRequestError):
+        storage.check_bucket("gs://other/image.png")
+    # 全bucketの許可は明示的に指定した場合のみ
+    monkeypatch.setattr(storage.settings, "gcs_allow_any_bucket", True)
+    storage.check_bucket("gs://other/image.png")
+
+
+def test_output_uri_validation():
+    # テスト実行・アサーション
+    with pytest.raises(ValidationError, match="gs://"):
+        Text2SegmentRequest(
+            image="",
+            texts=["test object"],
+            detector_type=DetectorType.FLORENCE2_BASE,
+            segmenter_type=SegmenterType.SAM2,
+            output_uri="/tmp/outputs",  # noqa: S108
+        )
+    with pytest.raises(ValidationError, match="rle"):
+        Text2SegmentRequest(
+            image="",
+            texts=["test object"],
+            detector_type=DetectorType.FLORENCE2_BASE,
+            segmenter_type=SegmenterType.SAM2,
+            mask_format=MaskFormat.RLE,
+            output_uri="gs://bucket/outputs",
+        )
+
+
+@pytest.mark.parametrize(
+    "params",
+    [
+        {"max_detections": 0},
+        {"max_detections": -1},
+        {"box_threshold": 1.5},
+        {"text_threshold": -0.1},
+    ],
+)
+def test_detection_params_validation(params: dict[str, float]):
+    # テスト実行・アサーション
+    with pytest.raises(ValidationError):
+        Text2SegmentRequest(
+            image="",
+            texts=["test object"],
+            detector_type=DetectorType.GROUNDING_DINO,
+            segmenter_type=SegmenterType.SAM2,
+            **params,
+        )
+    with pytest.raises(ValidationError):
+        Text2BboxParams(
+            texts=["test object"], detector_type=DetectorType.GROUNDING_DINO, **params
+        )
+
+
+def test_foreground_batch_request_validation():
+    # テストデータの準備
+    images = [""] * (MAX_BATCH_IMAGES + 1)
+
+    # テスト実行・アサーション
+    with pytest.raises(ValidationError):
+        ForegroundSegmentBatchRequest(
+            images=images, segmenter_type=SegmenterType.BIREFNET
+        )
+    # 単体のリクエストと同じ検証が共通のパラメータに効く
+    with pytest.raises(ValidationError):
+        ForegroundSegmentBatchRequest(
+            images=[""],
+            segmenter_type=SegmenterType.BIREFNET,
+            mask_format=MaskFormat.LABEL_MAP,
+        )
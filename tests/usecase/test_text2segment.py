@@ -9,6 +9,7 @@ from segmenter_api.domain.factory.segmenter_factory import (
     SegmenterType,
 )
 from segmenter_api.domain.model.text2segment import Text2SegmentInput
+from segmenter_api.domain.service.segmenter import Bbox2SegmentOutput
 from segmenter_api.usecase.service.text2segment import Text2SegmentUsecase
 
 
@@ -46,3 +47,41 @@ def test_text2segment(
     mock_segmenter_factory.create.assert_called_once_with(SegmenterType.SAM2)
     mock_detector_factory.create.return_value.detect.assert_called_once()
     mock_segmenter_factory.create.return_value.bbox2segment.assert_called_once()
+
+
+def test_text2segment_with_downscaled_image(
+    mock_detector_factory: DetectorFactoryInterface,
+    mock_segmenter_factory: SegmenterFactoryInterface,
+):
+    # テストデータの準備
+    # 200x200の元画像を100x100に縮小してデコードした場合
+    mock_segmenter = mock_segmenter_factory.create.return_value
+    mock_segmenter.bbox2segment.return_value = Bbox2SegmentOutput(
+        masks=[Image.new("L", (200, 200))]
+    )
+    usecase = Text2SegmentUsecase(
+        segmenter_factory=mock_segmenter_factory, detector_factory=mock_detector_factory
+    )
+
+    # テスト実行
+    output = usecase.text2segment(
+        Text2SegmentInput(
+            texts=["test object"],
+            image=Image.new("RGB", (100, 100)),
+            detector_type=DetectorType.FLORENCE2_BASE,
+            segmenter_type=SegmenterType.SAM2,
+            original_size=(200, 200),
+        )
+    )
+
+    # アサーション
+    # bboxは元画像の座標に戻して返し、segmenterにも元画像のサイズを渡す
+    assert output.detector_output.bboxes == [(0, 0, 100, 100)]
+    bbox2segment_input = mock_segmenter.bbox2segment.call_args.kwargs[
+        "bbox2segment_input"
+    ]
+    assert bbox2segment_input.bboxes == [(0, 0, 100, 100)]
+    assert bbox2segment_input.original_size == (200, 200)
+    # cacheと共有されるdetectorの出力は変更しない
+    detector_output = mock_detector_factory.create.return_value.detect.return_value
+    assert detector_output.bboxes == [(0, 0, 50, 50)]
@@ -0,0 +1,55 @@
+from pytest_mock import MockFixture
+
+from segmenter_api.utils.cache import LRUCache
+
+
+def test_lru_cache_evicts_by_bytes():
+    cache: LRUCache[str, bytes] = LRUCache(max_bytes=10, sizeof=len)
+
+    cache.put("a", b"aaaa")
+    cache.put("b", b"bbbb")
+    # aを参照してbを最も古いエントリにする
+    assert cache.get("a") == b"aaaa"
+    cache.put("c", b"cccc")
+
+    assert "a" in cache
+    assert "b" not in cache
+    assert "c" in cache
+    assert cache.nbytes == len(b"aaaa") + len(b"cccc")
+    assert cache.stats()["evictions"] == 1
+
+
+def test_lru_cache_skips_value_larger_than_max_bytes():
+    cache: LRUCache[str, bytes] = LRUCache(max_bytes=4, sizeof=len)
+
+    cache.put("a", b"aaaaa")
+
+    assert len(cache) == 0
+
+
+def test_lru_cache_counts_hits_and_misses():
+    cache: LRUCache[str, int] = LRUCache(max_items=2)
+
+    cache.put("a", 1)
+    cache.get("a")
+    cache.get("b")
+
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["hit_rate"] == stats["hits"] / (stats["hits"] + stats["misses"])
+
+
+def test_lru_cache_expires_entries_after_ttl(mocker: MockFixture):
+    monotonic = mocker.patch("segmenter_api.utils.cache.time.monotonic")
+    monotonic.return_value = 0.0
+    cache: LRUCache[str, int] = LRUCache(max_items=2, ttl_seconds=10)
+    cache.put("a", 1)
+
+    monotonic.return_value = 5.0
+    assert cache.get("a") == 1
+
+    monotonic.return_value = 11.0
+    assert cache.get("a") is None
+    assert cache.stats()["expirations"] == 1
+    assert len(cache) == 0
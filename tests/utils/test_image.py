@@ -0,0 +1,83 @@
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+from segmenter_api.utils.image import decode_image, ensure_rgb, scale_bboxes
+
+
+def encode(image: Image.Image, image_format: str) -> bytes:
+    buffered = BytesIO()
+    image.save(buffered, format=image_format)
+    return buffered.getvalue()
+
+
+def test_decode_image_downscales_jpeg():
+    # テストデータの準備
+    rng = np.random.default_rng(0)
+    image = Image.fromarray(rng.integers(0, 255, (1200, 1600, 3), dtype=np.uint8))
+
+    # テスト実行
+    decoded, original_size = decode_image(encode(image, "JPEG"), max_side=500)
+
+    # アサーション
+    assert original_size == (1600, 1200)
+    assert decoded.size == (500, 375)
+    assert decoded.mode == "RGB"
+
+
+def test_decode_image_downscales_png():
+    # テストデータの準備
+    image = Image.new("P", (300, 600))
+
+    # テスト実行
+    decoded, original_size = decode_image(encode(image, "PNG"), max_side=200)
+
+    # アサーション
+    assert original_size == (300, 600)
+    assert decoded.size == (100, 200)
+    assert decoded.mode == "RGB"
+
+
+def test_decode_image_keeps_small_image():
+    # テストデータの準備
+    image = Image.new("RGB", (120, 80))
+
+    # テスト実行
+    decoded, original_size = decode_image(encode(image, "PNG"), max_side=200)
+    decoded_without_limit, _ = decode_image(encode(image, "PNG"), max_side=None)
+
+    # アサーション
+    assert original_size == (120, 80)
+    assert decoded.size == (120, 80)
+    assert decoded_without_limit.size == (120, 80)
+
+
+def test_decode_image_converts_to_rgb_once():
+    # テスト実行
+    decoded = [
+        decode_image(encode(Image.new(mode, (120, 80)), "PNG"), max_side=200)[0]
+        for mode in ("RGBA", "L", "P")
+    ]
+
+    # アサーション
+    # 縮小しない画像もdecode時にRGBにし、後段で変換し直さない
+    assert [image.mode for image in decoded] == ["RGB", "RGB", "RGB"]
+    assert all(ensure_rgb(image) is image for image in decoded)
+
+
+def test_scale_bboxes():
+    # テスト実行
+    scaled = scale_bboxes([(10, 20, 30, 40)], from_size=(100, 50), to_size=(200, 200))
+
+    # アサーション
+    assert scaled == [(20, 80, 60, 160)]
+
+
+def test_ensure_rgb_does_not_copy_rgb_image():
+    # テストデータの準備
+    image = Image.new("RGB", (10, 10))
+
+    # テスト実行・アサーション
+    assert ensure_rgb(image) is image
+    assert ensure_rgb(Image.new("RGBA", (10, 10))).mode == "RGB"
@@ -0,0 +1,85 @@
+import numpy as np
+import pytest
+from PIL import Image
+
+from segmenter_api.domain.model.foreground_segment import ForegroundSegmentParams
+from segmenter_api.domain.model.mask import MaskFormat, encode_label_map
+from segmenter_api.utils.label_map import stack_label_map
+
+
+def test_stack_label_map_prefers_smaller_instance():
+    # テストデータの準備
+    # 0番目が大きいinstance、1番目がその中に重なる小さいinstance
+    masks = np.zeros((2, 6, 6), dtype=bool)
+    masks[0, :, :] = True
+    masks[1, 2:4, 2:4] = True
+
+    # テスト実行
+    label_map, visible_areas = stack_label_map(masks)
+
+    # アサーション
+    assert label_map.dtype == np.uint8
+    assert label_map[0, 0] == 1
+    assert (label_map[2:4, 2:4] == 2).all()  # noqa: PLR2004
+    assert visible_areas.tolist() == [32, 4]
+
+
+def test_stack_label_map_breaks_ties_by_index():
+    # テストデータの準備
+    # 同じ面積のinstanceが1画素だけ重なる
+    masks = np.zeros((2, 4, 4), dtype=bool)
+    masks[0, 0:2, 0:2] = True
+    masks[1, 1:3, 1:3] = True
+
+    # テスト実行
+    label_map, _ = stack_label_map(masks)
+    reversed_label_map, _ = stack_label_map(masks[::-1])
+
+    # アサーション
+    assert label_map[1, 1] == 2  # noqa: PLR2004
+    assert reversed_label_map[1, 1] == 2  # noqa: PLR2004
+
+
+def test_stack_label_map_uses_uint16_for_many_instances():
+    # テストデータの準備
+    num_masks = 300
+    masks = np.zeros((num_masks, 1, num_masks), dtype=bool)
+    masks[np.arange(num_masks), 0, np.arange(num_masks)] = True
+
+    # テスト実行
+    label_map, _ = stack_label_map(masks)
+
+    # アサーション
+    assert label_map.dtype == np.uint16
+    assert label_map[0].tolist() == list(range(1, num_masks + 1))
+
+
+@pytest.mark.parametrize("num_masks", [3, 300])
+def test_encode_label_map_round_trip(num_masks: int):
+    # テストデータの準備
+    masks = []
+    for i in range(num_masks):
+        mask = np.zeros((4, num_masks), dtype=np.uint8)
+        mask[:, i] = 255
+        masks.append(Image.fromarray(mask))
+    labels = [f"object {i}" for i in range(num_masks)]
+    bboxes = [[i, 0, i + 1, 4] for i in range(num_masks)]
+
+    # テスト実行
+    label_map = encode_label_map(
+        masks, labels=labels, bboxes=bboxes, image_size=(num_masks, 4)
+    )
+
+    # アサーション
+    assert [instance.label for instance in label_map.instances] == labels
+    assert [instance.area for instance in label_map.instances] == [4] * num_masks
+    for mask, decoded in zip(masks, label_map.to_masks(), strict=True):
+        assert np.array_equal(np.asarray(mask), np.asarray(decoded))
+
+
+def test_foreground_segment_rejects_label_map():
+    # テスト実行・アサーション
+    with pytest.raises(ValueError, match="label_map"):
+        ForegroundSegmentParams(
+            segmenter_type="birefnet", mask_format=MaskFormat.LABEL_MAP
+        )
@@ -0,0 +1,120 @@
+import numpy as np
+from PIL import Image
+
+from segmenter_api.domain.model.mask import (
+    CroppedMask,
+    MaskFormat,
+    RLEMask,
+    crop_mask,
+    decode_mask,
+    encode_masks,
+)
+from segmenter_api.domain.model.text2segment import Text2SegmentResponse
+from segmenter_api.utils.mask import (
+    compress_counts,
+    decode_rle,
+    decompress_counts,
+    encode_rle,
+)
+
+
+def test_encode_rle_matches_coco():
+    # テストデータの準備
+    # pycocotools.mask.encodeの出力を期待値にする
+    mask = np.zeros((4, 5), dtype=bool)
+    mask[1:3, 1:4] = True
+    mask[0, 0] = True
+    large_mask = np.zeros((30, 40), dtype=bool)
+    large_mask[5:25, 3:35] = True
+
+    # テスト実行
+    (counts,) = encode_rle(mask[None])
+    (large_counts,) = encode_rle(large_mask[None])
+
+    # アサーション
+    assert compress_counts(counts) == "0141N0003"
+    assert compress_counts(large_counts) == (
+        "o2d0:0000000000000000000000000000000000000000000000000000000000000a4"
+    )
+
+
+def test_rle_round_trip():
+    # テストデータの準備
+    rng = np.random.default_rng(0)
+    masks = rng.random((3, 17, 23)) < 0.5  # noqa: PLR2004
+    masks[1] = True
+    masks[2] = False
+
+    # テスト実行
+    counts_list = encode_rle(masks)
+
+    # アサーション
+    for mask, counts in zip(masks, counts_list, strict=True):
+        assert decompress_counts(compress_counts(counts)) == counts
+        np.testing.assert_array_equal(decode_rle(counts, mask.shape), mask)
+
+
+def test_encode_masks_rle():
+    # テストデータの準備
+    mask = np.zeros((8, 10), dtype=np.uint8)
+    mask[2:6, 3:9] = 255
+    soft_mask = np.full((4, 6), 100, dtype=np.uint8)
+    soft_mask[:, 3:] = 200
+    masks = [Image.fromarray(mask), Image.fromarray(soft_mask)]
+
+    # テスト実行
+    encoded = encode_masks(masks, MaskFormat.RLE)
+
+    # アサーション
+    assert all(isinstance(rle, RLEMask) for rle in encoded)
+    assert encoded[0].size == (8, 10)
+    np.testing.assert_array_equal(np.asarray(decode_mask(encoded[0])), mask)
+    # 多値のmaskは閾値で二値化される
+    np.testing.assert_array_equal(
+        np.asarray(decode_mask(encoded[1])),
+        (soft_mask >= 128) * 255,  # noqa: PLR2004
+    )
+
+
+def test_crop_mask_round_trip():
+    # テストデータの準備
+    # bboxの外に1画素はみ出したmask
+    mask_array = np.zeros((100, 120), dtype=np.uint8)
+    mask_array[40:60, 50:70] = 255
+    mask_array[39, 55] = 255
+    mask = Image.fromarray(mask_array)
+
+    # テスト実行
+    cropped, offset = crop_mask(mask, bbox=[50.5, 40.2, 69.5, 59.8], padding=2)
+    (encoded,) = encode_masks([cropped], MaskFormat.RLE)
+    pasted = CroppedMask(mask=encoded, offset=offset).paste((120, 100))
+
+    # アサーション
+    assert offset == (48, 38)
+    assert cropped.size == (24, 24)
+    assert np.array_equal(np.asarray(pasted), mask_array)
+
+
+def test_text2segment_response_pastes_cropped_masks():
+    # テストデータの準備
+    mask_array = np.zeros((50, 80), dtype=np.uint8)
+    mask_array[10:20, 30:40] = 255
+    bbox = [30.0, 10.0, 40.0, 20.0]
+    cropped, offset = crop_mask(Image.fromarray(mask_array), bbox=bbox)
+    (encoded,) = encode_masks([cropped], MaskFormat.PNG)
+    response = Text2SegmentResponse(
+        labels=["object"],
+        masks=[CroppedMask(mask=encoded, offset=offset)],
+        bboxes=[bbox],
+        image_size=(80, 50),
+    )
+
+    # テスト実行
+    # JSONを経由してもCroppedMaskとして読み込まれること
+    parsed = Text2SegmentResponse.model_validate_json(response.model_dump_json())
+    ((label, mask),) = parsed.mask_images
+
+    # アサーション
+    assert isinstance(parsed.masks[0], CroppedMask)
+    assert label == "object"
+    assert np.array_equal(np.asarray(mask), mask_array)
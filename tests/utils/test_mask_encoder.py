@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+from PIL import Image
+
+from segmenter_api.domain.model.mask import MaskFormat, decode_mask, encode_masks
+from segmenter_api.utils.mask_encoder import ImageCodec, MaskEncoder
+from segmenter_api.utils.metrics import get_metrics
+
+
+@pytest.mark.parametrize(
+    "mask_format",
+    [MaskFormat.PNG, MaskFormat.PNG_1BIT, MaskFormat.WEBP_LOSSLESS],
+)
+def test_encode_masks_round_trip(mask_format: MaskFormat):
+    # テストデータの準備
+    masks = []
+    for i in range(5):
+        mask = np.zeros((40, 60), dtype=np.uint8)
+        mask[i * 5 : i * 5 + 10, 10:50] = 255
+        masks.append(Image.fromarray(mask))
+
+    # テスト実行
+    decoded = [decode_mask(mask) for mask in encode_masks(masks, mask_format)]
+
+    # アサーション
+    # 並列にencodeしても入力と同じ順序で返ること
+    for mask, decoded_mask in zip(masks, decoded, strict=True):
+        assert decoded_mask.mode == "L"
+        assert np.array_equal(np.asarray(mask), np.asarray(decoded_mask))
+
+
+def test_mask_encoder_png_1bit_binarizes_soft_mask():
+    # テストデータの準備
+    encoder = MaskEncoder(max_workers=2, png_compress_level=1, webp_method=0)
+    soft_mask = Image.fromarray(np.array([[0, 127, 128, 255]], dtype=np.uint8))
+
+    # テスト実行
+    (encoded,) = encoder.encode([soft_mask], ImageCodec.PNG_1BIT)
+
+    # アサーション
+    assert np.asarray(decode_mask(encoded)).tolist() == [[0, 0, 255, 255]]
+
+
+def test_mask_encoder_records_metrics():
+    # テストデータの準備
+    encoder = MaskEncoder(max_workers=2, png_compress_level=1, webp_method=0)
+    metrics = get_metrics()
+    metrics.reset()
+
+    # テスト実行
+    encoder.encode([Image.new("L", (8, 8))] * 3, ImageCodec.WEBP_LOSSLESS)
+
+    # アサーション
+    observations = metrics.snapshot()["observations"]
+    assert observations["mask_encoder.webp_lossless.latency"]["count"] == 3  # noqa: PLR2004
+    assert observations["mask_encoder.webp_lossless.bytes"]["count"] == 3  # noqa: PLR2004
@@ -0,0 +1,89 @@
+import queue
+import threading
+import time
+
+import pytest
+
+from segmenter_api.utils.pipeline import Pipeline, PipelineStage
+
+
+def test_pipeline_overlaps_stages_across_requests():
+    # テストデータの準備
+    # item 0がstage bにいる間にitem 1がstage aに入らないとbarrierがtimeoutする
+    barrier = threading.Barrier(2, timeout=5)
+
+    def stage_a(value: int) -> int:
+        if value == 1:
+            barrier.wait()
+        return value + 10
+
+    def stage_b(value: int) -> int:
+        if value == 10:  # noqa: PLR2004
+            barrier.wait()
+        return value * 2
+
+    pipeline = Pipeline(
+        name="test",
+        stages=[PipelineStage("a", stage_a), PipelineStage("b", stage_b)],
+        queue_size=4,
+    )
+
+    # テスト実行
+    futures = [pipeline.submit(value) for value in range(3)]
+
+    # アサーション
+    assert [future.result(timeout=5) for future in futures] == [20, 22, 24]
+
+
+def test_pipeline_returns_stage_exception():
+    # テストデータの準備
+    calls: list[int] = []
+
+    def validate(value: int) -> int:
+        if value < 0:
+            error_msg = "negative"
+            raise ValueError(error_msg)
+        return value
+
+    pipeline = Pipeline(
+        name="test",
+        stages=[
+            PipelineStage("validate", validate),
+            PipelineStage("record", lambda value: calls.append(value) or value),
+        ],
+        queue_size=4,
+    )
+
+    # テスト実行
+    failed = pipeline.submit(-1)
+    succeeded = pipeline.submit(1)
+
+    # アサーション
+    # 失敗したitemは後の段に流れず、後続のitemは処理される
+    with pytest.raises(ValueError, match="negative"):
+        failed.result(timeout=5)
+    assert succeeded.result(timeout=5) == 1
+    assert calls == [1]
+
+
+def test_pipeline_rejects_when_first_queue_is_full():
+    # テストデータの準備
+    release = threading.Event()
+    pipeline = Pipeline(
+        name="test",
+        stages=[PipelineStage("wait", lambda value: release.wait(5) and value)],
+        queue_size=1,
+    )
+    first = pipeline.submit(0)
+    # workerが最初のitemを取り出すまで待つ
+    deadline = time.monotonic() + 5
+    while pipeline.stats()["wait"]["queued"] > 0 and time.monotonic() < deadline:
+        time.sleep(0.001)
+    second = pipeline.submit(1)
+
+    # テスト実行・アサーション
+    with pytest.raises(queue.Full):
+        pipeline.submit(2)
+    release.set()
+    assert first.result(timeout=5) == 0
+    assert second.result(timeout=5) == 1